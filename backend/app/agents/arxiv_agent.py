@@ -1,20 +1,97 @@
 import os
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from app.utils.backoff_utils import with_retry
-from langchain_groq.chat_models import ChatGroq
+from app.utils.admission import AdmissionRejected, ADMISSION_QUEUE_TIMEOUT, limiter
+from app.utils.deadlines import DeadlineExceeded, REDUCED_CONTEXT_SEC
+from app.utils.model_tiers import choose_tier, invoke_tiered
+from app.utils.session_indexes import DEFAULT_SESSION
+from app.utils import progress_events
 import arxiv
 
 logger = logging.getLogger(__name__)
 
 GROQ_KEY = os.getenv("GROQ_API_KEY")
 
-@with_retry(max_tries=3, exceptions=(Exception,), delay=2)
-def run_arxiv_query(query, max_results=8):
+# Deep mode: full text of the top papers is fetched in the background and
+# indexed into the session, so follow-up questions are answered by PDF_RAG
+ARXIV_DEEP_DEFAULT = os.getenv("ARXIV_DEEP_DEFAULT", "false").lower() in ("1", "true", "yes")
+ARXIV_DEEP_TOP_N = int(os.getenv("ARXIV_DEEP_TOP_N", 3))
+ARXIV_PREFETCH_WORKERS = int(os.getenv("ARXIV_PREFETCH_WORKERS", 2))
+
+_prefetch_pool = None
+_fetcher = None
+_prefetch_lock = threading.Lock()
+
+
+def _prefetch_resources():
+    global _prefetch_pool, _fetcher
+    with _prefetch_lock:
+        if _prefetch_pool is None:
+            from app.utils.pdf_fetcher import PdfFetcher
+            _fetcher = PdfFetcher()
+            _prefetch_pool = ThreadPoolExecutor(max_workers=ARXIV_PREFETCH_WORKERS, thread_name_prefix="arxiv-prefetch")
+        return _prefetch_pool, _fetcher
+
+
+def paper_doc_id(arxiv_id):
+    """Index doc_id for a paper's full text"""
+    return f"arxiv_{arxiv_id}"
+
+
+def _prefetch_one(paper, session_id):
+    """Download (or reuse) one paper's PDF and index it into the session"""
+    from app.agents import registry
+    doc_id = paper_doc_id(paper["arxiv_id"])
+    try:
+        pdf_rag = registry.load_agent("PDF_RAG")
+        if pdf_rag.has_document(doc_id, session_id):
+            progress_events.publish(doc_id, "completed", message="Already indexed", arxiv_id=paper["arxiv_id"])
+            return doc_id
+        progress_events.publish(doc_id, "processing", message="Downloading full text", arxiv_id=paper["arxiv_id"])
+        _, fetcher = _prefetch_resources()
+        path, cached = fetcher.fetch(paper["arxiv_id"], paper["pdf_url"])
+        result = pdf_rag.ingest_pdf_to_chroma(
+            path, doc_id, session_id=session_id, source="arxiv",
+            progress=lambda stage, **fields: progress_events.publish(doc_id, "embedding", stage=stage, **fields)
+        )
+        if result["status"] != "success":
+            raise RuntimeError(result["message"])
+        progress_events.publish(
+            doc_id, "completed", arxiv_id=paper["arxiv_id"], title=paper["title"],
+            chunks_count=result["chunks_count"], from_cache=cached
+        )
+        logger.info(f"📚 Indexed full text of {paper['arxiv_id']} ({result['chunks_count']} chunks)")
+    except Exception as e:
+        logger.error(f"❌ Full-text prefetch failed for {paper['arxiv_id']}: {e}")
+        progress_events.publish(doc_id, "failed", message=str(e), arxiv_id=paper["arxiv_id"])
+    return doc_id
+
+
+def prefetch_full_text(papers, session_id=DEFAULT_SESSION, top_n=ARXIV_DEEP_TOP_N):
+    """Queue background full-text indexing for the top papers; returns their doc_ids"""
+    pool, _ = _prefetch_resources()
+    queued = []
+    for paper in papers[:top_n]:
+        if not paper.get("pdf_url"):
+            continue
+        pool.submit(_prefetch_one, paper, session_id)
+        queued.append(paper_doc_id(paper["arxiv_id"]))
+    logger.info(f"📥 Queued full-text prefetch for {len(queued)} papers (session {session_id})")
+    return queued
+
+@with_retry(max_tries=3, exceptions=(Exception,), delay=2, giveup=(AdmissionRejected, DeadlineExceeded))
+def run_arxiv_query(query, max_results=8, tier=None, deep=None, session_id=DEFAULT_SESSION, deadline=None):
     """
     Search arXiv for recent papers on the given topic with enhanced relevance filtering.
     Flow: controller.py → arxiv_agent.py → arXiv API → ChatGroq LLM → user
+    deep: also index the top papers' full text into the session in the
+    background (default ARXIV_DEEP_DEFAULT).
+    deadline: the request's Deadline; sizes arXiv retries and analyses fewer
+    papers when short.
     """
     try:
         logger.info(f"🔍 ArXiv search query: '{query}'")
@@ -46,7 +123,15 @@ def run_arxiv_query(query, max_results=8):
         )
         
         logger.info("📡 Searching ArXiv...")
-        results = list(search.results())
+        client, admit_timeout = arxiv.Client(), None
+        if deadline is not None:
+            deadline.check("arXiv search")
+            # The arxiv client has no request timeout; bound its retries instead
+            attempts, _ = deadline.attempts(4, deadline.remaining() / 2)
+            client = arxiv.Client(num_retries=attempts - 1)
+            admit_timeout = deadline.timeout(ADMISSION_QUEUE_TIMEOUT, share=0.25)
+        with limiter("arxiv").admit(timeout=admit_timeout):
+            results = list(client.results(search))
         
         if not results:
             logger.warning("⚠️ No papers found")
@@ -63,7 +148,10 @@ def run_arxiv_query(query, max_results=8):
             results = [r for r in results if r.published.replace(tzinfo=None) > cutoff_date]
             logger.info(f"📅 Filtered to {len(results)} papers from last 18 months")
         
-        # Select top papers
+        # Select top papers (a shorter prompt when time is short)
+        if deadline is not None and deadline.short(REDUCED_CONTEXT_SEC) and max_results > 4:
+            max_results = 4
+            deadline.degrade("ARXIV", f"analysing top {max_results} papers")
         top_papers = results[:max_results]
         
         papers = []
@@ -91,16 +179,6 @@ def run_arxiv_query(query, max_results=8):
         if not GROQ_KEY:
             raise RuntimeError("GROQ_API_KEY is required; set in environment")
         
-        # Use ChatGroq for comprehensive analysis
-        llm = ChatGroq(
-            api_key=GROQ_KEY,
-            model="llama-3.3-70b-versatile",
-            temperature=0.3,  # Slightly higher for more natural analysis
-            max_tokens=3000,  # Increased for detailed analysis
-            timeout=60.0,
-            max_retries=2
-        )
-        
         # Create structured context for LLM
         papers_text = "\n\n".join([
             f"[Paper {i+1}]\n"
@@ -159,13 +237,26 @@ def run_arxiv_query(query, max_results=8):
 
             Provide your detailed analysis:"""
         
-        logger.info("🤖 Generating comprehensive analysis...")
+        # Landscape analysis: large model unless the request overrides it
+        model = choose_tier("ARXIV", query, override=tier, deadline=deadline)
+        logger.info(f"🤖 Generating comprehensive analysis with {model['model']}...")
         start_time = time.time()
-        response = llm.invoke(prompt)
+        response = invoke_tiered(model, prompt, temperature=0.3, deadline=deadline)  # Slightly higher for more natural analysis
         summary = response.content if hasattr(response, "content") else str(response)
         duration = time.time() - start_time
         logger.info(f"✅ Analysis completed in {duration:.2f}s")
         
+        # Deep mode: full text goes into the session index while the user reads
+        if ARXIV_DEEP_DEFAULT if deep is None else deep:
+            doc_ids = prefetch_full_text(papers, session_id)
+            trace_prefetch = {
+                "doc_ids": doc_ids,
+                "session_id": session_id,
+                "events": f"/upload/events?doc_ids={','.join(doc_ids)}"
+            }
+        else:
+            trace_prefetch = None
+        
         # Build comprehensive trace
         trace = {
             "papers": papers,
@@ -174,12 +265,16 @@ def run_arxiv_query(query, max_results=8):
             "search_query": search_query,
             "total_found": len(papers),
             "llm_duration": duration,
+            "model": model,
             "sort_order": "most_recent_first",
-            "date_range": f"Last 18 months" if "recent" in query.lower() else "All time"
+            "date_range": f"Last 18 months" if "recent" in query.lower() else "All time",
+            "full_text_prefetch": trace_prefetch
         }
         
         return summary, trace
         
+    except (AdmissionRejected, DeadlineExceeded):
+        raise
     except Exception as e:
         logger.error(f"❌ ArXiv search failed: {str(e)}")
         error_msg = f"ArXiv search failed: {str(e)}"
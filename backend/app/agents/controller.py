@@ -1,9 +1,13 @@
 import os
+import re
 import json
 import logging
-from langchain_groq import ChatGroq
 from app.utils.logging_utils import append_raw_log
-from app.agents.pdf_rag import _vectorstore
+from app.utils.model_tiers import choose_tier, invoke_tiered
+from app.utils.deadlines import DeadlineExceeded
+from app.utils.routing_rules import rule_engine
+from app.utils.session_indexes import session_has_index
+from app.agents import registry
 
 logger = logging.getLogger(__name__)
 
@@ -12,9 +16,45 @@ logger = logging.getLogger(__name__)
 
 GROQ_KEY = os.getenv("GROQ_API_KEY")
 
+# Queries per multi-question routing prompt in decide_many
+ROUTING_BATCH_SIZE = 50
+
+# LLM routing is skipped (WEB_SEARCH fallback) with less time than this left,
+# and may use at most this share of the remaining budget
+ROUTING_LLM_MIN_SEC = float(os.getenv("ROUTING_LLM_MIN_SEC", 10))
+ROUTING_BUDGET_SHARE = 0.25
+
+
+def match_rules(text, pdf_context):
+    """
+    Apply the routing rules (app/agents/routing_rules.json, see
+    app/utils/routing_rules.py); returns the matching Rule or None
+    """
+    return rule_engine().match(text, pdf_context=pdf_context)
+
+
+def session_has_pdf(session_id):
+    """
+    Whether the session has uploaded PDFs (only its own uploads count as PDF
+    context). Without the PDF agent imported (AGENT_PRELOAD=false, or
+    preload still running after a restart) a saved index on disk counts.
+    """
+    if registry.is_loaded("PDF_RAG"):
+        return registry.load_agent("PDF_RAG").has_documents(session_id)
+    return session_has_index(session_id)
+
+
+def parse_agent(resp_text):
+    """Map an LLM routing reply to an agent name (WEB_SEARCH if unclear)"""
+    if "PDF_RAG" in resp_text:
+        return "PDF_RAG"
+    if "ARXIV" in resp_text:
+        return "ARXIV"
+    return "WEB_SEARCH"  # Default fallback
+
 class Controller:
     def __init__(self):
-        """Initialize controller with ChatGroq LLM"""
+        """Initialize controller (routing LLM calls go to the fast tier)"""
         logger.info("🔧 Initializing Controller...")
         
         if not GROQ_KEY:
@@ -23,79 +63,29 @@ class Controller:
         
         logger.info(f"🔑 GROQ_API_KEY loaded: {GROQ_KEY[:20]}...")
         
-        self.llm = ChatGroq(
-            api_key=GROQ_KEY,
-            model="llama-3.3-70b-versatile",
-            temperature=0,
-            max_tokens=512,  # Reduced for faster responses
-            timeout=30.0,    # 30 second timeout for routing decisions
-            max_retries=2
-        )
+        # How the last decide() call was made (rule or LLM tier/latency), for the trace
+        self.routing = None
         
         # logger.info("✅ Controller initialized successfully")
 
-    def decide(self, text, pdf_doc_id=None, prefer_agent=None):
-        """Decide which agent to use based on the query"""
+    def decide(self, text, pdf_doc_id=None, prefer_agent=None, session_id="default", deadline=None):
+        """
+        Decide which agent to use based on the query.
+        deadline: the request's Deadline; LLM routing only runs if it leaves
+        enough time for the agent afterwards.
+        """
         logger.info(f"🎯 Controller.decide() called with text: '{text[:50]}...'")
-        logger.info(f"📄 pdf_doc_id: {pdf_doc_id}, prefer_agent: {prefer_agent}")
+        logger.info(f"📄 pdf_doc_id: {pdf_doc_id}, prefer_agent: {prefer_agent}, session_id: {session_id}")
         
-        t = text.lower().strip()
-
-        has_uploaded_pdf = _vectorstore is not None and _vectorstore.index.ntotal > 0
-
-        research_keywords = [
-            "arxiv",
-            "research paper",
-            "research papers",
-            "paper on",
-            "papers on",
-            "latest research",
-            "find papers",
-            "academic paper",
-            "peer reviewed"
-        ]
-        pdf_keywords = [
-            "pdf",
-            "document",
-            "uploaded file",
-            "uploaded pdf",
-            "this file",
-            "this document",
-            "in the document",
-            "from the document",
-            "summarize",
-            "summary"
-        ]
-        web_keywords = [
-            "news",
-            "latest",
-            "current",
-            "today",
-            "web",
-            "search",
-            "internet",
-            "out of context",
-            "who",
-            "what",
-            "when",
-            "where"
-        ]
-
-        # 1) Research-paper intent -> ARXIV
-        if any(word in t for word in research_keywords):
-            logger.info("✅ Rule matched: ARXIV")
-            return "ARXIV", "Rule: research-paper intent detected"
-
-        # 2) PDF-related intent -> PDF_RAG only if PDF context exists
-        pdf_intent = any(word in t for word in pdf_keywords)
-        if pdf_intent and (pdf_doc_id or has_uploaded_pdf):
-            logger.info("✅ Rule matched: PDF_RAG")
-            return "PDF_RAG", "Rule: PDF intent with uploaded PDF context"
-
-        # 3) General/out-of-context web intent -> WEB_SEARCH
-        if any(word in t for word in web_keywords):
-            logger.info("✅ Rule matched: WEB_SEARCH")
-            return "WEB_SEARCH", "Rule: general web or out-of-context intent"
+        has_uploaded_pdf = session_has_pdf(session_id)
+
+        # 1-3) Deterministic keyword rules
+        rule = match_rules(text, bool(pdf_doc_id or has_uploaded_pdf))
+        self.routing = {"method": "rule"}
+        if rule:
+            self.routing["rule"] = rule.name
+            logger.info(f"✅ Rule {rule.name} matched: {rule.agent}")
+            return rule.agent, rule.rationale
 
         # 4) Optional user override only when no deterministic rule matched
         if prefer_agent:
@@ -105,6 +95,12 @@ class Controller:
             return decision, reason
 
         # Fallback to LLM for nuanced decision
+        if deadline is not None:
+            deadline.check("routing")
+            if deadline.short(ROUTING_LLM_MIN_SEC):
+                deadline.degrade("routing", "skipped LLM routing, default agent")
+                self.routing = {"method": "deadline_fallback"}
+                return "WEB_SEARCH", "Deadline short, fallback to WEB_SEARCH without LLM routing"
         logger.info("🤖 No rule matched, falling back to LLM routing...")
         
         prompt = f"""You are an agent router. Choose ONE of: PDF_RAG, WEB_SEARCH, ARXIV.
@@ -113,9 +109,13 @@ User query: {text}
 
 Respond with ONLY the agent name (one word):"""
 
+        model = choose_tier("routing")
+        self.routing = {"method": "llm", "model": model}
         try:
-            logger.info("📡 Calling GROQ LLM...")
-            resp = self.llm.invoke(prompt)
+            logger.info(f"📡 Calling GROQ LLM ({model['model']})...")
+            # 30 second cap for routing decisions; a quarter of the budget at most
+            timeout = deadline.timeout(30.0, share=ROUTING_BUDGET_SHARE) if deadline is not None else 30.0
+            resp = invoke_tiered(model, prompt, timeout=timeout, deadline=deadline)
             logger.info(f"✅ LLM responded")
             
             # Extract content
@@ -127,14 +127,7 @@ Respond with ONLY the agent name (one word):"""
             logger.info(f"🎯 LLM decision: {resp_text}")
             
             # Simple extraction - just get the agent name
-            if "PDF_RAG" in resp_text:
-                decision = "PDF_RAG"
-            elif "ARXIV" in resp_text:
-                decision = "ARXIV"
-            elif "WEB_SEARCH" in resp_text:
-                decision = "WEB_SEARCH"
-            else:
-                decision = "WEB_SEARCH"  # Default fallback
+            decision = parse_agent(resp_text)
             
             reason = "LLM routing decision"
             
@@ -149,9 +142,67 @@ Respond with ONLY the agent name (one word):"""
             logger.info(f"✅ Final decision: {decision}")
             return decision, reason
             
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"❌ LLM call failed: {str(e)}")
             decision = "WEB_SEARCH"
             reason = f"LLM failed, fallback to WEB_SEARCH: {str(e)}"
             logger.info(f"⚠️ Fallback decision: {decision}")
             return decision, reason
+
+    def decide_many(self, items, session_id="default"):
+        """
+        Route a batch of queries at once.
+        items: dicts with text, pdf_doc_id, prefer_agent.
+        Rules run per item; every item left over goes to the LLM in a single
+        multi-question prompt. Returns [(decision, rationale)] in input order.
+        """
+        has_uploaded_pdf = session_has_pdf(session_id)
+
+        results = [None] * len(items)
+        pending = []
+        for i, item in enumerate(items):
+            rule = match_rules(item["text"], bool(item.get("pdf_doc_id") or has_uploaded_pdf))
+            if rule:
+                results[i] = (rule.agent, rule.rationale)
+            elif item.get("prefer_agent"):
+                results[i] = (item["prefer_agent"].upper(), f"User requested agent {item['prefer_agent']}")
+            else:
+                pending.append(i)
+        
+        logger.info(f"🎯 Batch routing: {len(items) - len(pending)} by rule, {len(pending)} via LLM")
+        if not pending:
+            return results
+        
+        # One routing prompt per slice of leftovers (keeps the reply within max_tokens)
+        for offset in range(0, len(pending), ROUTING_BATCH_SIZE):
+            self._route_with_llm(items, pending[offset:offset + ROUTING_BATCH_SIZE], results)
+        return results
+
+    def _route_with_llm(self, items, pending, results):
+        questions = "\n".join(f"{n + 1}. {items[i]['text']}" for n, i in enumerate(pending))
+        prompt = f"""You are an agent router. For EACH numbered user query choose ONE of: PDF_RAG, WEB_SEARCH, ARXIV.
+
+User queries:
+{questions}
+
+Respond with one line per query in the form "<number>: <AGENT>" and nothing else:"""
+        
+        try:
+            resp = invoke_tiered(choose_tier("routing_batch"), prompt, timeout=30.0)
+            resp_text = resp.content if hasattr(resp, "content") else str(resp)
+            answers = {}
+            for line in resp_text.upper().splitlines():
+                m = re.match(r"\s*(\d+)\s*[:.)-]\s*(.+)", line)
+                if m:
+                    answers[int(m.group(1))] = parse_agent(m.group(2))
+            for n, i in enumerate(pending):
+                if n + 1 in answers:
+                    results[i] = (answers[n + 1], "LLM routing decision (batch)")
+                else:
+                    results[i] = ("WEB_SEARCH", "LLM batch reply missing this query, fallback to WEB_SEARCH")
+        except Exception as e:
+            logger.error(f"❌ Batch LLM routing failed: {str(e)}")
+            for i in pending:
+                results[i] = ("WEB_SEARCH", f"LLM failed, fallback to WEB_SEARCH: {str(e)}")
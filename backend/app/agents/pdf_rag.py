@@ -1,10 +1,14 @@
-from langchain.chains import RetrievalQA
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from langchain_groq.chat_models import ChatGroq
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from functools import lru_cache
+from app.utils.keyword_index import reciprocal_rank_fusion
+from app.utils.session_indexes import SessionIndexManager, DEFAULT_SESSION, SESSIONS_DIR
+from app.utils.context_packing import pack_context, estimate_tokens
+from app.utils.bulk_ingest import run_pipeline, throughput, BULK_EXTRACT_WORKERS, BULK_EMBED_BATCH
+from app.utils.admission import AdmissionRejected
+from app.utils.deadlines import DeadlineExceeded, REDUCED_CONTEXT_SEC
+from app.utils.embedding_server import load_local_embeddings, EMBEDDING_CLIENT_TIMEOUT
+from app.utils.model_tiers import choose_tier, invoke_tiered
 import logging
 import time
 import fitz
@@ -14,22 +18,59 @@ logger = logging.getLogger(__name__)
 
 GROQ_KEY = os.getenv("GROQ_API_KEY")
 
-# Global in-memory FAISS vector store
-_vectorstore = None
+# One index per session (FAISS vectors + BM25 keywords + columnar chunk store),
+# hot sessions resident within SESSION_INDEX_MEMORY_MB, cold ones reloaded from disk
+SESSION_INDEX_MEMORY_MB = int(os.getenv("SESSION_INDEX_MEMORY_MB", 256))
+
+_sessions = SessionIndexManager(
+    SESSIONS_DIR,
+    memory_budget_bytes=SESSION_INDEX_MEMORY_MB * 1024 * 1024
+)
+
+# Hybrid retrieval: candidates per side, fused chunks handed to context packing
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", 20))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", 10))
+
+# Context packing: token budget for retrieved passages in the prompt
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", 1500))
+RAG_MAX_PASSAGES = int(os.getenv("RAG_MAX_PASSAGES", 6))
+
+RAG_PROMPT = """Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+
+Question: {question}
+Helpful Answer:"""
+
+# Chunks embedded per progress update during single-PDF ingestion
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", 64))
+
+# Embedding backend: "torch" (sentence-transformers), "onnx" (int8 quantized)
+# or "server" (shared embedding server process, see app/utils/embedding_server.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+ONNX_INTRA_OP_THREADS = os.getenv("ONNX_INTRA_OP_THREADS")
 
 # embedding
 @lru_cache(maxsize=1)
 def get_embeddings():
-    """Get HuggingFace embeddings (compatible with FAISS)"""
-    logger.info("🔄 Loading embedding model...")
-    embeddings = HuggingFaceEmbeddings(
-        # model_name='all-MiniLM-L6-v2',
-        model_name='paraphrase-MiniLM-L3-v2',
-        model_kwargs={'device': 'cpu'}
-    )
+    """Get embeddings for the configured backend (compatible with FAISS)"""
+    logger.info(f"🔄 Loading embedding model ({EMBEDDING_BACKEND} backend)...")
+    if EMBEDDING_BACKEND == "server":
+        from app.utils.embedding_server import EmbeddingServerClient
+        embeddings = EmbeddingServerClient()
+    else:
+        embeddings = load_local_embeddings(EMBEDDING_BACKEND, intra_op_threads=ONNX_INTRA_OP_THREADS)
     logger.info("✅ Embedding model loaded")
     return embeddings
 
+def warm_up_embeddings():
+    """Load the embedding model and run one query through it"""
+    start = time.time()
+    get_embeddings().embed_query("warm up")
+    duration = time.time() - start
+    logger.info(f"🔥 Embedding model warmed up in {duration:.2f}s")
+    return duration
+
 # pdf parse
 def extract_text_from_pdf(pdf_path):
     """Extract all text from PDF"""
@@ -40,76 +81,80 @@ def extract_text_from_pdf(pdf_path):
     doc.close()
     return text
 
-def chunk_text(text, doc_id):
-    """Split text into chunks with metadata"""
+def chunk_text(text):
+    """Split text into chunks (metadata lives in the chunk store columns)"""
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=500,
         chunk_overlap=50,
         length_function=len
     )
-    
-    chunks = splitter.split_text(text)
-    
-    documents = []
-    for i, chunk in enumerate(chunks):
-        doc = Document(
-            page_content=chunk,
-            metadata={
-                "doc_id": doc_id,
-                "chunk_id": i,
-                "source": "pdf_upload"
-            }
-        )
-        documents.append(doc)
-    
-    return documents
+    return splitter.split_text(text)
+
+def has_documents(session_id=DEFAULT_SESSION):
+    """True once the session has at least one chunk indexed"""
+    return _sessions.has_documents(session_id)
+
+def has_document(doc_id, session_id=DEFAULT_SESSION):
+    """True if doc_id is already indexed in the session"""
+    with _sessions.use(session_id) as index:
+        return index is not None and index.has_doc(doc_id)
+
+def index_stats():
+    return _sessions.stats()
+
+def materialize(index, row):
+    """Build a LangChain Document for one chunk (only done for hits)"""
+    return Document(page_content=index.text(row), metadata=index.metadata(row))
 
 # FAISS INGESTION
-def ingest_pdf_to_chroma(pdf_path, doc_id):
+def ingest_pdf_to_chroma(pdf_path, doc_id, session_id=DEFAULT_SESSION, progress=None, source="pdf_upload"):
     """
-    Ingest PDF using FAISS vector store
+    Ingest PDF into the session's FAISS + BM25 index.
+    progress(stage, **fields) is called after each stage and embedding batch.
+    source tags the chunks ("pdf_upload", "arxiv", ...).
     """
-    global _vectorstore
-    
+    progress = progress or (lambda stage, **fields: None)
     try:
         logger.info("="*60)
-        logger.info(f"📄 Starting ingestion: {doc_id}")
+        logger.info(f"📄 Starting ingestion: {doc_id} (session {session_id})")
         
         # Extract
         text = extract_text_from_pdf(pdf_path)
         if not text.strip():
             return {"status": "error", "message": "No text found in PDF"}
         logger.info(f"✅ Extracted {len(text)} characters")
+        progress("extracted", characters=len(text))
         
         # Chunk
-        documents = chunk_text(text, doc_id)
-        logger.info(f"✅ Created {len(documents)} chunks")
+        chunks = chunk_text(text)
+        logger.info(f"✅ Created {len(chunks)} chunks")
+        progress("chunked", chunks_total=len(chunks))
         
-        # Get embeddings
+        # Get embeddings (in batches so progress can be reported)
         embeddings = get_embeddings()
+        vectors = []
+        for i in range(0, len(chunks), INGEST_EMBED_BATCH):
+            vectors.extend(embeddings.embed_documents(chunks[i:i + INGEST_EMBED_BATCH]))
+            progress("embedding", chunks_done=len(vectors), chunks_total=len(chunks))
         logger.info("✅ Embeddings ready")
         
-        # Add to FAISS
+        # Add to FAISS (keyword side is incremental: only new chunks are tokenized)
         logger.info("📥 Adding to FAISS vectorstore...")
-        
-        if _vectorstore is None:
-            logger.info("Creating new FAISS index...")
-            _vectorstore = FAISS.from_documents(documents, embeddings)
-            logger.info("✅ FAISS index created")
-        else:
-            logger.info("Adding to existing FAISS index...")
-            _vectorstore.add_documents(documents)
-            logger.info("✅ Documents added")
+        progress("indexing", chunks_total=len(chunks))
+        with _sessions.use(session_id, create=True) as index:
+            index.add_document(doc_id, chunks, vectors, source=source)
+            index.save()
+            total = index.ntotal
         
         logger.info("="*60)
         logger.info(f"✅ INGESTION COMPLETE")
-        logger.info(f"📊 Total documents in FAISS: {_vectorstore.index.ntotal}")
+        logger.info(f"📊 Total documents in FAISS: {total}")
         logger.info("="*60)
         
         return {
             "status": "success",
-            "message": f"Successfully ingested {len(documents)} chunks",
-            "chunks_count": len(documents)
+            "message": f"Successfully ingested {len(chunks)} chunks",
+            "chunks_count": len(chunks)
         }
         
     except Exception as e:
@@ -120,83 +165,232 @@ def ingest_pdf_to_chroma(pdf_path, doc_id):
         logger.error("="*60)
         return {"status": "error", "message": str(e)}
 
+def ingest_pdfs_bulk(pdf_paths, session_id=DEFAULT_SESSION, doc_ids=None,
+                     workers=BULK_EXTRACT_WORKERS, batch_size=BULK_EMBED_BATCH):
+    """
+    Ingest many PDFs: extraction, chunking and embedding overlap across files,
+    then everything goes into the session's index in one batched insert and
+    one save. doc_ids defaults to one "bulk_<ts>_<n>" id per path.
+    """
+    start = time.time()
+    if doc_ids is None:
+        ts = int(start)
+        doc_ids = [f"bulk_{ts}_{n}" for n in range(len(pdf_paths))]
+    path_to_doc = dict(zip(pdf_paths, doc_ids))
+
+    logger.info("="*60)
+    logger.info(f"📚 Bulk ingestion: {len(pdf_paths)} PDFs (session {session_id})")
+
+    try:
+        embeddings = get_embeddings()
+        docs, failures, stats = run_pipeline(
+            pdf_paths,
+            extract=extract_text_from_pdf,
+            chunk=chunk_text,
+            embed=embeddings.embed_documents,
+            workers=workers,
+            batch_size=batch_size
+        )
+
+        index_start = time.time()
+        with _sessions.use(session_id, create=True) as index:
+            index.add_documents([(path_to_doc[path], texts, vectors) for path, texts, vectors in docs])
+            index.save()
+            total = index.ntotal
+        stats["index_sec"] = round(time.time() - index_start, 2)
+        throughput(stats, time.time() - start)
+    except Exception as e:
+        import traceback
+        logger.error(f"❌ BULK INGESTION FAILED: {str(e)}")
+        logger.error(traceback.format_exc())
+        return {"status": "error", "message": str(e)}
+
+    logger.info(f"✅ BULK INGESTION COMPLETE: {stats['docs_ingested']} docs, {stats['chunks']} chunks "
+                f"in {stats['total_sec']}s ({stats['docs_per_sec']} docs/s, {stats['chunks_per_sec']} chunks/s)")
+    logger.info(f"📊 Total documents in FAISS: {total}")
+    logger.info("="*60)
+
+    return {
+        "status": "success",
+        "session_id": session_id,
+        "documents": [
+            {"doc_id": path_to_doc[path], "filename": os.path.basename(path), "chunks_count": len(texts)}
+            for path, texts, _ in docs
+        ],
+        "failed": [
+            {"doc_id": path_to_doc[path], "filename": os.path.basename(path), "message": message}
+            for path, message in failures
+        ],
+        "stats": stats
+    }
+
+def delete_document(doc_id, session_id=DEFAULT_SESSION):
+    """Remove a document's chunks from the session's index; returns chunks removed"""
+    with _sessions.use(session_id) as index:
+        if index is None:
+            return 0
+        removed = index.delete_document(doc_id)
+        if removed:
+            index.save()
+            logger.info(f"🗑️ Removed {removed} chunks of {doc_id} from the index")
+        return removed
+
+def hybrid_search(index, query, query_vector, doc_id=None, k=RAG_TOP_K, candidates=RAG_CANDIDATES):
+    """
+    BM25 + vector retrieval fused with reciprocal rank fusion.
+    Returns [(row, info)] where info holds the fused score and per-side ranks.
+    """
+    vector_ranking = [row for row, _ in index.search_vectors(query_vector, candidates, doc_id=doc_id)]
+    keyword_ranking = [row for row, _ in index.search_keywords(query, candidates, doc_id=doc_id)]
+    
+    vector_rank = {row: i + 1 for i, row in enumerate(vector_ranking)}
+    keyword_rank = {row: i + 1 for i, row in enumerate(keyword_ranking)}
+    
+    return [
+        (row, {
+            "score": round(score, 5),
+            "vector_rank": vector_rank.get(row),
+            "bm25_rank": keyword_rank.get(row),
+        })
+        for row, score in reciprocal_rank_fusion(vector_ranking, keyword_ranking)[:k]
+    ]
+
 
 # RAG QUERY
-def run_pdf_rag_query(query, doc_id=None):
+def embed_queries(queries):
+    """Embed many queries in one batch (used by /ask/batch)"""
+    return get_embeddings().embed_documents(list(queries))
+
+def retrieve_context(index, query, doc_id=None, query_vector=None, k=RAG_TOP_K, token_budget=RAG_CONTEXT_TOKENS,
+                     deadline=None):
     """
-    Query the FAISS vector database with RAG
+    Hybrid retrieval + context packing against one index.
+    Returns (context, retrieval_trace); context is None when nothing is indexed.
+    deadline bounds the wait for the embedding server (server backend).
     """
-    global _vectorstore
+    # Every read below sees the same version, even while an upload publishes a new one
+    index = index.snapshot() if index is not None else None
+    if index is None or index.ntotal == 0:
+        return None, {"error": "No documents in vectorstore"}
+    
+    logger.info(f"📚 FAISS index contains {index.ntotal} documents")
+    if doc_id:
+        logger.info(f"🔍 Filtering by doc_id: {doc_id}")
+    
+    # Retrieve: fused ranking lets exact terms (sections, acronyms, numbers)
+    # surface without raising k
+    embeddings = get_embeddings()
+    retrieval_start = time.time()
+    if query_vector is None:
+        if deadline is not None and EMBEDDING_BACKEND == "server":
+            query_vector = embeddings.embed_query(query, timeout=deadline.timeout(EMBEDDING_CLIENT_TIMEOUT))
+        else:
+            query_vector = embeddings.embed_query(query)
+    hits = hybrid_search(index, query, query_vector, doc_id=doc_id, k=k)
+    
+    # Only the hits are materialized as Documents
+    docs = [materialize(index, row) for row, _ in hits]
+    retrieval_duration = time.time() - retrieval_start
+    logger.info(f"✅ Retrieved {len(hits)} chunks in {retrieval_duration * 1000:.1f}ms")
     
+    # Assemble context: merge adjacent chunks, drop overlaps/near-duplicates,
+    # pack into the token budget
+    packing_start = time.time()
+    candidate_vectors = index.get_vectors([row for row, _ in hits])
+    passages, packing_decisions = pack_context(
+        query_vector,
+        [
+            {
+                "doc_id": d.metadata.get("doc_id"),
+                "chunk_id": d.metadata.get("chunk_id"),
+                "text": d.page_content,
+                "score": info["score"],
+                "vector": vector,
+            }
+            for d, (_, info), vector in zip(docs, hits, candidate_vectors)
+        ],
+        token_budget=token_budget,
+        max_passages=RAG_MAX_PASSAGES,
+    )
+    packing_duration = time.time() - packing_start
+    context = "\n\n".join(p["text"] for p in passages)
+    logger.info(f"📦 Packed {len(passages)} passages (~{estimate_tokens(context)} tokens)")
+    
+    trace = {
+        "chunks_retrieved": len(hits),
+        "retrieval": "hybrid_bm25_vector_rrf",
+        "retrieval_ms": round(retrieval_duration * 1000, 1),
+        "total_docs_in_index": index.ntotal,
+        "filter_applied": {"doc_id": doc_id} if doc_id else None,
+        "context": {
+            "token_budget": token_budget,
+            "passages": len(passages),
+            "context_tokens_est": estimate_tokens(context),
+            "packing_ms": round(packing_duration * 1000, 1),
+            "decisions": packing_decisions,
+        },
+        "sources": [
+            {
+                "doc_id": d.metadata.get("doc_id"),
+                "chunk_id": d.metadata.get("chunk_id"),
+                **info,
+                "preview": d.page_content[:100] + "..."
+            }
+            for d, (_, info) in zip(docs, hits)
+        ]
+    }
+    return context, trace
+
+def run_pdf_rag_query(query, doc_id=None, session_id=DEFAULT_SESSION, query_vector=None, tier=None, deadline=None):
+    """
+    Query the session's FAISS index with RAG (hybrid BM25 + vector retrieval).
+    query_vector can be passed in when queries were embedded as a batch.
+    tier: optional "fast"/"strong" override of the answering model.
+    deadline: the request's Deadline; when short, fewer chunks go into a
+    smaller prompt.
+    """
     try:
         logger.info("="*60)
-        logger.info(f"🔍 RAG Query: '{query}'")
+        logger.info(f"🔍 RAG Query: '{query}' (session {session_id})")
         
-        if _vectorstore is None:
-            logger.warning("⚠️ No documents uploaded yet")
-            return "No documents have been uploaded yet. Please upload a PDF first.", {
-                "error": "No documents in vectorstore"
-            }
+        k, token_budget = RAG_TOP_K, RAG_CONTEXT_TOKENS
+        if deadline is not None:
+            deadline.check("retrieval")
+            if deadline.short(REDUCED_CONTEXT_SEC):
+                k, token_budget = max(1, RAG_TOP_K // 2), RAG_CONTEXT_TOKENS // 2
+                deadline.degrade("PDF_RAG", f"top {k} chunks, {token_budget} token context")
         
-        logger.info(f"📚 FAISS index contains {_vectorstore.index.ntotal} documents")
+        # The index is pinned (kept resident) only while retrieving
+        with _sessions.use(session_id) as index:
+            context, trace = retrieve_context(
+                index, query, doc_id=doc_id, query_vector=query_vector, k=k, token_budget=token_budget,
+                deadline=deadline
+            )
         
-        # Setup retriever
-        if doc_id:
-            logger.info(f"🔍 Filtering by doc_id: {doc_id}")
-            retriever = _vectorstore.as_retriever(search_kwargs={"k": 20})
-        else:
-            retriever = _vectorstore.as_retriever(search_kwargs={"k": 5})
-        
-        # Setup LLM
-        llm = ChatGroq(
-            api_key=GROQ_KEY,
-            model="llama-3.3-70b-versatile",
-            temperature=0,
-            max_tokens=2048,
-            timeout=60.0,
-            max_retries=2
-        )
+        if context is None:
+            logger.warning("⚠️ No documents uploaded yet")
+            return "No documents have been uploaded yet. Please upload a PDF first.", trace
         
-        # Create RAG chain
-        logger.info("🔗 Building RAG chain...")
-        chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            retriever=retriever,
-            return_source_documents=True
-        )
+        prompt = RAG_PROMPT.format(context=context, question=query)
         
-        # Execute query
-        logger.info("🤖 Executing query...")
+        # Execute query on the tier matching the question's complexity
+        model = choose_tier("PDF_RAG", query, override=tier, deadline=deadline)
+        logger.info(f"🤖 Executing query with {model['model']}...")
         start = time.time()
-        response = chain.invoke({"query": query})
+        response = invoke_tiered(model, prompt, deadline=deadline)
         duration = time.time() - start
         
-        answer = response["result"]
-        sources = response.get("source_documents", [])
-        
-        # Filter by doc_id if specified
-        if doc_id:
-            sources = [s for s in sources if s.metadata.get("doc_id") == doc_id]
-            sources = sources[:5]
-            logger.info(f"✅ Filtered to {len(sources)} documents")
-        
-        logger.info(f"✅ Retrieved {len(sources)} source documents")
-        
-        # Build trace
-        trace = {
-            "chunks_retrieved": len(sources),
-            "duration_sec": round(duration, 2),
-            "total_docs_in_index": _vectorstore.index.ntotal,
-            "filter_applied": {"doc_id": doc_id} if doc_id else None,
-            "sources": [
-                {
-                    "doc_id": s.metadata.get("doc_id"),
-                    "chunk_id": s.metadata.get("chunk_id"),
-                    "preview": s.page_content[:100] + "..."
-                }
-                for s in sources
-            ]
-        }
+        answer = response.content if hasattr(response, "content") else str(response)
+        usage = (getattr(response, "response_metadata", None) or {}).get("token_usage", {})
+        
+        trace["duration_sec"] = round(duration, 2)
+        trace["session_id"] = session_id
+        trace["model"] = model
+        trace["context"].update({
+            "input_tokens_est": estimate_tokens(prompt),
+            "input_tokens": usage.get("prompt_tokens"),
+            "output_tokens": usage.get("completion_tokens"),
+        })
         
         logger.info("="*60)
         logger.info(f"✅ QUERY COMPLETE in {duration:.2f}s")
@@ -204,6 +398,8 @@ def run_pdf_rag_query(query, doc_id=None):
         
         return answer, trace
         
+    except (AdmissionRejected, DeadlineExceeded):
+        raise
     except Exception as e:
         import traceback
         logger.error("="*60)
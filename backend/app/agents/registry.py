@@ -0,0 +1,106 @@
+import sys
+import time
+import logging
+import importlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Agent name -> where it lives and which heavy packages it pulls in.
+# Nothing here is imported until the agent is first used (or preloaded).
+AGENTS = {}
+
+_loaded = {}
+_lock = threading.RLock()
+
+# module name -> seconds spent importing it (incremental: shared deps are
+# charged to whichever module imported them first)
+import_timings = {}
+
+
+def register_agent(name, module, entrypoint, dependencies=()):
+    """Register an agent so it can be imported lazily by name"""
+    AGENTS[name] = {
+        "module": module,
+        "entrypoint": entrypoint,
+        "dependencies": list(dependencies),
+    }
+
+
+register_agent(
+    "PDF_RAG", "app.agents.pdf_rag", "run_pdf_rag_query",
+    dependencies=["langchain.text_splitter", "langchain_groq", "faiss",
+                  "langchain_community.embeddings", "fitz"],
+)
+register_agent(
+    "WEB_SEARCH", "app.agents.web_search", "run_web_search",
+    dependencies=["langchain_groq", "serpapi"],
+)
+register_agent(
+    "ARXIV", "app.agents.arxiv_agent", "run_arxiv_query",
+    dependencies=["langchain_groq", "arxiv"],
+)
+
+
+def _timed_import(module_name):
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    import_timings[module_name] = round(time.perf_counter() - start, 3)
+    logger.info(f"📦 Imported {module_name} in {import_timings[module_name]:.2f}s")
+    return module
+
+
+def load_agent(name):
+    """Import an agent module (and its dependencies) on first use"""
+    if name in _loaded:
+        return _loaded[name]
+    if name not in AGENTS:
+        return None
+
+    with _lock:
+        if name in _loaded:
+            return _loaded[name]
+        spec = AGENTS[name]
+        start = time.perf_counter()
+        for dep in spec["dependencies"]:
+            _timed_import(dep)
+        module = _timed_import(spec["module"])
+        _loaded[name] = module
+        logger.info(f"✅ Agent {name} ready in {time.perf_counter() - start:.2f}s")
+        return module
+
+
+def get_agent(name):
+    """Return the agent's entrypoint function, or None for unknown agents"""
+    module = load_agent(name)
+    if module is None:
+        return None
+    return getattr(module, AGENTS[name]["entrypoint"])
+
+
+def is_loaded(name):
+    return name in _loaded
+
+
+def agent_status():
+    return {name: ("loaded" if name in _loaded else "not_loaded") for name in AGENTS}
+
+
+def preload_agents(names=None):
+    """Import agents in a background thread so startup isn't blocked"""
+    def _run():
+        start = time.perf_counter()
+        for name in names or list(AGENTS):
+            try:
+                load_agent(name)
+            except Exception as e:
+                logger.error(f"❌ Failed to preload agent {name}: {str(e)}")
+        logger.info(f"📊 Agent preload finished in {time.perf_counter() - start:.2f}s")
+        for module_name, seconds in sorted(import_timings.items(), key=lambda kv: -kv[1]):
+            logger.info(f"   {module_name:<40} {seconds:.3f}s")
+
+    thread = threading.Thread(target=_run, name="agent-preload", daemon=True)
+    thread.start()
+    return thread
@@ -1,16 +1,85 @@
 import os
+import time
 import logging
-from langchain_groq import ChatGroq
+import numpy as np
 from serpapi import GoogleSearch
+from app.utils.admission import AdmissionRejected, ADMISSION_QUEUE_TIMEOUT, limiter
+from app.utils.deadlines import DeadlineExceeded, REDUCED_CONTEXT_SEC
+from app.utils.model_tiers import choose_tier, invoke_tiered
+from app.utils.context_packing import pack_context, estimate_tokens
+from app.utils.page_fetcher import fetch_pages
 
 logger = logging.getLogger(__name__)
 
 GROQ_KEY = os.getenv("GROQ_API_KEY")
 SERPAPI_KEY = os.getenv("SERPAPI_API_KEY")
+SERPAPI_TIMEOUT = 30.0
 
-def run_web_search(query):
+# Enrichment: fetch the top result pages and add the passages most relevant
+# to the query; pages that miss the deadline are left to their snippets
+WEB_ENRICH = os.getenv("WEB_ENRICH", "true").lower() in ("1", "true", "yes")
+WEB_ENRICH_TOP_URLS = int(os.getenv("WEB_ENRICH_TOP_URLS", 5))
+WEB_ENRICH_DEADLINE_MS = float(os.getenv("WEB_ENRICH_DEADLINE_MS", 1500))
+WEB_ENRICH_CONTEXT_TOKENS = int(os.getenv("WEB_ENRICH_CONTEXT_TOKENS", 1200))
+WEB_ENRICH_MAX_PASSAGES = int(os.getenv("WEB_ENRICH_MAX_PASSAGES", 6))
+# Chunks per page considered for ranking (bounds embedding time)
+WEB_ENRICH_CHUNKS_PER_PAGE = 40
+WEB_ENRICH_CANDIDATES = 12
+
+
+def enrich_results(query, organic_results, fetch_deadline_sec=WEB_ENRICH_DEADLINE_MS / 1000):
+    """
+    Fetch the top result pages under the deadline and pack the passages most
+    similar to the query. Returns (excerpts, trace); excerpts is "" when no
+    page arrived in time.
+    """
+    from app.agents import registry
+    urls = [r["link"] for r in organic_results[:WEB_ENRICH_TOP_URLS] if r.get("link")]
+    pages, stats = fetch_pages(urls, fetch_deadline_sec)
+    trace = {"deadline_ms": round(fetch_deadline_sec * 1000), **stats, "pages_used": len(pages)}
+    if not pages:
+        return "", trace
+
+    pdf_rag = registry.load_agent("PDF_RAG")
+    position = {url: i + 1 for i, url in enumerate(urls)}
+    chunks = []
+    for url, text in pages.items():
+        for chunk_id, chunk in enumerate(pdf_rag.chunk_text(text)[:WEB_ENRICH_CHUNKS_PER_PAGE]):
+            chunks.append({"doc_id": position[url], "chunk_id": chunk_id, "text": chunk})
+
+    # Rank every chunk by cosine similarity to the query; only the best
+    # candidates go to packing (which merges neighbours and drops duplicates)
+    ranking_start = time.time()
+    embeddings = pdf_rag.get_embeddings()
+    query_vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+    vectors = np.asarray(embeddings.embed_documents([c["text"] for c in chunks]), dtype=np.float32)
+    scores = (vectors @ query_vector) / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector) + 1e-12)
+    candidates = []
+    for i in np.argsort(-scores)[:WEB_ENRICH_CANDIDATES]:
+        candidates.append({**chunks[i], "score": float(scores[i]), "vector": vectors[i]})
+    passages, _ = pack_context(
+        query_vector, candidates,
+        token_budget=WEB_ENRICH_CONTEXT_TOKENS,
+        max_passages=WEB_ENRICH_MAX_PASSAGES,
+    )
+    excerpts = "\n\n".join(f"[Source {p['doc_id']} excerpt]\n{p['text']}" for p in passages)
+    trace.update(
+        chunks_ranked=len(chunks),
+        passages=[
+            {"source": p["doc_id"], "chunk_ids": p["chunk_ids"], "score": round(p["score"], 4)}
+            for p in passages
+        ],
+        excerpt_tokens_est=estimate_tokens(excerpts),
+        ranking_ms=round((time.time() - ranking_start) * 1000, 1),
+    )
+    return excerpts, trace
+
+def run_web_search(query, tier=None, deadline=None):
     """
-    Run web search using SerpAPI (Google) and generate comprehensive answer with LLM
+    Run web search using SerpAPI (Google) and generate comprehensive answer with LLM.
+    tier: optional "fast"/"strong" override; otherwise picked from query complexity.
+    deadline: the request's Deadline; sizes the search timeout and skips page
+    enrichment when short.
     """
     try:
         logger.info(f"🔍 Web search query: '{query}'")
@@ -36,7 +105,13 @@ def run_web_search(query):
         }
         
         search = GoogleSearch(params)
-        results = search.get_dict()
+        admit_timeout = None
+        if deadline is not None:
+            deadline.check("web search")
+            search.timeout = deadline.timeout(SERPAPI_TIMEOUT, share=0.5)
+            admit_timeout = deadline.timeout(ADMISSION_QUEUE_TIMEOUT, share=0.25)
+        with limiter("serpapi").admit(timeout=admit_timeout):
+            results = search.get_dict()
         
         # Extract organic results
         organic_results = results.get("organic_results", [])
@@ -63,15 +138,24 @@ def run_web_search(query):
             for i, result in enumerate(organic_results[:5])
         ])
         
-        # Initialize Groq LLM
-        llm = ChatGroq(
-            api_key=GROQ_KEY,
-            model="llama-3.3-70b-versatile",
-            temperature=0.3,  # Slightly higher for more natural responses
-            max_tokens=2048,
-            timeout=60.0,
-            max_retries=2
-        )
+        excerpts, enrichment = "", None
+        enrich = WEB_ENRICH
+        if enrich and deadline is not None and deadline.short(REDUCED_CONTEXT_SEC):
+            deadline.degrade("WEB_SEARCH", "snippets only, no page enrichment")
+            enrich = False
+        if enrich:
+            try:
+                fetch_deadline = WEB_ENRICH_DEADLINE_MS / 1000
+                if deadline is not None:
+                    fetch_deadline = deadline.timeout(fetch_deadline, share=0.25)
+                excerpts, enrichment = enrich_results(query, organic_results, fetch_deadline)
+                logger.info(f"📰 Enriched with {enrichment['pages_used']} pages in {enrichment['fetch_ms']:.0f}ms")
+            except Exception as e:
+                # Enrichment is best effort: the snippets are still good for an answer
+                logger.warning(f"⚠️ Page enrichment failed: {e}")
+                enrichment = {"error": str(e)}
+        if excerpts:
+            formatted_results += f"\n\nMost relevant excerpts from the result pages:\n{excerpts}"
         
         # Create comprehensive prompt for LLM
         prompt = f"""You are a helpful AI assistant providing comprehensive, accurate answers based on current web search results.
@@ -93,8 +177,10 @@ def run_web_search(query):
 
             Provide your detailed answer:"""
                     
-        logger.info("🤖 Generating comprehensive answer with LLM...")
-        response = llm.invoke(prompt)
+        # Simple factual lookups go to the fast tier with a short budget
+        model = choose_tier("WEB_SEARCH", query, override=tier, deadline=deadline)
+        logger.info(f"🤖 Generating answer with {model['model']}...")
+        response = invoke_tiered(model, prompt, temperature=0.3, deadline=deadline)  # Slightly higher for more natural responses
         answer = response.content if hasattr(response, "content") else str(response)
         logger.info("✅ Answer generated successfully")
         
@@ -103,6 +189,8 @@ def run_web_search(query):
             "search_engine": "SerpAPI (Google)",
             "query": query,
             "results_count": len(organic_results),
+            "model": model,
+            "enrichment": enrichment,
             "sources": [
                 {
                     "position": i + 1,
@@ -117,6 +205,8 @@ def run_web_search(query):
         
         return answer, trace
         
+    except (AdmissionRejected, DeadlineExceeded):
+        raise
     except Exception as e:
         logger.error(f"❌ Web search failed: {str(e)}")
         error_msg = f"Web search failed: {str(e)}"
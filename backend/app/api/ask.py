@@ -1,12 +1,26 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from collections import defaultdict
+from typing import List
 import asyncio
+import logging
+import time
+import os
+import uuid
 from app.agents.controller import Controller
-from app.agents.pdf_rag import run_pdf_rag_query
-from app.agents.web_search import run_web_search
-from app.agents.arxiv_agent import run_arxiv_query
+from app.agents.registry import get_agent, load_agent
 from app.utils.logging_utils import record_decision
+from app.utils.security import validate_session_id
+from app.utils.singleflight import SingleFlight, normalize_text
+from app.utils.admission import AdmissionRejected
+from app.utils.model_tiers import validate_tier
+from app.utils.deadlines import Deadline, DeadlineExceeded
+from app.utils import profiling
+from app.utils.profiling import profile_request, span, wants_profile
+from app.utils.serialization import FastJSONResponse, dumps, shape_trace, validate_trace_level
 
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -15,62 +29,321 @@ class AskRequest(BaseModel):
     text: str
     pdf_doc_id: str = None   # optional: reference to uploaded PDF
     prefer_agent: str = None
+    session_id: str = None   # optional: scopes PDF search to this session's uploads
+    tier: str = None         # optional: "fast" | "strong" answering model ("auto"/None = by complexity)
+    trace: str = None        # optional: "none" | "summary" | "full" trace in the response
+    deep: bool = None        # optional: ARXIV also indexes the top papers' full text for follow-ups
 
-@router.post("/")
-async def ask(req: AskRequest):
+class BatchQuestion(BaseModel):
+    text: str
+    pdf_doc_id: str = None
+    prefer_agent: str = None
+    tier: str = None
+    deep: bool = None
+
+class BatchAskRequest(BaseModel):
+    questions: List[BatchQuestion]
+    session_id: str = None
+    trace: str = None
+
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 2000))
+
+# Max in-flight upstream calls per agent within one batch
+BATCH_CONCURRENCY = {
+    "PDF_RAG": int(os.getenv("BATCH_CONCURRENCY_PDF_RAG", 4)),
+    "WEB_SEARCH": int(os.getenv("BATCH_CONCURRENCY_WEB_SEARCH", 4)),
+    "ARXIV": int(os.getenv("BATCH_CONCURRENCY_ARXIV", 2)),
+}
+
+# Identical requests in flight at the same time share one execution
+_inflight = SingleFlight()
+
+# A request only joins an identical one in flight if that execution's
+# deadline ends at most this much earlier than its own
+COALESCE_DEADLINE_SLACK_SEC = float(os.getenv("COALESCE_DEADLINE_SLACK_SEC", 5))
+
+# How often a waiting /ask checks whether its client is still connected
+DISCONNECT_POLL_SEC = 0.5
+
+async def watch_disconnect(request: Request, deadline):
     """
-    Main endpoint to process user queries through the multi-agent system.
-    Uses async/await to prevent blocking and includes proper error handling.
+    Cancel the request's deadline once its client disconnects, so the stages
+    still to run are skipped. A shared execution running on this deadline
+    keeps going while other callers wait on it.
     """
-    try:
-        # Initialize controller
-        controller = Controller()
-        
-        # Run decision logic in thread pool to avoid blocking
-        decision, rationale = await asyncio.to_thread(
+    while not deadline.expired():
+        if await request.is_disconnected():
+            if _inflight.waiters_on(deadline) <= 1:
+                logger.info("🔌 Client disconnected, cancelling the rest of the request")
+                deadline.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SEC)
+
+async def run_query(req: AskRequest, session_id: str, tier=None, deadline=None):
+    """Route the query and run the chosen agent; returns (decision, rationale, answer, trace)"""
+    # Initialize controller
+    controller = Controller()
+    
+    # Run decision logic in thread pool to avoid blocking
+    start = time.time()
+    with span("route"):
+        decision, rationale = await profiling.to_thread(
             controller.decide,
             req.text,
             pdf_doc_id=req.pdf_doc_id,
-            prefer_agent=req.prefer_agent
+            prefer_agent=req.prefer_agent,
+            session_id=session_id,
+            deadline=deadline
         )
-        
-        # Route to appropriate agent based on decision
-        if decision == "PDF_RAG":
-            answer, trace = await asyncio.to_thread(
-                run_pdf_rag_query, 
-                req.text, 
-                doc_id=req.pdf_doc_id
-            )
-        elif decision == "WEB_SEARCH":
-            answer, trace = await asyncio.to_thread(
-                run_web_search, 
-                req.text
-            )
-        elif decision == "ARXIV":
-            answer, trace = await asyncio.to_thread(
-                run_arxiv_query, 
-                req.text
-            )
+    routing = dict(controller.routing or {}, latency_sec=round(time.time() - start, 2))
+    
+    with span(f"agent: {decision}"):
+        answer, trace = await run_agent(
+            decision, req.text, req.pdf_doc_id, session_id, tier=tier, deep=req.deep, deadline=deadline
+        )
+    if isinstance(trace, dict):
+        trace["routing"] = routing
+        if deadline is not None:
+            trace["deadline"] = deadline.summary()
+    return decision, rationale, answer, trace
+
+async def run_agent(decision, text, pdf_doc_id, session_id, query_vector=None, tier=None, deep=None, deadline=None):
+    """Run the chosen agent in the thread pool; returns (answer, trace)"""
+    # Agents (and their heavy dependencies) are imported on first use
+    agent = await profiling.to_thread(get_agent, decision)
+    
+    # Route to appropriate agent based on decision
+    if agent is None:
+        return "No agent chosen", {}
+    if decision == "PDF_RAG":
+        return await profiling.to_thread(
+            agent, 
+            text, 
+            doc_id=pdf_doc_id,
+            session_id=session_id,
+            query_vector=query_vector,
+            tier=tier,
+            deadline=deadline
+        )
+    if decision == "ARXIV":
+        return await profiling.to_thread(agent, text, tier=tier, deep=deep, session_id=session_id, deadline=deadline)
+    return await profiling.to_thread(agent, text, tier=tier, deadline=deadline)
+
+def record_failure(text, request_id, started, status, error):
+    """Log a request that ended in an error response, so /logs/stats counts it"""
+    record_decision(
+        None, None, text, {"error": error},
+        request_id=request_id, status=status, duration_ms=round((time.time() - started) * 1000)
+    )
+
+@router.post("/")
+async def ask(req: AskRequest, request: Request):
+    """
+    Main endpoint to process user queries through the multi-agent system.
+    Uses async/await to prevent blocking and includes proper error handling.
+    Concurrent duplicates (same normalized text, pdf_doc_id, prefer_agent,
+    session and tier) wait on the first execution and share its result.
+    Requests carrying PROFILE_TOKEN (X-Profile-Token header),
+    plus PROFILE_SAMPLE_PERCENT of traffic, run unshared under a sampling
+    profiler; fetch the result from /logs/profiles/{request_id}.
+    Every request runs against a deadline (X-Request-Timeout-Ms header, else
+    ASK_DEADLINE_MS): stages size their timeouts from it, take cheaper paths
+    when it runs short, and stop when it expires (504) or the client leaves.
+    """
+    started = time.time()
+    request_id = uuid.uuid4().hex
+    profile_reason = wants_profile(request.headers)
+    session_id = validate_session_id(req.session_id)
+    try:
+        tier = validate_tier(req.tier)
+        trace_level = validate_trace_level(req.trace)
+        deadline = Deadline.from_headers(request.headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    key = (
+        normalize_text(req.text),
+        req.pdf_doc_id,
+        (req.prefer_agent or "").upper(),
+        session_id,
+        tier,
+        req.deep
+    )
+    
+    watcher = asyncio.ensure_future(watch_disconnect(request, deadline))
+    try:
+        profiled = {}
+        if profile_reason:
+            # Not coalesced: a shared execution would profile someone else's request
+            with profile_request(request_id, profile_reason):
+                try:
+                    decision, rationale, answer, trace = await asyncio.wait_for(
+                        run_query(req, session_id, tier, deadline), deadline.remaining()
+                    )
+                finally:
+                    profiled["profile"] = f"/logs/profiles/{request_id}"
+            coalesced = False
         else:
-            answer = "No agent chosen"
-            trace = {}
+            # Each caller waits at most its own deadline. The shared execution
+            # runs on its starter's deadline, so only join one that hasn't been
+            # cancelled (client gone) and doesn't end much sooner than ours.
+            def joinable(running):
+                return (
+                    not running.cancelled
+                    and running.remaining() >= deadline.remaining() - COALESCE_DEADLINE_SLACK_SEC
+                )
+            (decision, rationale, answer, trace), coalesced = await _inflight.do(
+                key, lambda: run_query(req, session_id, tier, deadline), timeout=deadline.remaining(),
+                context=deadline, joinable=joinable
+            )
         
-        # Record decision & trace for logging/analytics
+        # Record decision & trace for logging/analytics (one entry per caller)
         log_entry = {
-            "timestamp": record_decision(decision, rationale, req.text, trace)
+            "timestamp": record_decision(
+                decision, rationale, req.text, trace,
+                coalesced=coalesced, request_id=request_id, status=200,
+                duration_ms=round((time.time() - started) * 1000), **profiled
+            )
         }
         
-        # Return structured response
-        return {
+        # Return structured response (the log above keeps the full trace)
+        return FastJSONResponse({
             "answer": answer, 
             "agents_used": decision, 
             "rationale": rationale, 
-            "trace": trace
-        }
+            "coalesced": coalesced,
+            "request_id": request_id,
+            **profiled,
+            "trace": shape_trace(trace, trace_level)
+        })
         
+    except AdmissionRejected as e:
+        # Shed load fast instead of queueing behind a saturated upstream
+        record_failure(req.text, request_id, started, e.status_code, str(e))
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except DeadlineExceeded as e:
+        record_failure(req.text, request_id, started, 504, str(e))
+        raise HTTPException(status_code=504, detail=f"Request {str(e)}")
+    except asyncio.TimeoutError:
+        detail = f"Request deadline exceeded ({deadline.budget_sec * 1000:.0f} ms)"
+        record_failure(req.text, request_id, started, 504, detail)
+        raise HTTPException(status_code=504, detail=detail)
     except Exception as e:
         # Proper error handling with HTTP status codes
+        record_failure(req.text, request_id, started, 500, str(e))
         raise HTTPException(
             status_code=500, 
             detail=f"Error processing request: {str(e)}"
         )
+    finally:
+        watcher.cancel()
+
+@router.post("/batch")
+async def ask_batch(req: BatchAskRequest, request: Request):
+    """
+    Answer many questions in one call. Routing runs once for the whole batch,
+    PDF_RAG queries are embedded together, and each agent gets its own
+    concurrency cap. Results stream back as NDJSON in completion order,
+    each line tagged with the question's index.
+    Each question gets its own deadline (X-Request-Timeout-Ms header, else
+    ASK_DEADLINE_MS), starting when it gets its agent's slot; all of them
+    are cancelled if the client goes away.
+    """
+    session_id = validate_session_id(req.session_id)
+    if not req.questions:
+        raise HTTPException(status_code=400, detail="questions must not be empty")
+    if len(req.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    
+    items = [q.model_dump() for q in req.questions]
+    try:
+        trace_level = validate_trace_level(req.trace)
+        for item in items:
+            item["tier"] = validate_tier(item["tier"])
+        budget_sec = Deadline.from_headers(request.headers).budget_sec
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        controller = Controller()
+        decisions = await asyncio.to_thread(controller.decide_many, items, session_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error routing batch: {str(e)}")
+    
+    groups = defaultdict(list)
+    for i, (decision, _) in enumerate(decisions):
+        groups[decision].append(i)
+    
+    async def stream():
+        # All PDF_RAG questions share one embedding pass
+        query_vectors = {}
+        if groups.get("PDF_RAG"):
+            pdf_rag = await asyncio.to_thread(load_agent, "PDF_RAG")
+            pdf_items = groups["PDF_RAG"]
+            vectors = await asyncio.to_thread(pdf_rag.embed_queries, [items[i]["text"] for i in pdf_items])
+            query_vectors = dict(zip(pdf_items, vectors))
+        
+        semaphores = {agent: asyncio.Semaphore(BATCH_CONCURRENCY.get(agent, 2)) for agent in groups}
+        deadlines = []
+        
+        async def run_one(i):
+            decision, rationale = decisions[i]
+            item = items[i]
+            started = time.time()
+            status = 200
+            async with semaphores[decision]:
+                deadline = Deadline(budget_sec)
+                deadlines.append(deadline)
+                try:
+                    answer, trace = await asyncio.wait_for(
+                        run_agent(
+                            decision, item["text"], item["pdf_doc_id"], session_id,
+                            query_vector=query_vectors.get(i),
+                            tier=item["tier"],
+                            deep=item["deep"],
+                            deadline=deadline
+                        ),
+                        deadline.remaining()
+                    )
+                    if isinstance(trace, dict):
+                        trace["deadline"] = deadline.summary()
+                except AdmissionRejected as e:
+                    status = e.status_code
+                    answer, trace = f"Shed: {str(e)}", {
+                        "error": str(e), "status_code": e.status_code, "retry_after": e.retry_after
+                    }
+                except (DeadlineExceeded, asyncio.TimeoutError) as e:
+                    status = 504
+                    error = str(e) or f"deadline exceeded ({budget_sec * 1000:.0f} ms)"
+                    answer, trace = f"Timed out: {error}", {"error": error, "deadline": deadline.summary()}
+                except Exception as e:
+                    status = 500
+                    answer, trace = f"Error processing request: {str(e)}", {"error": str(e)}
+            record_decision(
+                decision, rationale, item["text"], trace,
+                batch=True, status=status, duration_ms=round((time.time() - started) * 1000)
+            )
+            return {
+                "index": i,
+                "text": item["text"],
+                "answer": answer,
+                "agents_used": decision,
+                "rationale": rationale,
+                "trace": shape_trace(trace, trace_level)
+            }
+        
+        tasks = [asyncio.ensure_future(run_one(i)) for i in range(len(items))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield dumps(await next_done) + b"\n"
+        finally:
+            # Client went away: agent threads already running stop at their
+            # next deadline check; whatever hasn't started is cancelled
+            for deadline in deadlines:
+                deadline.cancel()
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
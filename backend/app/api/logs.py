@@ -1,10 +1,61 @@
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
+import time
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from app.utils.logging_utils import tail_logs
+from app.utils.log_rollups import RESOLUTIONS, rollups
+from app.utils.profiling import has_profile_token, load_profile
+from app.utils.serialization import FastJSONResponse, shape_trace, validate_trace_level
 
 router = APIRouter()
 
 @router.get("/")
-def get_logs(limit: int = 100):
+def get_logs(limit: int = 100, trace: str = None):
+    """Recent decision log entries; trace=none|summary|full controls trace detail"""
+    try:
+        level = validate_trace_level(trace)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     logs = tail_logs(limit=limit)
-    return JSONResponse(content={"logs": logs})
+    for entry in logs:
+        if "trace" in entry:
+            entry["trace"] = shape_trace(entry["trace"], level)
+    return FastJSONResponse(content={"logs": logs})
+
+# Points per /logs/stats series
+STATS_MAX_POINTS = 1440
+
+@router.get("/stats")
+def get_stats(start: float = None, end: float = None, hours: float = 24, step: str = None):
+    """
+    Agent mix, status codes, error and fallback rates and duration
+    percentiles for [start, end) (unix seconds; default the last `hours`),
+    from the pre-aggregated rollups. step=minute|hour adds a per-bucket series.
+    """
+    store = rollups()
+    end = time.time() if end is None else end
+    start = end - hours * 3600 if start is None else start
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if step is not None:
+        if step not in RESOLUTIONS:
+            raise HTTPException(status_code=400, detail=f"step must be one of {', '.join(RESOLUTIONS)}")
+        if (end - start) / RESOLUTIONS[step] > STATS_MAX_POINTS:
+            raise HTTPException(status_code=400, detail=f"At most {STATS_MAX_POINTS} points per series")
+        if step == "minute" and store.resolution_for(start) != "minute":
+            raise HTTPException(status_code=400, detail="Per-minute data no longer covers start; use step=hour")
+    # Read-only: the background job does the rolling up (see log.updated_at, log.lag_bytes)
+    return FastJSONResponse(content=store.stats(start, end, step=step))
+
+@router.get("/profiles/{request_id}")
+def get_profile(request_id: str, request: Request, format: str = "json"):
+    """Sampling profile of a profiled /ask request (needs X-Profile-Token); format=collapsed for flamegraph tools"""
+    if not has_profile_token(request.headers):
+        raise HTTPException(status_code=403, detail="Profiles need a valid X-Profile-Token")
+    if not request_id.isalnum():
+        raise HTTPException(status_code=400, detail="Invalid request_id")
+    profile = load_profile(request_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No profile for request {request_id}")
+    if format == "collapsed":
+        return PlainTextResponse(profile["collapsed"])
+    return FastJSONResponse(content=profile)
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, BackgroundTasks
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
 import os
 import shutil
+import asyncio
 import time
 import logging
-from app.utils.security import validate_pdf_upload
-from app.agents.pdf_rag import ingest_pdf_to_chroma
+import uuid
+from app.utils.security import validate_pdf_upload, validate_session_id, validate_zip_upload, validate_bulk_source
+from app.utils.bulk_ingest import collect_pdfs
+from app.utils import progress_events
+from app.agents.registry import load_agent
 
 logger = logging.getLogger(__name__)
 
@@ -13,25 +18,46 @@ router = APIRouter()
 UPLOAD_DIR = "data/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# In-memory status tracking
+# In-memory status tracking (transitions are also pushed over /upload/events)
 upload_status = {}
+bulk_jobs = {}
+
+def set_status(doc_id, status):
+    """Replace a document's status and publish the transition"""
+    upload_status[doc_id] = status
+    progress_events.publish(doc_id, status["status"], **{k: v for k, v in status.items() if k not in ("status", "doc_id")})
+
+def update_job(job_id, **fields):
+    """Update a bulk job's status and publish the transition (without per-doc lists)"""
+    bulk_jobs[job_id].update(fields)
+    job = bulk_jobs[job_id]
+    progress_events.publish(
+        job_id, job["status"],
+        **{k: v for k, v in job.items() if k not in ("status", "job_id", "documents", "failed")}
+    )
 
 @router.post("/", status_code=202)  # 202 Accepted (processing in background)
-async def upload_pdf(file: UploadFile = File(...), background_tasks: BackgroundTasks = None):
+async def upload_pdf(
+    file: UploadFile = File(...),
+    session_id: str = Form(None),
+    background_tasks: BackgroundTasks = None
+):
     """
     Upload PDF and process in background.
     Returns immediately with doc_id for status tracking.
+    The PDF is indexed into the given session (or the default one).
     """
     try:
         logger.info(f"📤 Received upload: {file.filename}")
         
         # 1) Validation (size & mimetype)
         validate_pdf_upload(file)  # raises HTTPException if invalid
+        session_id = validate_session_id(session_id)
         
-        # 2) Save uploaded file with unique doc_id
-        ts = int(time.time())
-        doc_id = f"upload_{ts}"
-        dest_path = os.path.join(UPLOAD_DIR, f"{ts}_{file.filename}")
+        # 2) Save uploaded file with unique doc_id (events for it go out on a
+        # bus shared by every worker, so a timestamp is not unique enough)
+        doc_id = f"upload_{uuid.uuid4().hex}"
+        dest_path = os.path.join(UPLOAD_DIR, f"{doc_id}_{os.path.basename(file.filename)}")
         
         # Save file
         with open(dest_path, "wb") as f:
@@ -44,21 +70,23 @@ async def upload_pdf(file: UploadFile = File(...), background_tasks: BackgroundT
         file_size_mb = round(file_size / (1024 * 1024), 2)
         
         # Initialize status
-        upload_status[doc_id] = {
+        set_status(doc_id, {
             "status": "processing",
             "message": "PDF uploaded, creating embeddings...",
             "filename": file.filename,
             "file_size_mb": file_size_mb,
             "uploaded_at": time.time(),
-            "doc_id": doc_id
-        }
+            "doc_id": doc_id,
+            "session_id": session_id
+        })
         
         # 3) Process PDF in background task
         background_tasks.add_task(
             process_pdf_background,
             dest_path,
             doc_id,
-            file.filename
+            file.filename,
+            session_id
         )
         
         logger.info(f"🚀 Background processing started for doc_id: {doc_id}")
@@ -66,10 +94,12 @@ async def upload_pdf(file: UploadFile = File(...), background_tasks: BackgroundT
         return {
             "status": "accepted",
             "doc_id": doc_id,
+            "session_id": session_id,
             "filename": file.filename,
             "file_size_mb": file_size_mb,
             "message": "PDF uploaded successfully. Processing embeddings in background.",
-            "check_status": f"/upload/status/{doc_id}"
+            "check_status": f"/upload/status/{doc_id}",
+            "events": f"/upload/events?doc_ids={doc_id}"
         }
         
     except HTTPException:
@@ -78,7 +108,7 @@ async def upload_pdf(file: UploadFile = File(...), background_tasks: BackgroundT
         logger.error(f"❌ Upload failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
-def process_pdf_background(pdf_path: str, doc_id: str, filename: str):
+def process_pdf_background(pdf_path: str, doc_id: str, filename: str, session_id: str = "default"):
     """
     Background task to ingest PDF into ChromaDB
     """
@@ -86,32 +116,43 @@ def process_pdf_background(pdf_path: str, doc_id: str, filename: str):
         logger.info(f"🔄 Starting PDF ingestion for {doc_id}")
         
         # Update status
-        upload_status[doc_id]["status"] = "embedding"
-        upload_status[doc_id]["message"] = "Creating vector embeddings..."
+        set_status(doc_id, {
+            **upload_status[doc_id],
+            "status": "embedding",
+            "message": "Creating vector embeddings..."
+        })
+        
+        def report(stage, **fields):
+            # Per-stage / per-batch progress: pushed to subscribers, visible to pollers
+            upload_status[doc_id]["progress"] = {"stage": stage, **fields}
+            progress_events.publish(doc_id, "embedding", stage=stage, **fields)
         
-        # Ingest PDF into Chroma
-        ingest_result = ingest_pdf_to_chroma(pdf_path, doc_id)
+        # Ingest PDF into Chroma (imports the PDF agent on first upload)
+        ingest_result = load_agent("PDF_RAG").ingest_pdf_to_chroma(
+            pdf_path, doc_id, session_id=session_id, progress=report
+        )
         
         if ingest_result["status"] == "success":
             # Success
-            upload_status[doc_id] = {
+            set_status(doc_id, {
                 "status": "completed",
                 "message": ingest_result["message"],
                 "filename": filename,
                 "doc_id": doc_id,
+                "session_id": session_id,
                 "chunks_count": ingest_result.get("chunks_count", 0),
                 "completed_at": time.time()
-            }
+            })
             logger.info(f"✅ PDF ingestion completed for {doc_id}: {ingest_result['chunks_count']} chunks")
         else:
             # Ingestion failed
-            upload_status[doc_id] = {
+            set_status(doc_id, {
                 "status": "failed",
                 "message": ingest_result["message"],
                 "filename": filename,
                 "doc_id": doc_id,
                 "failed_at": time.time()
-            }
+            })
             logger.error(f"❌ PDF ingestion failed for {doc_id}: {ingest_result['message']}")
             
             # Clean up file on failure
@@ -121,18 +162,154 @@ def process_pdf_background(pdf_path: str, doc_id: str, filename: str):
                 
     except Exception as e:
         logger.error(f"❌ Background processing error for {doc_id}: {str(e)}")
-        upload_status[doc_id] = {
+        set_status(doc_id, {
             "status": "failed",
             "message": f"Processing failed: {str(e)}",
             "filename": filename,
             "doc_id": doc_id,
             "failed_at": time.time()
-        }
+        })
         
         # Clean up file on error
         if os.path.exists(pdf_path):
             os.remove(pdf_path)
 
+@router.post("/bulk", status_code=202)
+async def upload_bulk(
+    file: UploadFile = File(None),
+    source: str = Form(None),
+    session_id: str = Form(None),
+    background_tasks: BackgroundTasks = None
+):
+    """
+    Bulk-ingest many PDFs from a ZIP upload or from a server-side directory
+    or glob under BULK_INGEST_ROOT. Runs in background; poll the returned
+    job for per-document results and docs/s, chunks/s.
+    """
+    if (file is None) == (source is None):
+        raise HTTPException(status_code=400, detail="Provide either a .zip file or a source path, not both.")
+    session_id = validate_session_id(session_id)
+    
+    # Unique even for jobs started in the same second (doc ids derive from it)
+    job_id = f"bulk_{uuid.uuid4().hex}"
+    if file is not None:
+        validate_zip_upload(file)  # raises HTTPException if invalid
+        source_path = os.path.join(UPLOAD_DIR, f"{job_id}.zip")
+        with open(source_path, "wb") as f:
+            shutil.copyfileobj(file.file, f)
+        label = file.filename
+    else:
+        source_path = validate_bulk_source(source)
+        label = source
+    
+    bulk_jobs[job_id] = {"job_id": job_id}
+    update_job(
+        job_id,
+        status="processing",
+        message="Collecting PDFs...",
+        source=label,
+        session_id=session_id,
+        started_at=time.time()
+    )
+    background_tasks.add_task(process_bulk_background, job_id, source_path, session_id)
+    logger.info(f"🚀 Bulk ingestion {job_id} started from {label}")
+    
+    return {
+        "status": "accepted",
+        "job_id": job_id,
+        "session_id": session_id,
+        "check_status": f"/upload/bulk/{job_id}",
+        "events": f"/upload/events?doc_ids={job_id}"
+    }
+
+def process_bulk_background(job_id: str, source_path: str, session_id: str = "default"):
+    """
+    Background task: expand the source into PDFs and run the bulk pipeline
+    """
+    is_archive = source_path.endswith(".zip") and os.path.isfile(source_path)
+    try:
+        paths = collect_pdfs(source_path, extract_dir=os.path.join(UPLOAD_DIR, job_id))
+        if is_archive:
+            os.remove(source_path)
+        if not paths:
+            update_job(job_id, status="failed", message="No PDFs found", failed_at=time.time())
+            return
+        
+        update_job(job_id, status="embedding", message=f"Ingesting {len(paths)} PDFs...")
+        doc_ids = [f"{job_id}_{n}" for n in range(len(paths))]
+        result = load_agent("PDF_RAG").ingest_pdfs_bulk(paths, session_id=session_id, doc_ids=doc_ids)
+        if result["status"] != "success":
+            update_job(job_id, status="failed", message=result["message"], failed_at=time.time())
+            return
+        
+        # Each document shows up in /upload/list and can be deleted individually
+        for doc in result["documents"]:
+            set_status(doc["doc_id"], {
+                "status": "completed",
+                "message": f"Successfully ingested {doc['chunks_count']} chunks",
+                "filename": doc["filename"],
+                "doc_id": doc["doc_id"],
+                "session_id": session_id,
+                "chunks_count": doc["chunks_count"],
+                "job_id": job_id,
+                "completed_at": time.time()
+            })
+        
+        stats = result["stats"]
+        update_job(
+            job_id,
+            status="completed",
+            message=f"Ingested {stats['docs_ingested']} of {stats['files']} PDFs "
+                    f"({stats['docs_per_sec']} docs/s, {stats['chunks_per_sec']} chunks/s)",
+            documents=result["documents"],
+            failed=result["failed"],
+            stats=stats,
+            completed_at=time.time()
+        )
+        logger.info(f"✅ Bulk ingestion {job_id} completed")
+        
+    except Exception as e:
+        logger.error(f"❌ Bulk ingestion error for {job_id}: {str(e)}")
+        update_job(job_id, status="failed", message=f"Processing failed: {str(e)}", failed_at=time.time())
+        if is_archive and os.path.exists(source_path):
+            os.remove(source_path)
+
+@router.get("/bulk/{job_id}")
+async def get_bulk_status(job_id: str):
+    """
+    Check progress and throughput of a bulk ingestion job
+    """
+    if job_id not in bulk_jobs:
+        raise HTTPException(status_code=404, detail=f"Bulk job {job_id} not found")
+    
+    return bulk_jobs[job_id]
+
+@router.get("/events")
+async def upload_events(doc_ids: str, request: Request):
+    """
+    Server-sent events with state transitions and per-batch embedding
+    progress for one or more comma-separated doc ids (or bulk job ids).
+    Replaces polling /upload/status; the stream ends when every id has
+    completed or failed.
+    """
+    ids = [d.strip() for d in doc_ids.split(",") if d.strip()]
+    if not ids:
+        raise HTTPException(status_code=400, detail="doc_ids must not be empty")
+    if len(ids) > 100:
+        raise HTTPException(status_code=400, detail="At most 100 doc_ids per stream")
+    
+    # Fall back to this worker's status dicts for ids the bus hasn't seen yet
+    known = {**upload_status, **bulk_jobs}
+    initial = {
+        d: {**known[d], "doc_id": d, "state": known[d]["status"], "seq": 0}
+        for d in ids if d in known
+    }
+    return StreamingResponse(
+        progress_events.sse_stream(ids, request, initial=initial),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/status/{doc_id}")
 async def get_upload_status(doc_id: str):
     """
@@ -153,23 +330,40 @@ async def list_uploads():
         "documents": list(upload_status.values())
     }
 
+@router.get("/index-stats")
+async def index_stats():
+    """
+    Resident session indexes vs the memory budget
+    """
+    pdf_rag = await asyncio.to_thread(load_agent, "PDF_RAG")
+    return pdf_rag.index_stats()
+
 @router.delete("/{doc_id}")
-async def delete_upload(doc_id: str):
+async def delete_upload(doc_id: str, session_id: str = None):
     """
-    Delete uploaded document and remove from status
+    Delete uploaded document: drop its chunks from the session's vector +
+    keyword indexes and remove it from status
     """
-    if doc_id not in upload_status:
+    if session_id is None and doc_id in upload_status:
+        session_id = upload_status[doc_id].get("session_id")
+    session_id = validate_session_id(session_id)
+    
+    pdf_rag = await asyncio.to_thread(load_agent, "PDF_RAG")
+    chunks_removed = await asyncio.to_thread(pdf_rag.delete_document, doc_id, session_id)
+    
+    if doc_id not in upload_status and not chunks_removed:
         raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
     
     # Remove from status
-    doc_info = upload_status.pop(doc_id)
+    doc_info = upload_status.pop(doc_id, {})
     
     logger.info(f"🗑️ Deleted document: {doc_id}")
     
     return {
         "status": "deleted",
         "doc_id": doc_id,
-        "filename": doc_info.get("filename")
+        "filename": doc_info.get("filename"),
+        "chunks_removed": chunks_removed
     }
 @router.delete("/clear-failed")
 async def clear_failed_uploads():
@@ -3,7 +3,10 @@ from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
 import sys
+import time
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -28,7 +31,14 @@ logger.info(f"📂 Loaded .env from: {env_path}")
 if __package__ in (None, ""):
     sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+_routers_start = time.perf_counter()
 from app.api import ask, upload, logs
+from app.agents import registry
+from app.utils.admission import admission_stats, thread_pool_size
+from app.utils.compression import CompressionMiddleware
+from app.utils import progress_events, log_rollups
+from app.utils.routing_rules import rule_engine
+logger.info(f"⏱️ Routers imported in {time.perf_counter() - _routers_start:.2f}s (agents load lazily)")
 
 # Create app
 app = FastAPI(title="Multi-Agent Dynamic Decision System")
@@ -42,7 +52,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# NO STARTUP EVENT - Model loads on first use
+# gzip/brotli per Accept-Encoding for bodies above COMPRESSION_MIN_BYTES
+app.add_middleware(CompressionMiddleware)
+
+# Blocking work (agents, upstream calls queued for admission) runs in the
+# default executor; size it so the bounded admission queue can't exhaust it
+@app.on_event("startup")
+async def size_thread_pool():
+    workers = thread_pool_size()
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=workers, thread_name_prefix="worker")
+    )
+    logger.info(f"🧵 Default thread pool: {workers} workers")
+
+# Model loads on first use unless EMBEDDING_WARMUP is set. Startup handlers
+# finish before uvicorn opens the port, so the first request never pays for it.
+if os.getenv("EMBEDDING_WARMUP", "false").lower() in ("1", "true", "yes"):
+    @app.on_event("startup")
+    async def warm_up_embeddings():
+        pdf_rag = await asyncio.to_thread(registry.load_agent, "PDF_RAG")
+        await asyncio.to_thread(pdf_rag.warm_up_embeddings)
+
+# Import agents in the background after startup so /health answers right away
+# and the first real request usually finds its agent already loaded.
+if os.getenv("AGENT_PRELOAD", "true").lower() in ("1", "true", "yes"):
+    @app.on_event("startup")
+    async def preload_agents():
+        registry.preload_agents()
+
+# Upload progress pub/sub shared by all workers on this host (SSE at /upload/events)
+@app.on_event("startup")
+async def start_progress_bus():
+    progress_events.start()
+
+@app.on_event("shutdown")
+async def stop_progress_bus():
+    progress_events.stop()
+
+# Decision log -> per-minute/per-hour rollups behind /logs/stats
+@app.on_event("startup")
+async def start_log_rollups():
+    log_rollups.start_background()
+
+@app.on_event("shutdown")
+async def stop_log_rollups():
+    log_rollups.stop_background()
 
 # Register routers
 app.include_router(upload.router, prefix="/upload", tags=["upload"])
@@ -55,8 +109,27 @@ async def root():
 
 @app.get("/health")
 async def health():
-    """Health check"""
-    return {"status": "healthy", "message": "Service is running"}
+    """Health check (never waits on agent imports)"""
+    return {
+        "status": "healthy",
+        "message": "Service is running",
+        "agents": registry.agent_status(),
+    }
+
+@app.get("/health/upstreams")
+async def upstreams():
+    """Admission control: in-flight calls, queue depth and rejections per upstream"""
+    return admission_stats()
+
+@app.get("/health/imports")
+async def import_timings():
+    """Per-module import cost recorded while loading agents"""
+    return {"agents": registry.agent_status(), "import_seconds": registry.import_timings}
+
+@app.get("/health/routing")
+async def routing_rules():
+    """Loaded routing rules, how often each one decided a query, last reload error"""
+    return rule_engine().stats()
 
 logger.info("✅' All routers registered")
 logger.info("✅ Backend initialization complete")
@@ -0,0 +1,251 @@
+import os
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Defaults follow Groq's free tier for llama-3.3-70b and arXiv's
+# "one request every three seconds" guidance; override per deployment.
+UPSTREAM_DEFAULTS = {
+    "groq": {
+        "max_concurrency": int(os.getenv("GROQ_MAX_CONCURRENCY", 8)),
+        "rpm": int(os.getenv("GROQ_RPM", 30)),
+        "tpm": int(os.getenv("GROQ_TPM", 12000)),
+    },
+    "serpapi": {
+        "max_concurrency": int(os.getenv("SERPAPI_MAX_CONCURRENCY", 4)),
+        "rpm": int(os.getenv("SERPAPI_RPM", 0)),
+    },
+    "arxiv": {
+        "max_concurrency": int(os.getenv("ARXIV_MAX_CONCURRENCY", 1)),
+        "rpm": int(os.getenv("ARXIV_RPM", 20)),
+    },
+    # Full-text PDF downloads for deep arXiv mode (background only)
+    "arxiv_pdf": {
+        "max_concurrency": int(os.getenv("ARXIV_PDF_MAX_CONCURRENCY", 2)),
+        "rpm": int(os.getenv("ARXIV_PDF_RPM", 15)),
+    },
+}
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 8))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 10))
+# Queued callers each hold a thread-pool worker while they wait, so all
+# upstreams together may park at most this many (beyond it: 503 queue_full)
+ADMISSION_MAX_WAITERS = int(os.getenv("ADMISSION_MAX_WAITERS", 16))
+# Workers left for everything else that runs in the pool (agent imports,
+# index search, embedding) when every admission slot and queue is taken
+THREAD_POOL_HEADROOM = int(os.getenv("THREAD_POOL_HEADROOM", 16))
+
+_waiters_lock = threading.Lock()
+_waiters = 0
+
+
+def thread_pool_size():
+    """
+    Default executor size that in-flight upstream calls plus the bounded
+    admission queue can never exhaust (arxiv_pdf runs in its own pool).
+    """
+    in_flight = sum(cfg["max_concurrency"] for name, cfg in UPSTREAM_DEFAULTS.items() if name != "arxiv_pdf")
+    return in_flight + ADMISSION_MAX_WAITERS + THREAD_POOL_HEADROOM
+
+
+def _enter_queue():
+    global _waiters
+    with _waiters_lock:
+        if _waiters >= ADMISSION_MAX_WAITERS:
+            return False
+        _waiters += 1
+        return True
+
+
+def _leave_queue():
+    global _waiters
+    with _waiters_lock:
+        _waiters -= 1
+
+
+class AdmissionRejected(Exception):
+    """Raised when an upstream call is shed; maps to 503/429 + Retry-After"""
+
+    def __init__(self, upstream, reason, retry_after, status_code):
+        super().__init__(f"{upstream} overloaded: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """Per-minute quota refilled continuously (capacity = one minute's worth)"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` is available (0 if it is now)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)  # a single huge call can still run
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class Ticket:
+    """Handle for an admitted call; report real token usage to refund over-reservation"""
+
+    def __init__(self, limiter, reserved_tokens):
+        self.limiter = limiter
+        self.reserved_tokens = reserved_tokens
+
+    def record_tokens(self, used_tokens):
+        if used_tokens is not None and self.limiter.tokens is not None:
+            self.limiter.adjust_tokens(self.reserved_tokens - used_tokens)
+            self.reserved_tokens = used_tokens
+
+
+class UpstreamLimiter:
+    """
+    Concurrency cap + request/token buckets + bounded wait queue for one upstream.
+    Callers beyond the queue (or beyond ADMISSION_MAX_WAITERS across all
+    upstreams) are rejected immediately (503); queued callers that can't be
+    admitted before their deadline are rejected with 429.
+    """
+
+    def __init__(self, name, max_concurrency, rpm=0, tpm=0,
+                 max_queue=ADMISSION_MAX_QUEUE, queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "deadline": 0}
+
+    def _wait_needed(self, tokens, now):
+        if self.in_flight >= self.max_concurrency:
+            return None  # woken by a release
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def _reject(self, reason, retry_after, status_code):
+        self.rejected[reason] += 1
+        logger.warning(f"🚦 Shedding {self.name} call ({reason}), retry after {retry_after:.1f}s")
+        raise AdmissionRejected(self.name, reason, retry_after, status_code)
+
+    @contextmanager
+    def admit(self, tokens=0, timeout=None):
+        deadline = time.monotonic() + (self.queue_timeout if timeout is None else timeout)
+        with self._cond:
+            wait = self._wait_needed(tokens, time.monotonic())
+            if wait != 0.0:
+                if self.waiting >= self.max_queue or not _enter_queue():
+                    self._reject("queue_full", wait or self.queue_timeout, 503)
+                self.waiting += 1
+                try:
+                    while wait != 0.0:
+                        now = time.monotonic()
+                        remaining = deadline - now
+                        if remaining <= 0 or (wait is not None and wait > remaining):
+                            self._reject("deadline", wait if wait else self.queue_timeout, 429)
+                        self._cond.wait(remaining if wait is None else wait)
+                        wait = self._wait_needed(tokens, time.monotonic())
+                finally:
+                    self.waiting -= 1
+                    _leave_queue()
+
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens and tokens:
+                self.tokens.take(tokens)
+            self.in_flight += 1
+            self.admitted += 1
+
+        try:
+            yield Ticket(self, tokens)
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def adjust_tokens(self, refund):
+        with self._cond:
+            if refund > 0:
+                self.tokens.give_back(refund)
+            elif refund < 0:
+                self.tokens.take(-refund)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            if self.requests:
+                self.requests._refill(now)
+            if self.tokens:
+                self.tokens._refill(now)
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "queue_depth": self.waiting,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "requests_available": round(self.requests.level, 1) if self.requests else None,
+                "tokens_available": round(self.tokens.level) if self.tokens else None,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter(upstream):
+    with _limiters_lock:
+        if upstream not in _limiters:
+            _limiters[upstream] = UpstreamLimiter(upstream, **UPSTREAM_DEFAULTS[upstream])
+        return _limiters[upstream]
+
+
+def admission_stats():
+    stats = {name: limiter(name).stats() for name in UPSTREAM_DEFAULTS}
+    with _waiters_lock:
+        stats["queued_total"] = {"waiting": _waiters, "max_waiters": ADMISSION_MAX_WAITERS}
+    return stats
+
+
+def invoke_llm(make_llm, prompt, max_tokens, admit_timeout=None):
+    """
+    One make_llm().invoke(prompt) under Groq admission control. The client
+    is built once admitted, so its timeout can be sized from what is left
+    after queueing, and must not retry by itself: each try has to be
+    admitted. Reserves the prompt estimate + max_tokens against the TPM
+    bucket, then refunds the unused part once the real usage is known.
+    admit_timeout: max seconds to queue (default ADMISSION_QUEUE_TIMEOUT).
+    """
+    with limiter("groq").admit(tokens=len(prompt) // 4 + max_tokens, timeout=admit_timeout) as ticket:
+        response = make_llm().invoke(prompt)
+        usage = (getattr(response, "response_metadata", None) or {}).get("token_usage", {})
+        ticket.record_tokens(usage.get("total_tokens"))
+        return response
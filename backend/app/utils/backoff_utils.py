@@ -1,15 +1,23 @@
 import time
 # Simple retry decorator if backoff_utils is missing
-def with_retry(max_tries=3, exceptions=(Exception,), delay=2):
+def with_retry(max_tries=3, exceptions=(Exception,), delay=2, giveup=()):
+    """
+    Retry on `exceptions`, except those in `giveup` which propagate at once.
+    If the call gets a `deadline` kwarg, no retry starts once less than
+    `delay` of it is left.
+    """
     def decorator(func):
         def wrapper(*args, **kwargs):
+            deadline = kwargs.get("deadline")
             tries = 0
             while tries < max_tries:
                 try:
                     return func(*args, **kwargs)
+                except giveup:
+                    raise
                 except exceptions:
                     tries += 1
-                    if tries >= max_tries:
+                    if tries >= max_tries or (deadline is not None and deadline.remaining() <= delay):
                         raise
                     time.sleep(delay)
         return wrapper
@@ -0,0 +1,226 @@
+import os
+import glob
+import time
+import queue
+import logging
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+# PDF text extraction runs on this many threads; chunking and embedding each
+# get one thread and overlap with it
+BULK_EXTRACT_WORKERS = int(os.getenv("BULK_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+# Chunks from several files are embedded together once this many are queued
+BULK_EMBED_BATCH = int(os.getenv("BULK_EMBED_BATCH", 256))
+# Chunked documents waiting for the embedder (bounds memory on large corpora)
+BULK_QUEUE_DEPTH = 16
+# ZIP archives are checked against these before anything is extracted
+BULK_MAX_UNCOMPRESSED_MB = int(os.getenv("BULK_MAX_UNCOMPRESSED_MB", 2048))
+BULK_MAX_ZIP_MEMBERS = int(os.getenv("BULK_MAX_ZIP_MEMBERS", 5000))
+
+_DONE = object()
+
+
+def _pdf_members(archive):
+    return [
+        (n, member) for n, member in enumerate(archive.infolist())
+        if not member.is_dir() and os.path.basename(member.filename).lower().endswith(".pdf")
+    ]
+
+
+def check_zip_limits(archive):
+    """
+    Raise ValueError if the archive has too many members or its PDFs would
+    take more than BULK_MAX_UNCOMPRESSED_MB once extracted (declared sizes;
+    extraction also stops at each member's declared size).
+    """
+    members = archive.infolist()
+    if len(members) > BULK_MAX_ZIP_MEMBERS:
+        raise ValueError(f"Archive has {len(members)} entries, max is {BULK_MAX_ZIP_MEMBERS}")
+    total_mb = sum(member.file_size for _, member in _pdf_members(archive)) / (1024 * 1024)
+    if total_mb > BULK_MAX_UNCOMPRESSED_MB:
+        raise ValueError(
+            f"Archive expands to {total_mb:.0f} MB of PDFs, max is {BULK_MAX_UNCOMPRESSED_MB} MB"
+        )
+
+
+def collect_pdfs(source, extract_dir=None):
+    """
+    Expand a directory, glob pattern or ZIP archive into a sorted list of PDF paths.
+    ZIP members are extracted (flattened) into extract_dir, within the
+    check_zip_limits caps (ValueError otherwise).
+    """
+    if os.path.isfile(source) and zipfile.is_zipfile(source):
+        extract_dir = extract_dir or os.path.splitext(source)[0]
+        os.makedirs(extract_dir, exist_ok=True)
+        paths = []
+        with zipfile.ZipFile(source) as archive:
+            check_zip_limits(archive)
+            try:
+                for n, member in _pdf_members(archive):
+                    # Never trust archive paths: flatten and prefix to avoid clashes
+                    dest = os.path.join(extract_dir, f"{n}_{os.path.basename(member.filename)}")
+                    paths.append(dest)
+                    written = 0
+                    with archive.open(member) as src, open(dest, "wb") as dst:
+                        while True:
+                            block = src.read(1024 * 1024)
+                            if not block:
+                                break
+                            written += len(block)
+                            if written > member.file_size:
+                                raise ValueError(f"{member.filename} is larger than its declared size")
+                            dst.write(block)
+            except Exception:
+                for path in paths:
+                    if os.path.exists(path):
+                        os.remove(path)
+                raise
+        return sorted(paths)
+
+    if os.path.isdir(source):
+        pattern = os.path.join(source, "**", "*")
+    else:
+        pattern = source
+    return sorted(
+        p for p in glob.glob(pattern, recursive=True)
+        if os.path.isfile(p) and p.lower().endswith(".pdf")
+    )
+
+
+def run_pipeline(paths, extract, chunk, embed, workers=BULK_EXTRACT_WORKERS, batch_size=BULK_EMBED_BATCH):
+    """
+    Extract -> chunk -> embed many files as overlapping stages.
+
+    extract(path) -> text, chunk(text) -> [str], embed([str]) -> vectors.
+    Extraction fans out over a thread pool; chunks from several files are
+    embedded in one batch. Nothing is indexed here: the caller inserts the
+    returned documents in one go.
+    Returns (docs, failures, stats) with docs = [(path, texts, vectors)] and
+    failures = [(path, message)].
+    """
+    start = time.time()
+    docs, failures = [], []
+    busy = {"extract": 0.0, "chunk": 0.0, "embed": 0.0}
+    busy_lock = threading.Lock()
+    chunked = queue.Queue(maxsize=BULK_QUEUE_DEPTH)
+    embed_error = []
+
+    def timed_extract(path):
+        t = time.time()
+        try:
+            return extract(path)
+        finally:
+            with busy_lock:
+                busy["extract"] += time.time() - t
+
+    def embedder():
+        pending, buffered = [], 0
+
+        def flush():
+            t = time.time()
+            vectors = embed([text for _, texts in pending for text in texts])
+            busy["embed"] += time.time() - t
+            pos = 0
+            for path, texts in pending:
+                docs.append((path, texts, vectors[pos:pos + len(texts)]))
+                pos += len(texts)
+            logger.info(f"🧮 Embedded {pos} chunks from {len(pending)} files")
+
+        try:
+            while True:
+                item = chunked.get()
+                if item is _DONE:
+                    break
+                pending.append(item)
+                buffered += len(item[1])
+                if buffered >= batch_size:
+                    flush()
+                    pending, buffered = [], 0
+            if pending:
+                flush()
+        except Exception as e:
+            embed_error.append(e)
+            # Keep draining so the producer never blocks on a full queue
+            while chunked.get() is not _DONE:
+                pass
+
+    embed_thread = threading.Thread(target=embedder, name="bulk-embed", daemon=True)
+    embed_thread.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bulk-extract") as pool:
+            futures = {pool.submit(timed_extract, path): path for path in paths}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    text = future.result()
+                except Exception as e:
+                    failures.append((path, f"Extraction failed: {e}"))
+                    continue
+                if not text.strip():
+                    failures.append((path, "No text found in PDF"))
+                    continue
+                t = time.time()
+                texts = chunk(text)
+                busy["chunk"] += time.time() - t
+                chunked.put((path, texts))
+    finally:
+        chunked.put(_DONE)
+        embed_thread.join()
+
+    if embed_error:
+        raise embed_error[0]
+
+    elapsed = time.time() - start
+    chunks = sum(len(texts) for _, texts, _ in docs)
+    stats = {
+        "files": len(paths),
+        "docs_ingested": len(docs),
+        "docs_failed": len(failures),
+        "chunks": chunks,
+        "pipeline_sec": round(elapsed, 2),
+        "stage_busy_sec": {stage: round(sec, 2) for stage, sec in busy.items()},
+        "extract_workers": workers,
+        "embed_batch": batch_size,
+    }
+    return docs, failures, stats
+
+
+def throughput(stats, total_sec):
+    """Add end-to-end timing and docs/s, chunks/s to a pipeline stats dict"""
+    stats["total_sec"] = round(total_sec, 2)
+    stats["docs_per_sec"] = round(stats["docs_ingested"] / total_sec, 2) if total_sec else None
+    stats["chunks_per_sec"] = round(stats["chunks"] / total_sec, 1) if total_sec else None
+    return stats
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        prog="python -m app.utils.bulk_ingest",
+        description="Ingest a directory, glob or ZIP of PDFs into a session index"
+    )
+    parser.add_argument("source", help="directory, glob pattern (quote it) or .zip archive")
+    parser.add_argument("--session", default="default", help="session id to index into")
+    parser.add_argument("--workers", type=int, default=BULK_EXTRACT_WORKERS)
+    parser.add_argument("--batch", type=int, default=BULK_EMBED_BATCH)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(__file__), "..", "..", ".env"))
+    from app.agents import pdf_rag
+
+    paths = collect_pdfs(args.source)
+    if not paths:
+        print(f"No PDFs found in {args.source}")
+        sys.exit(1)
+    result = pdf_rag.ingest_pdfs_bulk(paths, session_id=args.session, workers=args.workers, batch_size=args.batch)
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["status"] == "success" else 1)
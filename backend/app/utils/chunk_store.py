@@ -0,0 +1,188 @@
+import os
+import json
+import mmap
+from array import array
+
+TEXT_BLOB_FILE = "chunks.bin"
+COLUMNS_FILE = "chunks.columns"
+META_FILE = "chunks.json"
+
+
+class ChunkStore:
+    """
+    Compact columnar storage for PDF chunks.
+
+    Text lives in an append-only UTF-8 blob on disk (read through mmap) with
+    an offset array; doc ids and sources are interned and referenced by small
+    integer columns. A row number identifies a chunk everywhere (FAISS id,
+    keyword index key), so nothing per-chunk is kept as a Python object.
+
+    Rows are append-only: once written, a row's text and columns never
+    change, so readers of older index snapshots can keep reading them while
+    the writer appends (tombstones and doc_rows are copied per snapshot).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.blob_path = os.path.join(directory, TEXT_BLOB_FILE)
+
+        self.offsets = array("Q", [0])   # row i spans offsets[i]:offsets[i+1]
+        self.doc_idx = array("I")        # row -> index into doc_ids
+        self.chunk_ids = array("I")      # row -> chunk number inside its document
+        self.source_idx = array("B")     # row -> index into sources
+        self.deleted = bytearray()       # row -> 1 if tombstoned
+
+        self.doc_ids = []                # interned doc ids
+        self._doc_lookup = {}
+        self.sources = []                # interned sources ("pdf_upload", "arxiv", ...)
+        self._source_lookup = {}
+        self.doc_rows = {}               # doc_id -> [start, stop) row range
+        self.deleted_count = 0
+
+        self._writer = open(self.blob_path, "ab")
+        self._mmap = None
+        self._frozen = False
+
+    def __len__(self):
+        return len(self.doc_idx)
+
+    @property
+    def live_count(self):
+        return len(self.doc_idx) - self.deleted_count
+
+    def _intern(self, value, values, lookup):
+        idx = lookup.get(value)
+        if idx is None:
+            idx = len(values)
+            values.append(value)
+            lookup[value] = idx
+        return idx
+
+    def append(self, doc_id, texts, chunk_ids=None, source="pdf_upload"):
+        """Append one document's chunks; returns the row range (start, stop)"""
+        doc = self._intern(doc_id, self.doc_ids, self._doc_lookup)
+        src = self._intern(source, self.sources, self._source_lookup)
+        start = len(self.doc_idx)
+
+        encoded = [t.encode("utf-8") for t in texts]
+        self._writer.write(b"".join(encoded))
+        self._writer.flush()
+
+        end = self.offsets[-1]
+        for i, data in enumerate(encoded):
+            end += len(data)
+            self.offsets.append(end)
+            self.chunk_ids.append(chunk_ids[i] if chunk_ids is not None else i)
+            self.doc_idx.append(doc)
+            self.source_idx.append(src)
+        self.deleted.extend(b"\x00" * len(encoded))
+
+        stop = len(self.doc_idx)
+        self.doc_rows[doc_id] = (start, stop)
+        return start, stop
+
+    def delete_doc(self, doc_id):
+        """Tombstone a document's rows; returns the deleted row numbers"""
+        span = self.doc_rows.pop(doc_id, None)
+        if span is None:
+            return []
+        rows = [r for r in range(*span) if not self.deleted[r]]
+        for r in rows:
+            self.deleted[r] = 1
+        self.deleted_count += len(rows)
+        return rows
+
+    def rows_for_doc(self, doc_id):
+        span = self.doc_rows.get(doc_id)
+        return range(*span) if span else range(0)
+
+    def is_live(self, row):
+        return 0 <= row < len(self.doc_idx) and not self.deleted[row]
+
+    def _view(self, end):
+        view = self._mmap
+        if not self._frozen and (view is None or len(view) < end):
+            # The old map is not closed: another reader may still be slicing
+            # it. It is unmapped once the last reference goes away.
+            with open(self.blob_path, "rb") as f:
+                view = self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return view
+
+    def text(self, row):
+        start, end = self.offsets[row], self.offsets[row + 1]
+        if start == end:
+            return ""
+        return self._view(end)[start:end].decode("utf-8")
+
+    def metadata(self, row):
+        return {
+            "doc_id": self.doc_ids[self.doc_idx[row]],
+            "chunk_id": self.chunk_ids[row],
+            "source": self.sources[self.source_idx[row]],
+        }
+
+    def live_rows(self):
+        return (r for r in range(len(self.doc_idx)) if not self.deleted[r])
+
+    def memory_bytes(self):
+        """Approximate resident size of the columns (the text blob stays on disk)"""
+        columns = sum(a.itemsize * len(a) for a in (self.offsets, self.doc_idx, self.chunk_ids, self.source_idx))
+        return columns + len(self.deleted) + sum(len(d) + 50 for d in self.doc_ids)
+
+    def save(self):
+        """Persist columns (the blob is already on disk)"""
+        self._writer.flush()
+        columns_path = os.path.join(self.directory, COLUMNS_FILE)
+        with open(f"{columns_path}.tmp", "wb") as f:
+            for column in (self.offsets, self.doc_idx, self.chunk_ids, self.source_idx):
+                array("Q", [len(column)]).tofile(f)
+                column.tofile(f)
+            f.write(bytes(self.deleted))
+        os.replace(f"{columns_path}.tmp", columns_path)
+
+        meta_path = os.path.join(self.directory, META_FILE)
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"doc_ids": self.doc_ids, "sources": self.sources,
+                       "doc_rows": self.doc_rows}, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    @classmethod
+    def load(cls, directory):
+        store = cls(directory)
+        with open(os.path.join(directory, COLUMNS_FILE), "rb") as f:
+            for column in (store.offsets, store.doc_idx, store.chunk_ids, store.source_idx):
+                del column[:]
+                size = array("Q")
+                size.fromfile(f, 1)
+                column.fromfile(f, size[0])
+            store.deleted = bytearray(f.read())
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        store.doc_ids = meta["doc_ids"]
+        store._doc_lookup = {d: i for i, d in enumerate(store.doc_ids)}
+        store.sources = meta["sources"]
+        store._source_lookup = {s: i for i, s in enumerate(store.sources)}
+        store.doc_rows = {d: tuple(span) for d, span in meta["doc_rows"].items()}
+        store.deleted_count = sum(store.deleted)
+
+        # Drop bytes appended after the last save (crash mid-ingestion)
+        if os.path.getsize(store.blob_path) > store.offsets[-1]:
+            store._writer.truncate(store.offsets[-1])
+        return store
+
+    def freeze(self):
+        """
+        Stop writing and map the whole blob once, so reads keep working after
+        the files on disk are replaced (compaction) until the store is dropped.
+        """
+        self._writer.close()
+        if self.offsets[-1]:
+            self._view(self.offsets[-1])
+        self._frozen = True
+
+    def close(self):
+        self._writer.close()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
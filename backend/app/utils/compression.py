@@ -0,0 +1,122 @@
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))
+
+# Already compressed or event streams that must reach the client unbuffered
+SKIP_CONTENT_TYPES = ("text/event-stream", "application/pdf", "application/zip", "image/")
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick br or gzip from an Accept-Encoding header (q-values respected), or None"""
+    offered = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            offered[name] = q
+    supported = (["br"] if brotli is not None else []) + ["gzip"]
+    wildcard = offered.get("*", 0.0)
+    best = max(supported, key=lambda enc: offered.get(enc, wildcard))
+    return best if offered.get(best, wildcard) > 0 else None
+
+
+class _Compressor:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = gzip container
+
+    def chunk(self, data):
+        """Compress and flush, so each streamed chunk is decodable on arrival"""
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.flush()
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data=b""):
+        if self.encoding == "br":
+            return self._c.process(data) + self._c.finish()
+        return self._c.compress(data) + self._c.flush()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with brotli or gzip, whichever the
+    client's Accept-Encoding prefers. Small bodies are sent as is; streamed
+    bodies (NDJSON) are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        encoding = negotiate_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                response_headers = {k.lower(): v for k, v in message.get("headers", [])}
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in response_headers or content_type.startswith(SKIP_CONTENT_TYPES):
+                    state["passthrough"] = True
+                    await send(message)
+                else:
+                    state["start"] = message  # held until we see the first body chunk
+                return
+
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            start = state["start"]
+
+            if start is not None:
+                state["start"] = None
+                if not more and len(body) < self.minimum_size:
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+                state["compressor"] = _Compressor(encoding)
+                new_headers = [
+                    (k, v) for k, v in start.get("headers", [])
+                    if k.lower() not in (b"content-length", b"content-encoding")
+                ]
+                new_headers.append((b"content-encoding", encoding.encode()))
+                new_headers.append((b"vary", b"Accept-Encoding"))
+                if not more:
+                    compressed = state["compressor"].finish(body)
+                    new_headers.append((b"content-length", str(len(compressed)).encode()))
+                    await send({**start, "headers": new_headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send({**start, "headers": new_headers})
+
+            compressor = state["compressor"]
+            data = compressor.chunk(body) if more else compressor.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, wrapped_send)
@@ -0,0 +1,129 @@
+import math
+import numpy as np
+
+CHARS_PER_TOKEN = 4  # close enough for llama tokenizers on English prose
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _strip_overlap(prev_text, next_text, max_overlap=200):
+    """Return next_text without the prefix it shares with prev_text's tail"""
+    limit = min(max_overlap, len(prev_text), len(next_text))
+    for size in range(limit, 0, -1):
+        if prev_text.endswith(next_text[:size]):
+            return next_text[size:]
+    return next_text
+
+
+def merge_adjacent(chunks):
+    """
+    Merge consecutive chunks of the same document into one passage,
+    dropping the overlap the splitter repeats between them.
+    chunks: dicts with doc_id, chunk_id, text, score, vector
+    """
+    merged = []
+    for chunk in sorted(chunks, key=lambda c: (c["doc_id"], c["chunk_id"])):
+        last = merged[-1] if merged else None
+        if last and last["doc_id"] == chunk["doc_id"] and last["chunk_ids"][-1] + 1 == chunk["chunk_id"]:
+            last["text"] += _strip_overlap(last["text"], chunk["text"])
+            last["chunk_ids"].append(chunk["chunk_id"])
+            last["score"] = max(last["score"], chunk["score"])
+            last["vectors"].append(chunk["vector"])
+        else:
+            merged.append({
+                "doc_id": chunk["doc_id"],
+                "chunk_ids": [chunk["chunk_id"]],
+                "text": chunk["text"],
+                "score": chunk["score"],
+                "vectors": [chunk["vector"]],
+            })
+    for passage in merged:
+        passage["vector"] = np.mean(passage.pop("vectors"), axis=0)
+    return merged
+
+
+def mmr_order(query_vector, vectors, lambda_mult=0.7, duplicate_threshold=0.95):
+    """
+    Maximal marginal relevance over all candidates at once.
+    Returns (order, duplicates): indices in selection order, and indices
+    dropped as near-duplicates of an already selected passage.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    query = np.array(query_vector, dtype=np.float32)
+    query /= np.linalg.norm(query) + 1e-12
+
+    relevance = matrix @ query
+    pairwise = matrix @ matrix.T
+
+    n = len(matrix)
+    order, duplicates = [], []
+    remaining = np.ones(n, dtype=bool)
+    max_sim = np.full(n, -np.inf, dtype=np.float32)  # similarity to the selected set
+
+    while remaining.any():
+        redundancy = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        mmr = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        mmr[~remaining] = -np.inf
+        best = int(np.argmax(mmr))
+        remaining[best] = False
+        if max_sim[best] >= duplicate_threshold:
+            duplicates.append(best)
+            continue
+        order.append(best)
+        max_sim = np.maximum(max_sim, pairwise[best])
+    return order, duplicates
+
+
+def pack_context(query_vector, chunks, token_budget, max_passages=None,
+                 lambda_mult=0.7, duplicate_threshold=0.95):
+    """
+    Merge adjacent chunks, drop near-duplicates, then fill the token budget
+    in MMR order (relevance to the query balanced against redundancy).
+    Returns (passages, decisions) where decisions explain every candidate.
+    """
+    if not chunks:
+        return [], []
+
+    passages = merge_adjacent(chunks)
+    order, duplicates = mmr_order(
+        query_vector, [p["vector"] for p in passages], lambda_mult, duplicate_threshold
+    )
+
+    decisions = [
+        {"doc_id": passages[i]["doc_id"], "chunk_ids": passages[i]["chunk_ids"],
+         "action": "near_duplicate"}
+        for i in duplicates
+    ]
+
+    packed, used = [], 0
+    for i in order:
+        passage = passages[i]
+        tokens = estimate_tokens(passage["text"])
+        decision = {
+            "doc_id": passage["doc_id"],
+            "chunk_ids": passage["chunk_ids"],
+            "tokens": tokens,
+            "score": round(float(passage["score"]), 5),
+        }
+        if max_passages and len(packed) >= max_passages:
+            decision["action"] = "over_max_passages"
+        elif used + tokens > token_budget:
+            decision["action"] = "over_budget"
+        else:
+            decision["action"] = "packed" if len(passage["chunk_ids"]) == 1 else "merged_packed"
+            packed.append(passage)
+            used += tokens
+        decisions.append(decision)
+
+    # Never send an empty context: truncate the best passage to the budget
+    if not packed and order:
+        best = dict(passages[order[0]])
+        best["text"] = best["text"][:token_budget * CHARS_PER_TOKEN]
+        packed.append(best)
+        decisions.append({"doc_id": best["doc_id"], "chunk_ids": best["chunk_ids"],
+                          "tokens": estimate_tokens(best["text"]), "action": "truncated_packed"})
+
+    return packed, decisions
@@ -0,0 +1,105 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Budget for one /ask when the client doesn't send one; stays below the
+# frontend's 60 s axios timeout so the answer (or a 504) arrives before it gives up
+ASK_DEADLINE_MS = int(os.getenv("ASK_DEADLINE_MS", 55000))
+ASK_DEADLINE_MAX_MS = int(os.getenv("ASK_DEADLINE_MAX_MS", 120000))
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+# A try shorter than this isn't worth starting; fewer retries instead
+MIN_ATTEMPT_SEC = float(os.getenv("DEADLINE_MIN_ATTEMPT_SEC", 8))
+# Below this, agents put less context in the prompt (fewer chunks/papers,
+# no page enrichment) so the answer itself is quicker
+REDUCED_CONTEXT_SEC = float(os.getenv("DEADLINE_REDUCED_CONTEXT_SEC", 15))
+
+
+class DeadlineExceeded(Exception):
+    """Raised by a stage that has no budget left (or whose client went away); maps to 504"""
+
+    def __init__(self, stage, cancelled=False):
+        super().__init__(f"{'client disconnected' if cancelled else 'deadline exceeded'} before {stage}")
+        self.stage = stage
+        self.cancelled = cancelled
+
+
+class Deadline:
+    """
+    Time budget of one request, passed explicitly through routing and the
+    agents. Stages size their timeouts/retries from remaining(), pick cheaper
+    paths when it runs short (recorded with degrade()) and call check()
+    between steps so abandoned work stops early. cancel() ends the budget
+    immediately, e.g. when the client disconnects.
+    """
+
+    def __init__(self, budget_sec):
+        self.budget_sec = budget_sec
+        self.expires_at = time.monotonic() + budget_sec
+        self._cancelled = threading.Event()
+        self.degraded = []
+
+    @classmethod
+    def from_headers(cls, headers, default_ms=ASK_DEADLINE_MS):
+        """Budget from the X-Request-Timeout-Ms header (clamped), else the default"""
+        raw = headers.get(DEADLINE_HEADER)
+        if raw is None:
+            return cls(default_ms / 1000)
+        try:
+            ms = float(raw)
+        except ValueError:
+            raise ValueError(f"{DEADLINE_HEADER} must be a number of milliseconds")
+        if ms <= 0:
+            raise ValueError(f"{DEADLINE_HEADER} must be positive")
+        return cls(min(ms, ASK_DEADLINE_MAX_MS) / 1000)
+
+    def remaining(self):
+        if self._cancelled.is_set():
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, stage):
+        """Raise DeadlineExceeded if stage can't start any more"""
+        if self.expired():
+            raise DeadlineExceeded(stage, cancelled=self.cancelled)
+
+    def timeout(self, cap, share=1.0):
+        """Timeout for one call: at most cap, and at most share of what is left"""
+        return max(0.001, min(cap, self.remaining() * share))
+
+    def attempts(self, max_attempts, cap):
+        """
+        Split min(cap, remaining) into tries: returns (attempts, per_attempt_timeout).
+        Tries are dropped before the per-try timeout falls below MIN_ATTEMPT_SEC.
+        """
+        budget = min(cap, self.remaining())
+        attempts = max(1, min(max_attempts, int(budget // MIN_ATTEMPT_SEC)))
+        return attempts, max(0.001, budget / attempts)
+
+    def short(self, threshold_sec):
+        return self.remaining() < threshold_sec
+
+    def degrade(self, stage, action):
+        """Record a cheaper path taken because time was short"""
+        self.degraded.append({"stage": stage, "action": action, "remaining_ms": round(self.remaining() * 1000)})
+        logger.info(f"⏳ {stage}: {action} ({self.remaining():.1f}s left)")
+
+    def summary(self):
+        return {
+            "budget_ms": round(self.budget_sec * 1000),
+            "remaining_ms": round(self.remaining() * 1000),
+            "cancelled": self.cancelled,
+            "degraded": list(self.degraded),
+        }
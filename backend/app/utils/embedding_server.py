@@ -0,0 +1,376 @@
+import os
+import json
+import time
+import queue
+import socket
+import struct
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_SERVER_SOCKET = os.getenv("EMBEDDING_SERVER_SOCKET", os.path.join("data", "embedding_server.sock"))
+# Model the server process loads: "torch" or "onnx" (see EMBEDDING_BACKEND)
+EMBEDDING_SERVER_BACKEND = os.getenv("EMBEDDING_SERVER_BACKEND", "torch").lower()
+# Requests arriving within this window are embedded as one batch
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 5))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", 256))
+# Shared memory per client connection; larger results fall back to the socket
+EMBEDDING_SHM_MB = float(os.getenv("EMBEDDING_SHM_MB", 4))
+EMBEDDING_CLIENT_CONNECTIONS = int(os.getenv("EMBEDDING_CLIENT_CONNECTIONS", 4))
+# Longest a client waits on the server for one request (a wedged server
+# fails the call instead of hanging the thread)
+EMBEDDING_CLIENT_TIMEOUT = float(os.getenv("EMBEDDING_CLIENT_TIMEOUT", 60))
+
+_HEADER = struct.Struct("!I")
+
+
+def load_local_embeddings(backend, intra_op_threads=None):
+    """Load the embedding model in this process ("torch" or "onnx")"""
+    if backend == "onnx":
+        from app.utils.onnx_embeddings import OnnxEmbeddings
+        return OnnxEmbeddings(intra_op_threads=intra_op_threads)
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        # model_name='all-MiniLM-L6-v2',
+        model_name='paraphrase-MiniLM-L3-v2',
+        model_kwargs={'device': 'cpu'}
+    )
+
+
+# Wire format: 4-byte length + JSON header, optionally followed by raw
+# float32 vectors when they did not fit in the client's shared memory.
+
+def _send(sock, header, payload=b""):
+    data = json.dumps(header).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data + payload)
+
+
+def _recv_exact(sock, n):
+    chunks, remaining = [], n
+    while remaining:
+        chunk = sock.recv(min(remaining, 1 << 20))
+        if not chunk:
+            raise ConnectionError("embedding server closed the connection")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv(sock):
+    (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, length))
+
+
+async def _read_message(reader):
+    try:
+        (length,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+        return json.loads(await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def _write_message(writer, header, payload=b""):
+    data = json.dumps(header).encode("utf-8")
+    writer.write(_HEADER.pack(len(data)) + data + payload)
+
+
+class _Connection:
+    def __init__(self, socket_path, shm_bytes):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(EMBEDDING_CLIENT_TIMEOUT)
+        try:
+            self.sock.connect(socket_path)
+        except OSError as e:
+            self.sock.close()
+            raise RuntimeError(
+                f"Embedding server not reachable at {socket_path}. "
+                "Run: python -m app.utils.embedding_server"
+            ) from e
+        self.shm = shared_memory.SharedMemory(create=True, size=shm_bytes)
+        try:
+            _send(self.sock, {"op": "hello", "shm": self.shm.name, "size": shm_bytes})
+            self.dim = _recv(self.sock)["dim"]
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        self.sock.close()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class EmbeddingServerClient(Embeddings):
+    """
+    Embeddings served by the shared embedding server process.
+    Vectors come back through a shared-memory block owned by the connection
+    instead of being serialized over the socket. Up to `connections`
+    threads can have requests in flight; the server batches them together.
+    """
+
+    def __init__(self, socket_path=EMBEDDING_SERVER_SOCKET, connections=EMBEDDING_CLIENT_CONNECTIONS,
+                 shm_mb=EMBEDDING_SHM_MB):
+        self.socket_path = socket_path
+        self.shm_bytes = int(shm_mb * 1024 * 1024)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(connections)
+        self._all = []
+        self._lock = threading.Lock()
+        # Fail at load time (like a missing model) rather than on first query
+        self._release(self._open())
+
+    def _open(self):
+        conn = _Connection(self.socket_path, self.shm_bytes)
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            if conn in self._all:
+                self._all.remove(conn)
+        conn.close()
+
+    def _release(self, conn):
+        self._idle.put(conn)
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+    def embed_array(self, texts, timeout=None):
+        """
+        Embed texts; returns a float32 array (rows x dim) owned by the caller.
+        timeout: seconds to wait for the server (default EMBEDDING_CLIENT_TIMEOUT),
+        e.g. sized from a request deadline; socket.timeout when exceeded.
+        """
+        import numpy as np
+
+        with self._slots:
+            conn = self._checkout()
+            try:
+                conn.sock.settimeout(EMBEDDING_CLIENT_TIMEOUT if timeout is None else timeout)
+                _send(conn.sock, {"op": "embed", "texts": list(texts)})
+                header = _recv(conn.sock)
+                if "error" not in header:
+                    shape = (header["rows"], header["dim"])
+                    if header["inline"]:
+                        data = _recv_exact(conn.sock, shape[0] * shape[1] * 4)
+                        vectors = np.frombuffer(data, dtype=np.float32).reshape(shape)
+                    else:
+                        # Copy out before the connection (and its buffer) is reused
+                        vectors = np.ndarray(shape, dtype=np.float32, buffer=conn.shm.buf).copy()
+            except BaseException:
+                # Timed out, broken or out of step: the connection can't be reused
+                self._discard(conn)
+                raise
+            # A reported error leaves the connection in step
+            self._release(conn)
+            if "error" in header:
+                raise RuntimeError(f"Embedding server error: {header['error']}")
+            return vectors
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text, timeout=None):
+        return self.embed_array([text], timeout=timeout)[0].tolist()
+
+    def stats(self):
+        with self._slots:
+            conn = self._checkout()
+            try:
+                conn.sock.settimeout(EMBEDDING_CLIENT_TIMEOUT)
+                _send(conn.sock, {"op": "stats"})
+                result = _recv(conn.sock)
+            except BaseException:
+                self._discard(conn)
+                raise
+            self._release(conn)
+            return result
+
+    def close(self):
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            conn.close()
+
+
+class EmbeddingServer:
+    """
+    Serves one in-memory embedding model to every worker on the host over a
+    Unix socket. Requests that arrive within the batch window are embedded
+    together in a single model call.
+    """
+
+    def __init__(self, embeddings, socket_path=EMBEDDING_SERVER_SOCKET,
+                 window_ms=EMBEDDING_BATCH_WINDOW_MS, max_batch=EMBEDDING_MAX_BATCH):
+        import numpy as np
+
+        self.embeddings = embeddings
+        self.socket_path = socket_path
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.dim = len(np.asarray(embeddings.embed_query("warm up")))
+        # One model thread: the next batch collects while the current one runs
+        self._model_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-model")
+        self._queue = None
+        self.counters = {"connections": 0, "requests": 0, "texts": 0, "batches": 0, "max_batch_texts": 0, "embed_sec": 0.0}
+
+    async def _batcher(self):
+        import numpy as np
+
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            total = len(batch[0][0])
+            deadline = loop.time() + self.window
+            while total < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                total += len(item[0])
+
+            texts = [t for item_texts, _ in batch for t in item_texts]
+            start = time.perf_counter()
+            try:
+                vectors = np.asarray(
+                    await loop.run_in_executor(self._model_thread, self.embeddings.embed_documents, texts),
+                    dtype=np.float32
+                ).reshape(len(texts), self.dim)
+            except Exception as e:
+                logger.error(f"❌ Embedding batch failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.counters["embed_sec"] += time.perf_counter() - start
+            self.counters["batches"] += 1
+            self.counters["max_batch_texts"] = max(self.counters["max_batch_texts"], len(texts))
+            pos = 0
+            for item_texts, future in batch:
+                if not future.done():
+                    future.set_result(vectors[pos:pos + len(item_texts)])
+                pos += len(item_texts)
+
+    async def _handle(self, reader, writer):
+        import numpy as np
+
+        shm = None
+        self.counters["connections"] += 1
+        try:
+            while True:
+                message = await _read_message(reader)
+                if message is None:
+                    break
+                op = message.get("op")
+                if op == "hello":
+                    shm = shared_memory.SharedMemory(name=message["shm"])
+                    try:
+                        # The client owns the segment; don't let this process's
+                        # resource tracker unlink it on exit
+                        from multiprocessing import resource_tracker
+                        resource_tracker.unregister(shm._name, "shared_memory")
+                    except Exception:
+                        pass
+                    _write_message(writer, {"dim": self.dim})
+                elif op == "embed":
+                    texts = message.get("texts") or []
+                    self.counters["requests"] += 1
+                    self.counters["texts"] += len(texts)
+                    if texts:
+                        future = asyncio.get_running_loop().create_future()
+                        await self._queue.put((texts, future))
+                        try:
+                            vectors = await future
+                        except Exception as e:
+                            _write_message(writer, {"error": str(e)})
+                            await writer.drain()
+                            continue
+                    else:
+                        vectors = np.zeros((0, self.dim), dtype=np.float32)
+                    header = {"rows": vectors.shape[0], "dim": self.dim}
+                    if shm is not None and vectors.nbytes <= shm.size:
+                        np.ndarray(vectors.shape, dtype=np.float32, buffer=shm.buf)[:] = vectors
+                        _write_message(writer, {**header, "inline": False})
+                    else:
+                        _write_message(writer, {**header, "inline": True}, vectors.tobytes())
+                elif op == "stats":
+                    _write_message(writer, self.stats())
+                else:
+                    _write_message(writer, {"error": f"unknown op {op!r}"})
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.counters["connections"] -= 1
+            if shm is not None:
+                shm.close()
+            writer.close()
+
+    def stats(self):
+        batches = self.counters["batches"]
+        return {
+            **self.counters,
+            "embed_sec": round(self.counters["embed_sec"], 3),
+            "avg_batch_texts": round(self.counters["texts"] / batches, 1) if batches else 0,
+            "dim": self.dim,
+            "window_ms": self.window * 1000,
+        }
+
+    async def serve(self):
+        self._queue = asyncio.Queue()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)  # stale socket from a previous run
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        logger.info(f"🧮 Embedding server listening on {self.socket_path} "
+                    f"(dim {self.dim}, window {self.window * 1000:.0f}ms, max batch {self.max_batch})")
+        batcher = asyncio.ensure_future(self._batcher())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        prog="python -m app.utils.embedding_server",
+        description="Shared embedding model for all workers on this host (use with EMBEDDING_BACKEND=server)"
+    )
+    parser.add_argument("--socket", default=EMBEDDING_SERVER_SOCKET)
+    parser.add_argument("--backend", default=EMBEDDING_SERVER_BACKEND, choices=["torch", "onnx"])
+    parser.add_argument("--window-ms", type=float, default=EMBEDDING_BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=EMBEDDING_MAX_BATCH)
+    args = parser.parse_args()
+
+    start = time.time()
+    model = load_local_embeddings(args.backend, intra_op_threads=os.getenv("ONNX_INTRA_OP_THREADS"))
+    server = EmbeddingServer(model, args.socket, window_ms=args.window_ms, max_batch=args.max_batch)
+    logger.info(f"✅ {args.backend} model loaded in {time.time() - start:.1f}s")
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,157 @@
+import re
+import json
+import math
+import os
+from collections import Counter, defaultdict
+
+# Keep dotted/hyphenated tokens together so "4.2", "gpt-4" and "bert-base"
+# survive as exact terms (the whole point of the keyword side).
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-_][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how in is it its of on or
+that the this to was were what when where which who why will with about
+does do did can could should would into than then there these those their
+""".split())
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class KeywordIndex:
+    """
+    Incremental BM25 inverted index over PDF chunks.
+    Chunks are keyed by the same ids used in the vector store so hits from
+    both sides can be fused.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)   # term -> {chunk_key: term frequency}
+        self.doc_lengths = {}               # chunk_key -> token count
+        self.doc_chunks = defaultdict(list) # doc_id -> [chunk_key, ...]
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_id, keys, texts):
+        for key, text in zip(keys, texts):
+            tokens = tokenize(text)
+            for term, tf in Counter(tokens).items():
+                self.postings[term][key] = tf
+            self.doc_lengths[key] = len(tokens)
+            self.total_length += len(tokens)
+            self.doc_chunks[doc_id].append(key)
+
+    def remove_doc(self, doc_id):
+        """Drop every chunk of a document; returns the removed chunk keys"""
+        keys = self.doc_chunks.pop(doc_id, [])
+        if not keys:
+            return []
+        removed = set(keys)
+        for key in keys:
+            self.total_length -= self.doc_lengths.pop(key, 0)
+        for term in list(self.postings):
+            posting = self.postings[term]
+            for key in removed.intersection(posting):
+                del posting[key]
+            if not posting:
+                del self.postings[term]
+        return keys
+
+    def search(self, query, k=20, doc_id=None):
+        """Return [(chunk_key, bm25_score)] best first"""
+        allowed = set(self.doc_chunks.get(doc_id, [])) if doc_id else None
+        return bm25_search([self], query, k=k, allowed=allowed)
+
+    @classmethod
+    def merged(cls, indexes):
+        """One index holding the chunks of several (disjoint keys)"""
+        merged = cls(k1=indexes[0].k1, b=indexes[0].b)
+        for index in indexes:
+            for term, posting in index.postings.items():
+                merged.postings[term].update(posting)
+            merged.doc_lengths.update(index.doc_lengths)
+            for doc_id, keys in index.doc_chunks.items():
+                merged.doc_chunks[doc_id].extend(keys)
+            merged.total_length += index.total_length
+        return merged
+
+    def memory_bytes(self):
+        """Rough resident size; dict entries dominate"""
+        entries = sum(len(p) for p in self.postings.values())
+        return entries * 100 + len(self.postings) * 120 + len(self.doc_lengths) * 100
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            # Pairs instead of objects so integer chunk keys survive the round trip
+            json.dump({
+                "k1": self.k1,
+                "b": self.b,
+                "postings": {term: list(p.items()) for term, p in self.postings.items()},
+                "doc_lengths": list(self.doc_lengths.items()),
+                "doc_chunks": self.doc_chunks,
+            }, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        for term, pairs in data["postings"].items():
+            index.postings[term] = {key: tf for key, tf in pairs}
+        index.doc_lengths = {key: length for key, length in data["doc_lengths"]}
+        index.doc_chunks.update(data["doc_chunks"])
+        index.total_length = sum(index.doc_lengths.values())
+        return index
+
+
+def bm25_search(indexes, query, k=20, allowed=None, deleted=None, n=None, total_length=None):
+    """
+    BM25 over indexes that partition one collection (disjoint keys, document
+    frequencies summed across them). Returns [(chunk_key, score)] best first.
+    allowed: keys to consider (None = all). deleted: key -> truthy when
+    tombstoned. n / total_length: collection size and token count if some
+    keys are tombstoned (default: everything indexed).
+    """
+    if n is None:
+        n = sum(len(index.doc_lengths) for index in indexes)
+    if total_length is None:
+        total_length = sum(index.total_length for index in indexes)
+    if n <= 0 or not indexes:
+        return []
+    k1, b = indexes[0].k1, indexes[0].b
+    avg_len = max(total_length, 1) / n
+
+    scores = defaultdict(float)
+    for term in set(tokenize(query)):
+        postings = [(index, index.postings.get(term)) for index in indexes]
+        postings = [(index, p) for index, p in postings if p]
+        if not postings:
+            continue
+        df = sum(len(p) for _, p in postings)
+        idf = math.log(1 + max(n - df + 0.5, 0.5) / (df + 0.5))
+        for index, posting in postings:
+            for key, tf in posting.items():
+                if allowed is not None and key not in allowed:
+                    continue
+                if deleted is not None and deleted[key]:
+                    continue
+                norm = k1 * (1 - b + b * index.doc_lengths[key] / avg_len)
+                scores[key] += idf * tf * (k1 + 1) / (tf + norm)
+
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(*rankings, k=60):
+    """Fuse ranked key lists: score = sum(1 / (k + rank)). Best first."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
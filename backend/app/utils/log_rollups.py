@@ -0,0 +1,440 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from app.utils.logging_utils import LOG_PATH
+
+logger = logging.getLogger(__name__)
+
+LOG_ROLLUP_DB = os.getenv("LOG_ROLLUP_DB", os.path.join("data", "log_rollups.sqlite3"))
+# How often the background job picks up new decision log lines
+LOG_ROLLUP_INTERVAL_SEC = float(os.getenv("LOG_ROLLUP_INTERVAL_SEC", 30))
+# Per-minute rows older than this are pruned; older ranges are answered per hour
+LOG_ROLLUP_MINUTE_RETENTION_HOURS = float(os.getenv("LOG_ROLLUP_MINUTE_RETENTION_HOURS", 168))
+# Log bytes consumed per transaction
+LOG_ROLLUP_CHUNK_BYTES = 4 * 1024 * 1024
+PRUNE_EVERY_SEC = 3600
+
+RESOLUTIONS = {"minute": 60, "hour": 3600}
+
+# Durations go into log-spaced buckets: any percentile read back is within
+# DURATION_RELATIVE_ACCURACY of the true value, and bucket counts of
+# different minutes (or of a range's two ends) simply add and subtract
+DURATION_RELATIVE_ACCURACY = 0.02
+_GAMMA = (1 + DURATION_RELATIVE_ACCURACY) / (1 - DURATION_RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+PERCENTILES = (50, 90, 99)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_cursor (
+    log_path TEXT PRIMARY KEY,
+    inode INTEGER,
+    offset INTEGER,
+    lines INTEGER,
+    skipped INTEGER,
+    updated_at REAL
+);
+-- cum: running total of key up to and including bucket; a row exists only
+-- for buckets in which the key changed
+CREATE TABLE IF NOT EXISTS rollups (
+    resolution TEXT,
+    key TEXT,
+    bucket INTEGER,
+    cum INTEGER,
+    PRIMARY KEY (resolution, key, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_keys (key TEXT PRIMARY KEY) WITHOUT ROWID;
+"""
+
+
+def duration_bucket(ms):
+    return max(0, math.ceil(math.log(max(ms, 1.0)) / _LOG_GAMMA))
+
+
+def bucket_value(index):
+    """Representative duration (ms) of a bucket"""
+    return 2 * _GAMMA ** index / (_GAMMA + 1)
+
+
+def fallback_reason(rationale):
+    """'LLM failed, fallback to WEB_SEARCH: <error>' -> 'LLM failed, fallback to WEB_SEARCH'"""
+    if not rationale or "fallback" not in rationale.lower():
+        return None
+    return rationale.split(":", 1)[0].strip()
+
+
+def entry_keys(entry):
+    """Counter keys one decision log entry adds to"""
+    decision = entry.get("decision") or "NONE"
+    trace = entry.get("trace") if isinstance(entry.get("trace"), dict) else {}
+    keys = ["requests", f"decision|{decision}"]
+    # Entries without a status predate it and only carry agent-level errors
+    status = entry.get("status")
+    if isinstance(status, int):
+        keys.append(f"status|{status}")
+    if trace.get("error") or (isinstance(status, int) and status >= 400):
+        keys.append(f"error|{decision}")
+    routing = trace.get("routing")
+    if isinstance(routing, dict) and routing.get("method"):
+        keys.append(f"routing|{routing['method']}")
+    reason = fallback_reason(entry.get("rationale"))
+    if reason:
+        keys.append(f"fallback|{reason}")
+    if entry.get("coalesced"):
+        keys.append("coalesced")
+    if entry.get("batch"):
+        keys.append("batch")
+    duration = entry.get("duration_ms")
+    if isinstance(duration, (int, float)):
+        keys.append(f"duration|{decision}|{duration_bucket(duration)}")
+    return keys
+
+
+def percentiles(histogram):
+    """{bucket: count} -> count and p50/p90/p99 in ms"""
+    total = sum(histogram.values())
+    if not total:
+        return {"count": 0}
+    result = {"count": total}
+    ordered = sorted(histogram.items())
+    for p in PERCENTILES:
+        rank = p / 100 * (total - 1)
+        seen = 0
+        for index, count in ordered:
+            seen += count
+            if seen > rank:
+                result[f"p{p}"] = round(bucket_value(index), 1)
+                break
+    return result
+
+
+def summarize(counts):
+    """Counter deltas of one range -> stats document"""
+    requests = counts.get("requests", 0)
+    by_decision, by_status, errors, routing, fallbacks = Counter(), Counter(), Counter(), Counter(), Counter()
+    durations = defaultdict(Counter)
+    for key, n in counts.items():
+        if not n:
+            continue
+        kind, _, rest = key.partition("|")
+        if kind == "decision":
+            by_decision[rest] += n
+        elif kind == "status":
+            by_status[rest] += n
+        elif kind == "error":
+            errors[rest] += n
+        elif kind == "routing":
+            routing[rest] += n
+        elif kind == "fallback":
+            fallbacks[rest] += n
+        elif kind == "duration":
+            decision, _, index = rest.rpartition("|")
+            durations[decision][int(index)] += n
+    overall = Counter()
+    for histogram in durations.values():
+        overall.update(histogram)
+
+    def rate(n):
+        return round(n / requests, 4) if requests else None
+
+    return {
+        "requests": requests,
+        "by_decision": dict(by_decision),
+        "by_status": dict(by_status),
+        "errors": sum(errors.values()),
+        "error_rate": rate(sum(errors.values())),
+        "errors_by_decision": dict(errors),
+        "routing": dict(routing),
+        "fallbacks": sum(fallbacks.values()),
+        "fallback_rate": rate(sum(fallbacks.values())),
+        "fallback_reasons": dict(fallbacks),
+        "coalesced": counts.get("coalesced", 0),
+        "batch": counts.get("batch", 0),
+        "duration_ms": {
+            **percentiles(overall),
+            "by_decision": {decision: percentiles(h) for decision, h in durations.items()},
+        },
+    }
+
+
+class LogRollups:
+    """
+    Per-minute and per-hour counters over decision_logs.jsonl, kept in
+    SQLite. refresh() consumes the lines appended since the saved offset
+    (one writer at a time, across workers). Each counter is stored as a
+    running total, so any range is answered from the totals at its two ends:
+    one index lookup per counter key, however long the range or the log.
+    """
+
+    def __init__(self, db_path=LOG_ROLLUP_DB, log_path=LOG_PATH):
+        self.db_path = db_path
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        dirpath = os.path.dirname(db_path)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def refresh(self):
+        """Aggregate log lines appended since the last run; returns how many were consumed"""
+        with self._lock:
+            consumed = 0
+            conn = self._connect()
+            try:
+                while True:
+                    n = self._consume_chunk(conn)
+                    if n is None:
+                        break
+                    consumed += n
+                if time.time() - self._last_prune >= PRUNE_EVERY_SEC:
+                    self._prune(conn)
+                    self._last_prune = time.time()
+            finally:
+                conn.close()
+            if consumed:
+                logger.info(f"📈 Rolled up {consumed} decision log entries")
+            return consumed
+
+    def _consume_chunk(self, conn):
+        """One transaction: read up to LOG_ROLLUP_CHUNK_BYTES of complete lines; None when caught up"""
+        if not os.path.exists(self.log_path):
+            return None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Stat under the write lock: another worker may just have moved the offset
+            st = os.stat(self.log_path)
+            row = conn.execute(
+                "SELECT inode, offset, lines, skipped FROM log_cursor WHERE log_path = ?", (self.log_path,)
+            ).fetchone()
+            inode, offset, lines, skipped = row or (st.st_ino, 0, 0, 0)
+            if inode != st.st_ino or st.st_size < offset:
+                # Rotated or truncated: the file now holds new entries only
+                logger.info(f"🔄 {self.log_path} was rotated, reading it from the start")
+                inode, offset = st.st_ino, 0
+            if st.st_size == offset:
+                conn.execute("ROLLBACK")
+                return None
+            with open(self.log_path, "rb") as f:
+                f.seek(offset)
+                data = f.read(LOG_ROLLUP_CHUNK_BYTES)
+            end = data.rfind(b"\n") + 1
+            if not end:
+                if len(data) < LOG_ROLLUP_CHUNK_BYTES:
+                    # Only a partial line so far
+                    conn.execute("ROLLBACK")
+                    return None
+                # One line longer than a chunk: skip it rather than stall on it
+                end = self._line_end(offset + len(data))
+                if end is None:
+                    conn.execute("ROLLBACK")
+                    return None
+                logger.warning(f"⚠️ Skipped a {end - offset} byte line in {self.log_path}")
+                conn.execute(
+                    "INSERT OR REPLACE INTO log_cursor VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.log_path, inode, end, lines, skipped + 1, time.time())
+                )
+                conn.execute("COMMIT")
+                return 0
+
+            deltas = Counter()
+            consumed = 0
+            for line in data[:end].splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    skipped += 1
+                    continue
+                # Routing-only lines (controller's LLM replies) carry "ts", not "timestamp"
+                if not isinstance(entry, dict) or "timestamp" not in entry or "decision" not in entry:
+                    continue
+                ts = int(entry["timestamp"])
+                keys = entry_keys(entry)
+                for resolution, width in RESOLUTIONS.items():
+                    bucket = ts - ts % width
+                    for key in keys:
+                        deltas[(resolution, key, bucket)] += 1
+                consumed += 1
+
+            self._apply(conn, deltas)
+            conn.execute(
+                "INSERT OR REPLACE INTO log_cursor VALUES (?, ?, ?, ?, ?, ?)",
+                (self.log_path, inode, offset + end, lines + consumed, skipped, time.time())
+            )
+            conn.execute("COMMIT")
+            return consumed
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _line_end(self, position):
+        """Offset just past the first newline at or after position, None if there is none yet"""
+        with open(self.log_path, "rb") as f:
+            f.seek(position)
+            while True:
+                data = f.read(LOG_ROLLUP_CHUNK_BYTES)
+                if not data:
+                    return None
+                newline = data.find(b"\n")
+                if newline >= 0:
+                    return position + newline + 1
+                position += len(data)
+
+    def _apply(self, conn, deltas):
+        conn.executemany(
+            "INSERT OR IGNORE INTO rollup_keys VALUES (?)", {(key,) for _, key, _ in deltas}
+        )
+        for (resolution, key, bucket), n in deltas.items():
+            # New row starts from the key's previous total; the update then
+            # carries n into it and any later rows (late entries are rare)
+            conn.execute(
+                "INSERT OR IGNORE INTO rollups SELECT ?, ?, ?, COALESCE(("
+                "SELECT cum FROM rollups WHERE resolution = ? AND key = ? AND bucket < ? "
+                "ORDER BY bucket DESC LIMIT 1), 0)",
+                (resolution, key, bucket, resolution, key, bucket)
+            )
+            conn.execute(
+                "UPDATE rollups SET cum = cum + ? WHERE resolution = ? AND key = ? AND bucket >= ?",
+                (n, resolution, key, bucket)
+            )
+
+    def _prune(self, conn):
+        """Drop expired minute rows, keeping each key's last one (the running total before the cutoff)"""
+        cutoff = self.minute_cutoff()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "DELETE FROM rollups WHERE resolution = 'minute' AND bucket < ? AND bucket < ("
+            "SELECT MAX(r.bucket) FROM rollups r WHERE r.resolution = 'minute' "
+            "AND r.key = rollups.key AND r.bucket < ?)",
+            (cutoff, cutoff)
+        )
+        conn.execute("COMMIT")
+
+    def minute_cutoff(self):
+        return int(time.time() - LOG_ROLLUP_MINUTE_RETENTION_HOURS * 3600) // 60 * 60 + 60
+
+    def _totals_before(self, conn, resolution, bucket):
+        """Running total of every key over all buckets before bucket"""
+        rows = conn.execute(
+            "SELECT k.key, (SELECT cum FROM rollups WHERE resolution = ? AND key = k.key AND bucket < ? "
+            "ORDER BY bucket DESC LIMIT 1) FROM rollup_keys k",
+            (resolution, bucket)
+        )
+        return {key: cum or 0 for key, cum in rows}
+
+    def resolution_for(self, start):
+        return "minute" if start >= self.minute_cutoff() else "hour"
+
+    def stats(self, start, end, step=None):
+        """
+        Stats for [start, end) in unix seconds, widened to whole minutes (or
+        whole hours for ranges reaching past the minute retention).
+        step: "minute" or "hour" adds a per-bucket series over the range.
+        """
+        resolution = step or self.resolution_for(start)
+        width = RESOLUTIONS[resolution]
+        start, end = int(start) // width * width, -(-int(math.ceil(end)) // width) * width
+        if step:
+            boundaries = list(range(start, end, width)) + [end]
+        else:
+            boundaries = [start, end]
+
+        conn = self._connect()
+        try:
+            totals = [self._totals_before(conn, resolution, b) for b in boundaries]
+            cursor = conn.execute(
+                "SELECT offset, lines, skipped, updated_at FROM log_cursor WHERE log_path = ?", (self.log_path,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        def delta(a, b):
+            return {key: b[key] - a.get(key, 0) for key in b}
+
+        log = dict(zip(("offset", "entries", "skipped_lines", "updated_at"), cursor or (0, 0, 0, None)))
+        try:
+            # Not yet rolled up (the background job catches up every LOG_ROLLUP_INTERVAL_SEC)
+            log["lag_bytes"] = max(0, os.path.getsize(self.log_path) - log["offset"])
+        except OSError:
+            log["lag_bytes"] = 0
+        result = {
+            "start": start,
+            "end": end,
+            "resolution": resolution,
+            **summarize(delta(totals[0], totals[-1])),
+            "log": log,
+        }
+        if step:
+            result["series"] = [
+                {"start": boundaries[i], **summarize(delta(totals[i], totals[i + 1]))}
+                for i in range(len(boundaries) - 1)
+            ]
+        return result
+
+
+_rollups = None
+_rollups_lock = threading.Lock()
+_stop = threading.Event()
+
+
+def rollups():
+    """Process-wide LogRollups for LOG_ROLLUP_DB (created on first use)"""
+    global _rollups
+    if _rollups is None:
+        with _rollups_lock:
+            if _rollups is None:
+                _rollups = LogRollups()
+    return _rollups
+
+
+def start_background(interval=LOG_ROLLUP_INTERVAL_SEC):
+    """Refresh the rollups every interval seconds in a daemon thread"""
+    def _run():
+        while not _stop.is_set():
+            try:
+                rollups().refresh()
+            except Exception as e:
+                logger.error(f"❌ Decision log rollup failed: {str(e)}")
+            _stop.wait(interval)
+
+    _stop.clear()
+    thread = threading.Thread(target=_run, name="log-rollups", daemon=True)
+    thread.start()
+    return thread
+
+
+def stop_background():
+    _stop.set()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        prog="python -m app.utils.log_rollups",
+        description="Roll up new decision log lines, then print stats for the last --hours"
+    )
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--step", choices=sorted(RESOLUTIONS), default=None)
+    args = parser.parse_args()
+
+    store = rollups()
+    store.refresh()
+    now = time.time()
+    print(json.dumps(store.stats(now - args.hours * 3600, now, step=args.step), indent=2))
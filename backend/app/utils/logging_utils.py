@@ -15,13 +15,14 @@ def append_raw_log(obj):
     with open(LOG_PATH, "a", encoding="utf-8") as f:
         f.write(json.dumps({"ts": int(time.time()), **obj}, ensure_ascii=False) + "\n")
 
-def record_decision(decision, rationale, user_input, trace):
+def record_decision(decision, rationale, user_input, trace, **extra):
     entry = {
         "timestamp": int(time.time()),
         "decision": decision,
         "rationale": rationale,
         "input": user_input,
-        "trace": trace
+        "trace": trace,
+        **extra
     }
     append_raw_log(entry)
     return entry["timestamp"]
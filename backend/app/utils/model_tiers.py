@@ -0,0 +1,170 @@
+import os
+import re
+import time
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+GROQ_KEY = os.getenv("GROQ_API_KEY")
+
+# Two tiers: a small instant model for routing and simple lookups, the large
+# model for synthesis-heavy answers
+TIERS = {
+    "fast": os.getenv("GROQ_FAST_MODEL", "llama-3.1-8b-instant"),
+    "strong": os.getenv("GROQ_STRONG_MODEL", "llama-3.3-70b-versatile"),
+}
+
+# max_tokens per (task, tier). "routing" is the controller's one-word prompt,
+# "routing_batch" its numbered multi-question prompt.
+TOKEN_BUDGETS = {
+    "routing": {"fast": 16, "strong": 16},
+    "routing_batch": {"fast": 512, "strong": 512},
+    "WEB_SEARCH": {"fast": 768, "strong": 2048},
+    "PDF_RAG": {"fast": 1024, "strong": 2048},
+    "ARXIV": {"fast": 1500, "strong": 3000},
+}
+
+# Tasks that always use one tier unless overridden. arXiv answers are
+# multi-paper landscape analyses, so they stay on the large model.
+FIXED_TIER = {
+    "routing": "fast",
+    "routing_batch": "fast",
+    "ARXIV": "strong",
+}
+
+# With less time than this left, "strong" answers drop to the fast tier
+# (unless the request asked for a tier explicitly)
+DEADLINE_STRONG_MIN_SEC = float(os.getenv("DEADLINE_STRONG_MIN_SEC", 20))
+
+# Tries per LLM call (each one admitted separately) and the first backoff
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", 3))
+LLM_RETRY_DELAY_SEC = 1.0
+
+# Queries longer than this (in words) are treated as complex
+SIMPLE_MAX_WORDS = int(os.getenv("TIER_SIMPLE_MAX_WORDS", 12))
+
+COMPLEX_MARKERS = re.compile(
+    r"\b(compare|comparison|contrast|versus|vs\.?|difference|differences|explain|why|"
+    r"analy[sz]e|analysis|evaluate|pros and cons|trade-?offs?|implications|"
+    r"step by step|in detail|detailed|comprehensive|overview|summari[sz]e|summary)\b"
+)
+
+
+def classify_complexity(query):
+    """Cheap local guess at how much reasoning a query needs: 'simple' or 'complex'"""
+    t = (query or "").lower()
+    if COMPLEX_MARKERS.search(t):
+        return "complex"
+    if t.count("?") > 1 or len(t.split()) > SIMPLE_MAX_WORDS:
+        return "complex"
+    return "simple"
+
+
+def choose_tier(task, query=None, override=None, deadline=None):
+    """
+    Pick model and token budget for one call.
+    task: "routing", "routing_batch" or an agent name. override: "fast" | "strong".
+    deadline: a Deadline; short budgets downgrade "strong" to "fast".
+    Returns a dict that also goes into the trace.
+    """
+    complexity = classify_complexity(query) if query is not None else None
+    if override:
+        tier, reason = override, "request override"
+    elif task in FIXED_TIER:
+        tier, reason = FIXED_TIER[task], f"fixed tier for {task}"
+    else:
+        tier = "fast" if complexity == "simple" else "strong"
+        reason = f"{complexity} query"
+    if tier == "strong" and not override and deadline is not None and deadline.short(DEADLINE_STRONG_MIN_SEC):
+        tier, reason = "fast", f"{reason}; deadline short"
+        deadline.degrade(task, "fast tier instead of strong")
+    return {
+        "tier": tier,
+        "model": TIERS[tier],
+        "max_tokens": TOKEN_BUDGETS[task][tier],
+        "complexity": complexity,
+        "reason": reason,
+    }
+
+
+def validate_tier(tier):
+    """Normalize a user-supplied tier override; None/'auto' mean no override"""
+    if tier is None or tier.strip().lower() in ("", "auto"):
+        return None
+    tier = tier.strip().lower()
+    if tier not in TIERS:
+        raise ValueError(f"Unknown tier '{tier}', expected one of: auto, {', '.join(TIERS)}")
+    return tier
+
+
+@lru_cache(maxsize=128)
+def get_llm(model, max_tokens, temperature=0.0, timeout=60.0):
+    """
+    One ChatGroq client per (model, budget, temperature, timeout), reused
+    across requests. It never retries itself: invoke_tiered re-admits each try.
+    """
+    from langchain_groq import ChatGroq
+    logger.info(f"🧠 Creating ChatGroq client: {model} (max_tokens={max_tokens}, timeout={timeout}s)")
+    return ChatGroq(
+        api_key=GROQ_KEY,
+        model=model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        max_retries=0
+    )
+
+
+def invoke_tiered(choice, prompt, temperature=0.0, timeout=60.0, deadline=None):
+    """
+    Run prompt on the chosen tier under admission control, up to
+    LLM_MAX_ATTEMPTS tries; every try is admitted (and counted against the
+    Groq quotas) on its own.
+    With a deadline, `timeout` caps the whole call (all tries, queueing
+    included): each try queues for at most half of what is left, and its
+    client timeout is sized after admission from what remains, split over
+    the tries still allowed.
+    Records latency and token usage into `choice`; returns the response.
+    """
+    from app.utils.admission import AdmissionRejected, invoke_llm
+    from app.utils.deadlines import DeadlineExceeded
+    attempts, call_ends = LLM_MAX_ATTEMPTS, None
+    if deadline is not None:
+        deadline.check(f"{choice['tier']} LLM call")
+        attempts, _ = deadline.attempts(LLM_MAX_ATTEMPTS, timeout)
+        call_ends = time.monotonic() + min(timeout, deadline.remaining())
+
+    def make_llm(tries_left):
+        try_timeout = timeout
+        if call_ends is not None:
+            left = min(call_ends - time.monotonic(), deadline.remaining())
+            # Whole seconds keep the number of cached clients small
+            try_timeout = float(max(1, int(left / tries_left)))
+        return get_llm(choice["model"], choice["max_tokens"], temperature, try_timeout)
+
+    start = time.time()
+    for attempt in range(attempts):
+        admit_timeout = None
+        if call_ends is not None:
+            deadline.check(f"{choice['tier']} LLM call")
+            admit_timeout = max(0.001, min(call_ends - time.monotonic(), deadline.remaining()) * 0.5)
+        try:
+            response = invoke_llm(
+                lambda: make_llm(attempts - attempt), prompt,
+                max_tokens=choice["max_tokens"], admit_timeout=admit_timeout
+            )
+            break
+        except (AdmissionRejected, DeadlineExceeded):
+            raise
+        except Exception as e:
+            delay = LLM_RETRY_DELAY_SEC * 2 ** attempt
+            if attempt + 1 >= attempts or (call_ends is not None and call_ends - time.monotonic() <= delay):
+                raise
+            logger.warning(f"⚠️ {choice['tier']} LLM call failed ({str(e)}), retrying in {delay:.0f}s")
+            time.sleep(delay)
+    choice["latency_sec"] = round(time.time() - start, 2)
+    usage = (getattr(response, "response_metadata", None) or {}).get("token_usage", {})
+    choice["total_tokens"] = usage.get("total_tokens")
+    logger.info(f"🧠 {choice['tier']} tier ({choice['model']}) answered in {choice['latency_sec']}s")
+    return response
@@ -0,0 +1,138 @@
+import os
+import time
+import logging
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = "paraphrase-MiniLM-L3-v2"
+DEFAULT_ONNX_MODEL_DIR = os.getenv(
+    "ONNX_MODEL_DIR", os.path.join("data", "models", f"{EMBEDDING_MODEL_NAME}-onnx-int8")
+)
+ONNX_MODEL_FILE = "model_int8.onnx"
+MAX_SEQ_LENGTH = 128  # same limit sentence-transformers uses for this model
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Int8-quantized ONNX export of paraphrase-MiniLM-L3-v2 running on CPU.
+    Produces the same mean-pooled vectors as the sentence-transformers model
+    without loading PyTorch.
+    """
+
+    def __init__(self, model_dir=DEFAULT_ONNX_MODEL_DIR, intra_op_threads=None, batch_size=32):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "EMBEDDING_BACKEND=onnx requires the 'onnxruntime' and 'tokenizers' packages"
+            ) from e
+
+        model_path = os.path.join(model_dir, ONNX_MODEL_FILE)
+        tokenizer_path = os.path.join(model_dir, "tokenizer.json")
+        if not os.path.exists(model_path) or not os.path.exists(tokenizer_path):
+            raise RuntimeError(
+                f"ONNX model not found in {model_dir}. "
+                "Run: python -m app.utils.onnx_embeddings export"
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.inter_op_num_threads = 1
+        if intra_op_threads:
+            options.intra_op_num_threads = int(intra_op_threads)
+
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+
+    def _encode_batch(self, texts):
+        import numpy as np
+
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over non-padding tokens (matches sentence-transformers)
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        return summed / counts
+
+    def embed_documents(self, texts):
+        import numpy as np
+
+        if not texts:
+            return []
+        vectors = [
+            self._encode_batch(texts[i:i + self.batch_size])
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        return np.concatenate(vectors).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def export_quantized_model(output_dir=DEFAULT_ONNX_MODEL_DIR):
+    """
+    Export paraphrase-MiniLM-L3-v2 to ONNX and quantize its weights to int8.
+    Needs torch + sentence-transformers (build time only) and onnxruntime.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+    logger.info(f"📦 Exporting {EMBEDDING_MODEL_NAME} to ONNX in {output_dir}...")
+
+    st_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[n] for n in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    int8_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    logger.info(f"✅ Quantized model written to {int8_path}")
+    return int8_path
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        start = time.time()
+        export_quantized_model(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_ONNX_MODEL_DIR)
+        print(f"Export finished in {time.time() - start:.1f}s")
+    else:
+        print("Usage: python -m app.utils.onnx_embeddings export [output_dir]")
@@ -0,0 +1,296 @@
+import os
+import re
+import time
+import socket
+import asyncio
+import ipaddress
+import logging
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+
+logger = logging.getLogger(__name__)
+
+try:
+    import httpx
+    import httpcore
+except ImportError:  # enrichment is skipped without it
+    httpx = None
+
+WEB_PAGE_MAX_KB = int(os.getenv("WEB_PAGE_MAX_KB", 512))
+WEB_PAGE_CACHE_TTL = float(os.getenv("WEB_PAGE_CACHE_TTL", 900))
+WEB_PAGE_CACHE_SIZE = int(os.getenv("WEB_PAGE_CACHE_SIZE", 512))
+# Failed or timed-out URLs are not retried for this long
+WEB_PAGE_FAILURE_TTL = 60
+WEB_FETCH_MAX_CONNECTIONS = int(os.getenv("WEB_FETCH_MAX_CONNECTIONS", 20))
+WEB_FETCH_MAX_REDIRECTS = 5
+
+USER_AGENT = "Mozilla/5.0 (compatible; multi-agent-backend/1.0; +page-enrichment)"
+
+SKIP_TAGS = {"script", "style", "noscript", "nav", "header", "footer", "aside", "form", "svg", "button", "iframe", "template"}
+BLOCK_TAGS = {"p", "li", "h1", "h2", "h3", "h4", "h5", "h6", "td", "th", "pre", "blockquote", "dd", "dt", "div", "section", "article", "br", "tr"}
+MIN_BLOCK_CHARS = 40
+
+
+class _MainTextParser(HTMLParser):
+    """Collect visible text blocks, skipping scripts and page chrome"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self._current = []
+        self._skip_depth = 0
+
+    def _flush(self):
+        text = re.sub(r"\s+", " ", "".join(self._current)).strip()
+        if len(text) >= MIN_BLOCK_CHARS:
+            self.blocks.append(text)
+        self._current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._current.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def extract_main_text(html):
+    """Main text of an HTML page: substantial text blocks, one per line"""
+    parser = _MainTextParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass  # malformed markup: keep what was parsed
+    seen, blocks = set(), []
+    for block in parser.blocks:
+        if block not in seen:  # repeated boilerplate (cookie banners, etc.)
+            seen.add(block)
+            blocks.append(block)
+    return "\n".join(blocks)
+
+
+class _PageCache:
+    """URL -> extracted text with TTL, least recently used evicted first"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # url -> (expires_at, text or None)
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return False, None
+            if entry[0] < time.time():
+                del self._entries[url]
+                return False, None
+            self._entries.move_to_end(url)
+            return True, entry[1]
+
+    def put(self, url, text, ttl):
+        with self._lock:
+            self._entries[url] = (time.time() + ttl, text)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_cache = _PageCache(WEB_PAGE_CACHE_SIZE)
+_loop = None
+_client = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop():
+    """One event loop thread owns the pooled async client for the process"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="page-fetcher", daemon=True).start()
+        return _loop
+
+
+class BlockedURL(Exception):
+    """A result URL (or a redirect) points somewhere we don't fetch from"""
+
+
+def _check_destination(url):
+    if url.scheme not in ("http", "https") or not url.host:
+        raise BlockedURL(f"unsupported URL {url}")
+
+
+async def _resolve(host, port):
+    """Addresses host resolves to (IP literals resolve to themselves)"""
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0].split("%", 1)[0] for info in infos]
+
+
+async def _public_address(host, port):
+    """
+    Only fetch from public addresses: search results (and their redirects)
+    must not reach loopback, private, link-local or reserved hosts such as
+    the cloud metadata service. Returns the address to dial.
+    """
+    try:
+        addresses = [ipaddress.ip_address(a) for a in await _resolve(host, port)]
+    except (socket.gaierror, ValueError) as e:
+        raise BlockedURL(f"cannot resolve {host}: {e}")
+    if not addresses:
+        raise BlockedURL(f"cannot resolve {host}")
+    for address in addresses:
+        if not address.is_global or address.is_multicast:
+            raise BlockedURL(f"{host} resolves to non-public address {address}")
+    return str(addresses[0])
+
+
+if httpx is not None:
+    class _PublicOnlyBackend(httpcore.AsyncNetworkBackend):
+        """
+        Resolves each host once, when the connection is made, and dials the
+        vetted address itself. Checking a name and then letting the client
+        resolve it again would let a DNS-rebinding host answer with a public
+        address for the check and a private one for the connection. TLS still
+        uses the original host name for SNI and certificate checks, and the
+        Host header is untouched (both come from the request URL).
+        """
+
+        def __init__(self, backend=None):
+            self._backend = backend or httpcore.AnyIOBackend()
+
+        async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+            address = await _public_address(host, port)
+            return await self._backend.connect_tcp(
+                address, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+            )
+
+        async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+            raise BlockedURL("unix sockets are not fetched from")
+
+        async def sleep(self, seconds):
+            await self._backend.sleep(seconds)
+
+
+def _make_client(network_backend=None):
+    limits = httpx.Limits(max_connections=WEB_FETCH_MAX_CONNECTIONS, max_keepalive_connections=WEB_FETCH_MAX_CONNECTIONS // 2)
+    transport = httpx.AsyncHTTPTransport(limits=limits)
+    # httpx doesn't take a network backend; swap in a pool that dials through ours
+    transport._pool = httpcore.AsyncConnectionPool(
+        ssl_context=httpx.create_ssl_context(),
+        max_connections=limits.max_connections,
+        max_keepalive_connections=limits.max_keepalive_connections,
+        keepalive_expiry=limits.keepalive_expiry,
+        network_backend=_PublicOnlyBackend(network_backend),
+    )
+    # Redirects are followed by hand so every hop is checked; no env proxies,
+    # which would resolve (and reach) hosts on our behalf
+    return httpx.AsyncClient(
+        transport=transport,
+        trust_env=False,
+        follow_redirects=False,
+        headers={"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml"},
+        timeout=httpx.Timeout(10.0, connect=3.0),
+    )
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = _make_client()
+    return _client
+
+
+async def _fetch_one(url, client=None):
+    max_bytes = WEB_PAGE_MAX_KB * 1024
+    client = client or _get_client()
+    url = httpx.URL(url)
+    for _ in range(WEB_FETCH_MAX_REDIRECTS + 1):
+        _check_destination(url)
+        async with client.stream("GET", url) as resp:
+            if resp.is_redirect:
+                url = resp.next_request.url
+                continue
+            resp.raise_for_status()
+            if "html" not in resp.headers.get("content-type", ""):
+                return ""
+            body = bytearray()
+            async for chunk in resp.aiter_bytes():
+                body += chunk
+                if len(body) >= max_bytes:
+                    break
+            html = body.decode(resp.encoding or "utf-8", errors="replace")
+            break
+    else:
+        raise BlockedURL(f"more than {WEB_FETCH_MAX_REDIRECTS} redirects")
+    # Parsing a large page takes a while; don't hold up the other fetches
+    return await asyncio.get_running_loop().run_in_executor(None, extract_main_text, html)
+
+
+async def _fetch_all(urls, deadline_sec):
+    tasks = {asyncio.ensure_future(_fetch_one(url)): url for url in urls}
+    if not tasks:
+        return {}, [], []
+    done, pending = await asyncio.wait(tasks, timeout=deadline_sec)
+    for task in pending:
+        task.cancel()
+    pages, failed = {}, []
+    for task in done:
+        url = tasks[task]
+        if task.exception() is not None:
+            failed.append(url)
+        else:
+            pages[url] = task.result()
+    return pages, failed, [tasks[t] for t in pending]
+
+
+def fetch_pages(urls, deadline_sec):
+    """
+    Fetch and extract pages concurrently, stopping at the deadline.
+    Returns ({url: text} for pages that arrived in time or were cached, stats).
+    """
+    start = time.time()
+    stats = {"attempted": len(urls), "from_cache": 0, "fetched": 0, "failed": 0, "timed_out": 0}
+    pages, to_fetch = {}, []
+    for url in urls:
+        hit, text = _cache.get(url)
+        if hit:
+            stats["from_cache"] += 1
+            if text:
+                pages[url] = text
+        elif url.startswith(("http://", "https://")):
+            to_fetch.append(url)
+
+    if to_fetch:
+        if httpx is None:
+            logger.warning("⚠️ httpx not installed, skipping page enrichment")
+            stats["skipped"] = "httpx not installed"
+        else:
+            future = asyncio.run_coroutine_threadsafe(_fetch_all(to_fetch, deadline_sec), _background_loop())
+            fetched, failed, timed_out = future.result()
+            for url, text in fetched.items():
+                _cache.put(url, text, WEB_PAGE_CACHE_TTL)
+                if text:
+                    pages[url] = text
+            # Slow pages would otherwise cost the full deadline on every query
+            for url in failed + timed_out:
+                _cache.put(url, None, WEB_PAGE_FAILURE_TTL)
+            stats.update(fetched=len(fetched), failed=len(failed), timed_out=len(timed_out))
+
+    stats["fetch_ms"] = round((time.time() - start) * 1000, 1)
+    return pages, stats
@@ -0,0 +1,117 @@
+import os
+import re
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.utils.admission import limiter
+
+logger = logging.getLogger(__name__)
+
+ARXIV_PDF_CACHE_DIR = os.getenv("ARXIV_PDF_CACHE_DIR", os.path.join("data", "arxiv_pdfs"))
+# Point downloads at a stand-in (e.g. http://127.0.0.1:8765); the pdf_url path is kept
+ARXIV_PDF_BASE_URL = os.getenv("ARXIV_PDF_BASE_URL")
+ARXIV_PDF_MAX_MB = int(os.getenv("ARXIV_PDF_MAX_MB", 50))
+# Background downloads may wait much longer for a slot than interactive calls
+ARXIV_PDF_QUEUE_TIMEOUT = float(os.getenv("ARXIV_PDF_QUEUE_TIMEOUT", 300))
+ARXIV_PDF_POOL_SIZE = int(os.getenv("ARXIV_PDF_POOL_SIZE", 4))
+
+USER_AGENT = "multi-agent-backend/1.0 (arXiv full-text prefetch)"
+
+
+class PdfFetcher:
+    """
+    Pooled, rate-limited PDF downloader with an on-disk cache.
+    Requests share one keep-alive connection pool; every network fetch goes
+    through the "arxiv_pdf" admission limiter. Concurrent fetches of the same
+    paper are collapsed into one download.
+    """
+
+    def __init__(self, cache_dir=ARXIV_PDF_CACHE_DIR, base_url=ARXIV_PDF_BASE_URL,
+                 pool_size=ARXIV_PDF_POOL_SIZE, timeout=60.0):
+        self.cache_dir = cache_dir
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.timeout = timeout
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=2, backoff_factor=2, status_forcelist=(429, 500, 502, 503, 504)),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._locks = {}    # paper_id -> [lock, threads using it]
+        self._locks_guard = threading.Lock()
+        self.downloads = 0
+        self.cache_hits = 0
+
+    def url_for(self, pdf_url):
+        if not self.base_url:
+            return pdf_url
+        parts = urlsplit(pdf_url)
+        return self.base_url + parts.path + (f"?{parts.query}" if parts.query else "")
+
+    def cache_path(self, paper_id):
+        safe = re.sub(r"[^A-Za-z0-9._-]", "_", paper_id)
+        return os.path.join(self.cache_dir, f"{safe}.pdf")
+
+    @contextmanager
+    def _paper_lock(self, paper_id):
+        """Hold the paper's lock; the entry is dropped once no thread uses it"""
+        with self._locks_guard:
+            entry = self._locks.setdefault(paper_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[paper_id]
+
+    def fetch(self, paper_id, pdf_url):
+        """Return (path, from_cache); downloads at most once per paper"""
+        path = self.cache_path(paper_id)
+        with self._paper_lock(paper_id):
+            if os.path.exists(path):
+                self.cache_hits += 1
+                return path, True
+
+            url = self.url_for(pdf_url)
+            tmp = None
+            max_bytes = ARXIV_PDF_MAX_MB * 1024 * 1024
+            try:
+                with limiter("arxiv_pdf").admit(timeout=ARXIV_PDF_QUEUE_TIMEOUT):
+                    logger.info(f"⬇️ Fetching {url}")
+                    with self.session.get(url, timeout=self.timeout, stream=True) as resp:
+                        resp.raise_for_status()
+                        size = 0
+                        # Unique per download: other workers may be fetching the same paper
+                        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+                        with os.fdopen(fd, "wb") as f:
+                            for block in resp.iter_content(chunk_size=64 * 1024):
+                                size += len(block)
+                                if size > max_bytes:
+                                    raise ValueError(f"PDF larger than {ARXIV_PDF_MAX_MB} MB")
+                                f.write(block)
+
+                with open(tmp, "rb") as f:
+                    if f.read(5) != b"%PDF-":
+                        raise ValueError(f"{url} did not return a PDF")
+                os.replace(tmp, path)
+            finally:
+                if tmp and os.path.exists(tmp):
+                    os.remove(tmp)
+
+            self.downloads += 1
+            logger.info(f"✅ Cached {paper_id} ({size / 1024:.0f} KB)")
+            return path, False
@@ -0,0 +1,413 @@
+import os
+import json
+import uuid
+import bisect
+import logging
+import threading
+import numpy as np
+import faiss
+from app.utils.chunk_store import ChunkStore
+from app.utils.keyword_index import KeywordIndex, bm25_search
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "segments.json"
+# Single-segment layout written before segments existed (still loadable)
+FAISS_FILE = "vectors.faiss"
+KEYWORD_INDEX_FILE = "keyword_index.json"
+
+# Rebuild once this share of rows is tombstoned
+COMPACT_DELETED_RATIO = 0.25
+# The newest segment is merged into the one before it while it is at least
+# 1/MERGE_RATIO of that one's size (O(log n) segments); never more than MAX_SEGMENTS
+MERGE_RATIO = 2
+MAX_SEGMENTS = int(os.getenv("INDEX_MAX_SEGMENTS", 8))
+
+
+class Segment:
+    """
+    Immutable slice of an index: rows [base, base + size) with their FAISS
+    vectors (local ids 0..size-1) and BM25 postings (keyed by global row).
+    A document's rows always live in a single segment.
+    """
+
+    def __init__(self, base, vectors, keywords, name=None, files=None):
+        self.base = base
+        self.vectors = vectors
+        self.keywords = keywords
+        self.size = vectors.ntotal
+        self.name = name or f"seg_{base:09d}_{self.size}_{uuid.uuid4().hex[:8]}"
+        self.files = files or (f"{self.name}.faiss", f"{self.name}.keywords.json")
+
+    @property
+    def stop(self):
+        return self.base + self.size
+
+    @classmethod
+    def build(cls, base, vectors, keywords):
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+        return cls(base, index, keywords)
+
+    @classmethod
+    def merge(cls, segments):
+        """One segment holding several adjacent ones"""
+        vectors = faiss.IndexFlatL2(segments[0].vectors.d)
+        for segment in segments:
+            vectors.add(segment.vectors.reconstruct_n(0, segment.size))
+        return cls(segments[0].base, vectors, KeywordIndex.merged([s.keywords for s in segments]))
+
+    def memory_bytes(self):
+        return self.size * self.vectors.d * 4 + self.keywords.memory_bytes()
+
+    def save(self, directory):
+        faiss_path = os.path.join(directory, self.files[0])
+        faiss.write_index(self.vectors, f"{faiss_path}.tmp")
+        os.replace(f"{faiss_path}.tmp", faiss_path)
+        self.keywords.save(os.path.join(directory, self.files[1]))
+
+    @classmethod
+    def load(cls, directory, entry):
+        files = tuple(entry["files"])
+        return cls(
+            entry["base"],
+            faiss.read_index(os.path.join(directory, files[0])),
+            KeywordIndex.load(os.path.join(directory, files[1])),
+            name=entry["name"],
+            files=files,
+        )
+
+
+def find_segment(segments, row, bases=None):
+    """The segment holding row (segments are sorted and contiguous)"""
+    bases = bases if bases is not None else [s.base for s in segments]
+    return segments[bisect.bisect_right(bases, row) - 1]
+
+
+def reconstruct(segments, rows, bases=None):
+    """Stored vectors for rows, in order"""
+    out = np.empty((len(rows), segments[0].vectors.d), dtype=np.float32)
+    for i, row in enumerate(rows):
+        segment = find_segment(segments, row, bases)
+        out[i] = segment.vectors.reconstruct(int(row - segment.base))
+    return out
+
+
+def merge_tail(segments):
+    """Apply the merge policy after a segment was appended"""
+    segments = list(segments)
+    while len(segments) > 1 and (
+        segments[-1].size * MERGE_RATIO >= segments[-2].size or len(segments) > MAX_SEGMENTS
+    ):
+        segments[-2:] = [Segment.merge(segments[-2:])]
+    return tuple(segments)
+
+
+class IndexSnapshot:
+    """
+    One published version of a PdfIndex. Nothing it references changes after
+    publication (segments are immutable, chunk rows below n_rows never
+    change, tombstones and doc ranges are copies), so any number of threads
+    can search it without locking while the writer builds the next version.
+    """
+
+    def __init__(self, version, chunks, segments, deleted, deleted_count, doc_rows, deleted_tokens):
+        self.version = version
+        self.chunks = chunks
+        self.segments = segments
+        self.n_rows = segments[-1].stop if segments else 0
+        self.deleted = deleted
+        self.deleted_count = deleted_count
+        self.doc_rows = doc_rows
+        self.live_tokens = sum(s.keywords.total_length for s in segments) - deleted_tokens
+        self._bases = [s.base for s in segments]
+
+    @property
+    def ntotal(self):
+        """Number of live (searchable) chunks"""
+        return self.n_rows - self.deleted_count
+
+    def has_doc(self, doc_id):
+        return doc_id in self.doc_rows
+
+    def rows_for_doc(self, doc_id):
+        span = self.doc_rows.get(doc_id)
+        return range(*span) if span else range(0)
+
+    def is_live(self, row):
+        return 0 <= row < self.n_rows and not self.deleted[row]
+
+    def segment_for(self, row):
+        return find_segment(self.segments, row, self._bases)
+
+    def search_vectors(self, query_vector, k, doc_id=None):
+        """Return [(row, l2_distance)] for live chunks, nearest first"""
+        if self.ntotal == 0:
+            return []
+        query = np.asarray([query_vector], dtype=np.float32)
+
+        hits = []
+        if doc_id:
+            rows = self.rows_for_doc(doc_id)
+            if not rows:
+                return []
+            segment = self.segment_for(rows.start)
+            selector = faiss.IDSelectorRange(rows.start - segment.base, rows.stop - segment.base)
+            distances, ids = segment.vectors.search(
+                query, min(k, len(rows)), params=faiss.SearchParameters(sel=selector)
+            )
+            hits = [(segment.base + int(i), float(d)) for i, d in zip(ids[0], distances[0]) if i >= 0]
+        else:
+            for segment in self.segments:
+                # Over-fetch by the tombstone count so deleted rows can't crowd out k hits
+                fetch = min(k + self.deleted_count, segment.size)
+                distances, ids = segment.vectors.search(query, fetch)
+                hits.extend((segment.base + int(i), float(d)) for i, d in zip(ids[0], distances[0]) if i >= 0)
+            hits.sort(key=lambda hit: hit[1])
+
+        return [(row, dist) for row, dist in hits if not self.deleted[row]][:k]
+
+    def search_keywords(self, query, k, doc_id=None):
+        allowed = self.rows_for_doc(doc_id) if doc_id else None
+        if allowed is not None and not allowed:
+            return []
+        return bm25_search(
+            [s.keywords for s in self.segments], query, k=k, allowed=allowed,
+            deleted=self.deleted, n=self.ntotal, total_length=self.live_tokens,
+        )
+
+    def get_vectors(self, rows):
+        if not rows or not self.segments:
+            return np.zeros((0, self.segments[0].vectors.d if self.segments else 0), dtype=np.float32)
+        return reconstruct(self.segments, rows, self._bases)
+
+    def text(self, row):
+        return self.chunks.text(row)
+
+    def metadata(self, row):
+        return self.chunks.metadata(row)
+
+    def memory_bytes(self):
+        return sum(s.memory_bytes() for s in self.segments) + self.chunks.memory_bytes() + len(self.deleted)
+
+
+class PdfIndex:
+    """
+    FAISS vectors + BM25 keyword index + columnar chunk store, all keyed by
+    chunk row number and persisted together in one directory.
+
+    Single writer, many readers: writes are serialized by a lock and only
+    ever add new immutable segments (small ones are merged into new segments
+    by later writes), then publish a new IndexSnapshot with one reference
+    assignment.
+    Readers take snapshot() and search it lock-free; the read methods below
+    each use the current snapshot.
+    """
+
+    def __init__(self, directory):
+        self._init(directory, ChunkStore(directory), ())
+
+    def _init(self, directory, chunks, segments, persisted=(), deleted_tokens=0):
+        self.directory = directory
+        self.chunks = chunks          # writer side; readers go through snapshots
+        self.segments = segments
+        self._persisted = set(persisted)
+        self._deleted_tokens = deleted_tokens
+        self._write_lock = threading.RLock()
+        self._version = 0
+        self._publish()
+
+    def _publish(self):
+        self._version += 1
+        self._snapshot = IndexSnapshot(
+            self._version, self.chunks, self.segments,
+            bytes(self.chunks.deleted), self.chunks.deleted_count,
+            dict(self.chunks.doc_rows), self._deleted_tokens,
+        )
+
+    def snapshot(self):
+        """The latest published version (immutable)"""
+        return self._snapshot
+
+    def close(self):
+        """Release the chunk store's file handle and maps (no snapshot may be in use)"""
+        with self._write_lock:
+            self.chunks.close()
+
+    @property
+    def ntotal(self):
+        return self._snapshot.ntotal
+
+    def has_doc(self, doc_id):
+        return self._snapshot.has_doc(doc_id)
+
+    def search_vectors(self, query_vector, k, doc_id=None):
+        return self._snapshot.search_vectors(query_vector, k, doc_id=doc_id)
+
+    def search_keywords(self, query, k, doc_id=None):
+        return self._snapshot.search_keywords(query, k, doc_id=doc_id)
+
+    def get_vectors(self, rows):
+        return self._snapshot.get_vectors(rows)
+
+    def text(self, row):
+        return self._snapshot.text(row)
+
+    def metadata(self, row):
+        return self._snapshot.metadata(row)
+
+    def memory_bytes(self):
+        return self._snapshot.memory_bytes()
+
+    def add_document(self, doc_id, texts, vectors, chunk_ids=None, source="pdf_upload"):
+        """Add one document's chunks; re-adding a doc_id replaces it"""
+        with self._write_lock:
+            added = self._add([(doc_id, texts, vectors, chunk_ids, source)])
+            self._publish()
+            return added
+
+    def add_documents(self, docs, source="pdf_upload"):
+        """
+        Add many documents as one segment (a single FAISS insert).
+        docs: [(doc_id, texts, vectors)]; returns the number of chunks added.
+        """
+        with self._write_lock:
+            added = self._add([(doc_id, texts, vectors, None, source) for doc_id, texts, vectors in docs])
+            self._publish()
+            return added
+
+    def _add(self, docs):
+        docs = [doc for doc in docs if doc[1]]
+        if not docs:
+            return 0
+        for doc_id, *_ in docs:
+            if doc_id in self.chunks.doc_rows:
+                self._delete(doc_id)
+
+        vectors = np.concatenate([np.asarray(v, dtype=np.float32) for _, _, v, _, _ in docs])
+        # Rows are appended in the same order as the stacked vectors
+        base = len(self.chunks)
+        keywords = KeywordIndex()
+        for doc_id, texts, _, chunk_ids, source in docs:
+            start, stop = self.chunks.append(doc_id, texts, chunk_ids=chunk_ids, source=source)
+            keywords.add(doc_id, list(range(start, stop)), texts)
+        self.segments = merge_tail(self.segments + (Segment.build(base, vectors, keywords),))
+        return len(vectors)
+
+    def delete_document(self, doc_id):
+        """Tombstone a document's chunks; compacts when too many are dead"""
+        with self._write_lock:
+            removed = self._delete(doc_id)
+            if removed:
+                self._publish()
+            return removed
+
+    def _delete(self, doc_id):
+        rows = self.chunks.delete_doc(doc_id)
+        bases = [s.base for s in self.segments]
+        for row in rows:
+            self._deleted_tokens += find_segment(self.segments, row, bases).keywords.doc_lengths.get(row, 0)
+        if rows and self.chunks.deleted_count > COMPACT_DELETED_RATIO * len(self.chunks):
+            self._compact()
+        return len(rows)
+
+    def compact(self):
+        """Rewrite the store without tombstoned rows"""
+        with self._write_lock:
+            self._compact()
+            self._publish()
+
+    def _compact(self):
+        logger.info(f"🧹 Compacting index ({self.chunks.deleted_count} deleted rows)...")
+        old_chunks = self.chunks
+        live_by_doc = {
+            doc_id: [r for r in range(*span) if not old_chunks.deleted[r]]
+            for doc_id, span in old_chunks.doc_rows.items()
+        }
+
+        tmp_dir = f"{self.directory}.compact"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, name))
+
+        fresh = PdfIndex(tmp_dir)
+        fresh._add([
+            (
+                doc_id,
+                [old_chunks.text(r) for r in rows],
+                reconstruct(self.segments, rows),
+                [old_chunks.chunk_ids[r] for r in rows],
+                old_chunks.metadata(rows[0])["source"],
+            )
+            for doc_id, rows in live_by_doc.items() if rows
+        ])
+        fresh.save()
+        fresh.chunks.close()
+        # Published snapshots keep reading the old rows until they are dropped
+        old_chunks.freeze()
+
+        for name in os.listdir(tmp_dir):
+            os.replace(os.path.join(tmp_dir, name), os.path.join(self.directory, name))
+        os.rmdir(tmp_dir)
+
+        reloaded = PdfIndex.load(self.directory)
+        self.chunks, self.segments = reloaded.chunks, reloaded.segments
+        self._persisted, self._deleted_tokens = reloaded._persisted, 0
+        self._remove_stale_files()
+
+    def save(self):
+        """Write new segments, the chunk columns and the manifest"""
+        with self._write_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            for segment in self.segments:
+                if segment.name not in self._persisted:
+                    segment.save(self.directory)
+                    self._persisted.add(segment.name)
+            self.chunks.save()
+
+            manifest_path = os.path.join(self.directory, MANIFEST_FILE)
+            with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+                json.dump({"segments": [
+                    {"name": s.name, "base": s.base, "files": list(s.files)} for s in self.segments
+                ]}, f)
+            os.replace(f"{manifest_path}.tmp", manifest_path)
+            self._remove_stale_files()
+
+    def _remove_stale_files(self):
+        """Delete files of segments that were merged away"""
+        self._persisted &= {s.name for s in self.segments}
+        keep = {name for s in self.segments for name in s.files}
+        for name in os.listdir(self.directory):
+            is_segment_file = name.startswith("seg_") or name in (FAISS_FILE, KEYWORD_INDEX_FILE)
+            if is_segment_file and name not in keep:
+                os.remove(os.path.join(self.directory, name))
+
+    @classmethod
+    def exists(cls, directory):
+        return (os.path.exists(os.path.join(directory, MANIFEST_FILE))
+                or os.path.exists(os.path.join(directory, FAISS_FILE)))
+
+    @classmethod
+    def load(cls, directory):
+        chunks = ChunkStore.load(directory)
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                segments = tuple(Segment.load(directory, entry) for entry in json.load(f)["segments"])
+        else:
+            segments = (Segment(
+                0,
+                faiss.read_index(os.path.join(directory, FAISS_FILE)),
+                KeywordIndex.load(os.path.join(directory, KEYWORD_INDEX_FILE)),
+                name="legacy",
+                files=(FAISS_FILE, KEYWORD_INDEX_FILE),
+            ),)
+        deleted_tokens = sum(
+            length
+            for s in segments
+            for row, length in s.keywords.doc_lengths.items()
+            if chunks.deleted[row]
+        )
+        index = cls.__new__(cls)
+        index._init(directory, chunks, segments, persisted=[s.name for s in segments], deleted_tokens=deleted_tokens)
+        return index
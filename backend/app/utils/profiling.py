@@ -0,0 +1,224 @@
+import os
+import sys
+import hmac
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from app.utils.logging_utils import LOG_PATH
+
+logger = logging.getLogger(__name__)
+
+# Callers sending this token in X-Profile-Token get a profile and can read
+# profiles back; unset means only sampled traffic is profiled
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_PERCENT = float(os.getenv("PROFILE_SAMPLE_PERCENT", 0))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 120))
+# Profiles are written next to the decision log
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(LOG_PATH), "profiles"))
+
+# Samples of the event loop thread: it runs every request's coroutines, so
+# they are kept apart from the request's own (worker) samples
+SHARED_LOOP = "event-loop (shared)"
+
+# Profile of the request running in this context (copied into to_thread workers)
+_current = contextvars.ContextVar("request_profile", default=None)
+
+
+def has_profile_token(headers):
+    """True when PROFILE_TOKEN is set and sent in X-Profile-Token (header only: query strings end up in logs)"""
+    token = headers.get("x-profile-token")
+    return bool(PROFILE_TOKEN and token) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+def wants_profile(headers):
+    """Decide once per request; costs nothing when profiling is not configured"""
+    if has_profile_token(headers):
+        return "requested"
+    if PROFILE_SAMPLE_PERCENT > 0 and random.random() * 100 < PROFILE_SAMPLE_PERCENT:
+        return "sampled"
+    return None
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RequestProfile:
+    """
+    Wall-clock sampling profiler for one request.
+
+    A background thread snapshots sys._current_frames() every interval and
+    keeps stacks for any to_thread worker while it runs this request's work.
+    The event loop thread is sampled too, but it is shared with every other
+    request in flight, so its samples are labelled SHARED_LOOP and reported
+    apart from the request's own. Samples include time blocked on I/O, so
+    network waits show up.
+    """
+
+    def __init__(self, request_id, reason, interval_ms=PROFILE_INTERVAL_MS):
+        self.request_id = request_id
+        self.reason = reason
+        self.interval = interval_ms / 1000.0
+        self.threads = {threading.get_ident(): SHARED_LOOP}
+        self.samples = Counter()   # (thread label, collapsed stack) -> samples
+        self.spans = []
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{request_id}", daemon=True)
+        self.started = time.perf_counter()
+        self.wall_sec = None
+
+    def _run(self):
+        own = threading.get_ident()
+        deadline = self.started + PROFILE_MAX_SECONDS
+        while not self._stop.wait(self.interval) and time.perf_counter() < deadline:
+            frames = sys._current_frames()
+            for tid, label in list(self.threads.items()):
+                frame = frames.get(tid)
+                if frame is None or tid == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                self.samples[(label, ";".join(reversed(stack)))] += 1
+
+    def start(self):
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.wall_sec = round(time.perf_counter() - self.started, 4)
+
+    @contextmanager
+    def attach(self, label):
+        """Sample the calling thread while the block runs"""
+        tid = threading.get_ident()
+        self.threads[tid] = label
+        try:
+            yield
+        finally:
+            self.threads.pop(tid, None)
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter())
+
+    def add_span(self, name, start, end):
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 2),
+            "duration_ms": round((end - start) * 1000, 2),
+        })
+
+    def collapsed(self):
+        """Flamegraph-compatible collapsed stacks ("thread;frame;frame count")"""
+        return "\n".join(
+            f"{label};{stack} {count}"
+            for (label, stack), count in self.samples.most_common()
+        )
+
+    def summary(self, top=25):
+        inclusive, leaf, shared_leaf = Counter(), Counter(), Counter()
+        per_thread = Counter()
+        for (label, stack), count in self.samples.items():
+            frames = stack.split(";")
+            per_thread[label] += count
+            if label == SHARED_LOOP:
+                shared_leaf[frames[-1]] += count
+                continue
+            leaf[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        return {
+            "request_id": self.request_id,
+            "reason": self.reason,
+            "wall_sec": self.wall_sec,
+            "interval_ms": self.interval * 1000,
+            "total_samples": sum(self.samples.values()),
+            "samples_per_thread": dict(per_thread),
+            "spans": self.spans,
+            # Worker threads only: time spent on this request's work
+            "top_inclusive": inclusive.most_common(top),
+            "top_self": leaf.most_common(top),
+            # Whatever the event loop was doing, for this or any other request
+            "shared_loop_top_self": shared_leaf.most_common(top),
+        }
+
+    def save(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = profile_path(self.request_id)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({**self.summary(), "collapsed": self.collapsed()}, f, ensure_ascii=False)
+        logger.info(f"🔬 Profile for {self.request_id} saved ({sum(self.samples.values())} samples)")
+        return path
+
+
+def profile_path(request_id):
+    return os.path.join(PROFILE_DIR, f"{request_id}.json")
+
+
+def load_profile(request_id):
+    path = profile_path(request_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@contextmanager
+def profile_request(request_id, reason):
+    """
+    Profile everything run in this context (including to_thread work) until
+    exit, then save it under PROFILE_DIR as <request_id>.json
+    """
+    profile = RequestProfile(request_id, reason).start()
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        profile.stop()
+        try:
+            profile.save()
+        except OSError as e:
+            logger.warning(f"⚠️ Could not save profile {request_id}: {e}")
+
+
+def span(name):
+    """Time a section of the current request's profile (no-op when not profiling)"""
+    profile = _current.get()
+    return profile.span(name) if profile is not None else nullcontext()
+
+
+def to_thread(fn, *args, **kwargs):
+    """
+    asyncio.to_thread that, when the request is profiled, records how long
+    the call queued for a worker and samples the worker while it runs.
+    """
+    profile = _current.get()
+    if profile is None:
+        return asyncio.to_thread(fn, *args, **kwargs)
+
+    queued = time.perf_counter()
+    name = getattr(fn, "__name__", "call")
+
+    def run():
+        profile.add_span(f"to_thread queue: {name}", queued, time.perf_counter())
+        with profile.attach(f"worker: {name}"), profile.span(f"to_thread run: {name}"):
+            return fn(*args, **kwargs)
+
+    return asyncio.to_thread(run)
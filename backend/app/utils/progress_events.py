@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Every worker binds one datagram socket here; publishing sends to all of
+# them, so subscribers on any worker see events from any other worker
+PROGRESS_BUS_DIR = os.getenv("PROGRESS_BUS_DIR", os.path.join("data", "progress_bus"))
+PROGRESS_HEARTBEAT_SEC = float(os.getenv("PROGRESS_HEARTBEAT_SEC", 15))
+# Last event per doc kept for late subscribers
+LAST_EVENTS_MAX = 2048
+SUBSCRIBER_QUEUE_SIZE = 256
+MAX_DATAGRAM = 64 * 1024
+DROP_LOG_EVERY = 100
+
+TERMINAL_STATES = ("completed", "failed")
+
+_seq = itertools.count(1)
+_subscribers = defaultdict(set)   # doc_id -> {asyncio.Queue}
+_last_events = OrderedDict()      # doc_id -> last event
+_sock = None
+_sock_path = None
+_send_sock = None
+_loop = None
+_dropped = 0
+
+
+def _bus_peers():
+    try:
+        return [os.path.join(PROGRESS_BUS_DIR, n) for n in os.listdir(PROGRESS_BUS_DIR) if n.endswith(".sock")]
+    except FileNotFoundError:
+        return []
+
+
+def start():
+    """Bind this worker's bus socket and deliver incoming events on the running loop"""
+    global _sock, _sock_path, _loop
+    if _sock is not None:
+        return
+    _loop = asyncio.get_running_loop()
+    os.makedirs(PROGRESS_BUS_DIR, exist_ok=True)
+    _sock_path = os.path.join(PROGRESS_BUS_DIR, f"{os.getpid()}.sock")
+    if os.path.exists(_sock_path):
+        os.remove(_sock_path)
+    _sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    _sock.bind(_sock_path)
+    _sock.setblocking(False)
+    _loop.add_reader(_sock.fileno(), _on_datagram)
+    logger.info(f"📡 Progress bus listening on {_sock_path}")
+
+
+def stop():
+    global _sock, _loop
+    if _sock is None:
+        return
+    _loop.remove_reader(_sock.fileno())
+    _sock.close()
+    _sock = None
+    _loop = None
+    if os.path.exists(_sock_path):
+        os.remove(_sock_path)
+
+
+def _on_datagram():
+    while True:
+        try:
+            data = _sock.recv(MAX_DATAGRAM)
+        except (BlockingIOError, InterruptedError):
+            return
+        try:
+            _deliver(json.loads(data))
+        except ValueError:
+            logger.warning("⚠️ Dropped malformed progress event")
+
+
+def _deliver(event):
+    doc_id = event["doc_id"]
+    _last_events[doc_id] = event
+    _last_events.move_to_end(doc_id)
+    while len(_last_events) > LAST_EVENTS_MAX:
+        _last_events.popitem(last=False)
+    for q in list(_subscribers.get(doc_id, ())):
+        if q.full():
+            q.get_nowait()  # slow consumer: drop the oldest, keep the newest
+        q.put_nowait(event)
+
+
+def publish(doc_id, state, **fields):
+    """
+    Broadcast a progress event for doc_id to every worker. Safe to call from
+    any thread and from the event loop: sends never block (a peer whose queue
+    is full misses the event) and this worker's subscribers are served
+    directly on its loop rather than through its own socket.
+    """
+    global _send_sock, _dropped
+    event = {"doc_id": doc_id, "state": state, "ts": time.time(), "seq": next(_seq), "pid": os.getpid(), **fields}
+    data = json.dumps(event, ensure_ascii=False, default=str).encode("utf-8")
+    if _send_sock is None:
+        _send_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        _send_sock.setblocking(False)
+
+    for path in _bus_peers():
+        if path == _sock_path:
+            continue
+        try:
+            _send_sock.sendto(data, path)
+        except (BlockingIOError, InterruptedError):
+            # Peer isn't draining its socket (stalled or busy): drop rather than wait
+            _dropped += 1
+            if _dropped % DROP_LOG_EVERY == 1:
+                logger.warning(f"⚠️ Progress bus peer {path} is full, {_dropped} event(s) dropped so far")
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Worker is gone; clean up its socket file
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        except OSError as e:
+            logger.warning(f"⚠️ Progress event to {path} failed: {e}")
+
+    loop = _loop
+    if loop is not None:
+        try:
+            loop.call_soon_threadsafe(_deliver, event)
+        except RuntimeError:
+            pass  # loop closed during shutdown
+    return event
+
+
+class Subscription:
+    """Queue of progress events for a set of doc ids (use as a context manager)"""
+
+    def __init__(self, doc_ids):
+        self.doc_ids = list(dict.fromkeys(doc_ids))
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def __enter__(self):
+        for doc_id in self.doc_ids:
+            _subscribers[doc_id].add(self.queue)
+        return self
+
+    def __exit__(self, *exc):
+        for doc_id in self.doc_ids:
+            _subscribers[doc_id].discard(self.queue)
+            if not _subscribers[doc_id]:
+                del _subscribers[doc_id]
+
+    def snapshot(self):
+        """Latest known event for each doc id"""
+        return [_last_events[d] for d in self.doc_ids if d in _last_events]
+
+
+def _sse(event, name="progress"):
+    return f"id: {event['seq']}\nevent: {name}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+
+async def sse_stream(doc_ids, request, initial=None):
+    """
+    Server-sent events for doc_ids: the latest known state first, then every
+    transition. Comment heartbeats keep proxies from closing idle streams.
+    Ends once every doc reached completed/failed, or the client disconnects.
+    initial: fallback {doc_id: event} for docs the bus hasn't seen yet.
+    """
+    with Subscription(doc_ids) as sub:
+        pending = set(sub.doc_ids)
+        seen = {e["doc_id"]: e for e in sub.snapshot()}
+        for doc_id in sub.doc_ids:
+            event = seen.get(doc_id) or (initial or {}).get(doc_id)
+            if event:
+                yield _sse(event)
+                if event.get("state") in TERMINAL_STATES:
+                    pending.discard(doc_id)
+
+        while pending:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=PROGRESS_HEARTBEAT_SEC)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield f": keepalive {int(time.time())}\n\n"
+                continue
+            yield _sse(event)
+            if event.get("state") in TERMINAL_STATES:
+                pending.discard(event["doc_id"])
+        yield _sse({"doc_ids": sub.doc_ids, "seq": 0}, name="done")
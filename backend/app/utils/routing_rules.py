@@ -0,0 +1,277 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(__file__), "..", "agents", "routing_rules.json")
+ROUTING_RULES_FILE = os.getenv("ROUTING_RULES_FILE", DEFAULT_RULES_FILE)
+# How often decide() looks at the file's mtime (hot reload)
+ROUTING_RULES_CHECK_SEC = float(os.getenv("ROUTING_RULES_CHECK_SEC", 2))
+
+AGENTS = ("PDF_RAG", "WEB_SEARCH", "ARXIV")
+BOUNDARIES = ("word", "prefix", "none")
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+def normalize(text):
+    """Lowercase and collapse whitespace (keywords and queries alike)"""
+    return " ".join(text.lower().split())
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over many keywords: one left-to-right pass over
+    the text finds every occurrence of every keyword, however many there are.
+    Each keyword carries a payload and a boundary mode checked on match.
+    """
+
+    def __init__(self, keywords):
+        """keywords: [(keyword, payload, boundary)] with keyword already normalized"""
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]     # state -> [(length, payload, boundary)], including via fail links
+        for keyword, payload, boundary in keywords:
+            state = 0
+            for ch in keyword:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                state = nxt
+            self.out[state].append((len(keyword), payload, boundary))
+
+        # Breadth-first failure links; outputs of the fail state are merged in
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def __len__(self):
+        return len(self.goto)
+
+    def payloads(self, text):
+        """Set of payloads whose keyword occurs in text (respecting boundaries)"""
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+        state = 0
+        last = len(text) - 1
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state]:
+                continue
+            for length, payload, boundary in out[state]:
+                if payload in found or boundary == "none":
+                    found.add(payload)
+                    continue
+                start = i - length + 1
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if boundary == "word" and i < last and _is_word_char(text[i + 1]):
+                    continue
+                found.add(payload)
+        return found
+
+
+class Rule:
+    __slots__ = ("name", "agent", "priority", "order", "keywords", "patterns", "boundary", "when", "rationale")
+
+    def __init__(self, spec, order):
+        unknown = set(spec) - {"name", "agent", "priority", "keywords", "patterns", "boundary", "when", "rationale"}
+        if unknown:
+            raise ValueError(f"unknown field(s) {sorted(unknown)}")
+        self.name = spec["name"]
+        self.agent = spec["agent"]
+        if self.agent not in AGENTS:
+            raise ValueError(f"agent must be one of {', '.join(AGENTS)}")
+        self.priority = int(spec.get("priority", 0))
+        self.order = order
+        self.keywords = [normalize(k) for k in spec.get("keywords", []) if normalize(k)]
+        self.boundary = spec.get("boundary", "word")
+        if self.boundary not in BOUNDARIES:
+            raise ValueError(f"boundary must be one of {', '.join(BOUNDARIES)}")
+        patterns = spec.get("patterns", [])
+        self.patterns = re.compile("|".join(f"(?:{p})" for p in patterns)) if patterns else None
+        self.when = dict(spec.get("when", {}))
+        self.rationale = spec.get("rationale") or f"Rule: {self.name}"
+
+    def applies(self, context):
+        return all(context.get(key) == value for key, value in self.when.items())
+
+
+class RuleSet:
+    """
+    Compiled, immutable routing rules. All keywords of all rules share one
+    automaton, so a query is scanned once no matter how many keywords there
+    are; only rules with regex patterns (or no keywords) are checked one by one.
+    """
+
+    def __init__(self, spec, source=None):
+        specs = spec.get("rules") if isinstance(spec, dict) else None
+        if not isinstance(specs, list):
+            raise ValueError("routing rules need a top-level 'rules' list")
+        rules, names = [], set()
+        for i, rule_spec in enumerate(specs):
+            try:
+                rule = Rule(rule_spec, i)
+            except (KeyError, TypeError, ValueError, re.error) as e:
+                raise ValueError(f"rule #{i} ({rule_spec.get('name', '?') if isinstance(rule_spec, dict) else '?'}): {e}")
+            if rule.name in names:
+                raise ValueError(f"duplicate rule name '{rule.name}'")
+            names.add(rule.name)
+            rules.append(rule)
+
+        # Highest priority first; file order breaks ties
+        self.rules = sorted(rules, key=lambda r: (-r.priority, r.order))
+        for rank, rule in enumerate(self.rules):
+            rule.order = rank
+        self.source = source
+        self.pattern_count = sum(len(r.keywords) for r in self.rules)
+        self.automaton = KeywordAutomaton(
+            (keyword, rule.order, rule.boundary) for rule in self.rules for keyword in rule.keywords
+        )
+        # Rules that can match without a keyword hit
+        self.unindexed = [r.order for r in self.rules if r.patterns is not None or not r.keywords]
+
+    def match(self, text, context):
+        """Best rule for normalized text under context, or None"""
+        hits = self.automaton.payloads(text)
+        for order in sorted(hits.union(self.unindexed)):
+            rule = self.rules[order]
+            if not rule.applies(context):
+                continue
+            if order in hits:
+                return rule
+            if rule.patterns is not None:
+                if rule.patterns.search(text):
+                    return rule
+            elif not rule.keywords:
+                return rule
+        return None
+
+
+class RuleEngine:
+    """
+    Routing rules loaded from a JSON file, reloaded when the file changes
+    (checked at most every ROUTING_RULES_CHECK_SEC) and swapped atomically.
+    A broken file is logged and the previous rules stay in force.
+    Counts how often each rule decided a query.
+    """
+
+    def __init__(self, path=ROUTING_RULES_FILE, check_interval=ROUTING_RULES_CHECK_SEC):
+        self.path = os.path.abspath(path)
+        self.check_interval = check_interval
+        self.ruleset = None
+        self._mtime = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._hits_lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = 0
+        self.reloads = 0
+        self.last_error = None
+        self.loaded_at = None
+        self.compile_ms = None
+        self.reload(force=True)
+
+    def reload(self, force=False):
+        """Recompile if the file changed; returns True when new rules were loaded"""
+        with self._reload_lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                self.last_error = str(e)
+                if self.ruleset is None:
+                    raise
+                return False
+            if not force and mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            start = time.perf_counter()
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    ruleset = RuleSet(json.load(f), source=self.path)
+            except (OSError, ValueError) as e:
+                self.last_error = str(e)
+                logger.error(f"❌ Routing rules in {self.path} not loaded, keeping previous rules: {e}")
+                if self.ruleset is None:
+                    raise
+                return False
+            self.compile_ms = round((time.perf_counter() - start) * 1000, 2)
+            if self.ruleset is not None:
+                self.reloads += 1
+            self.ruleset = ruleset
+            self.loaded_at = time.time()
+            self.last_error = None
+            logger.info(f"📜 Loaded {len(ruleset.rules)} routing rules ({ruleset.pattern_count} keywords) "
+                        f"in {self.compile_ms}ms")
+            return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self.reload()
+
+    def match(self, text, **context):
+        """Best rule for text (any case/spacing) under context, or None; counts the hit"""
+        self._maybe_reload()
+        rule = self.ruleset.match(normalize(text), context)
+        with self._hits_lock:
+            if rule is None:
+                self.misses += 1
+            else:
+                self.hits[rule.name] += 1
+        return rule
+
+    def stats(self):
+        ruleset = self.ruleset
+        with self._hits_lock:
+            hits, misses = dict(self.hits), self.misses
+        return {
+            "file": self.path,
+            "rules": len(ruleset.rules),
+            "keywords": ruleset.pattern_count,
+            "automaton_states": len(ruleset.automaton),
+            "compile_ms": self.compile_ms,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+            "no_rule_matched": misses,
+            "hits": {
+                rule.name: {"agent": rule.agent, "priority": rule.priority, "hits": hits.get(rule.name, 0)}
+                for rule in ruleset.rules
+            },
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def rule_engine():
+    """Process-wide engine for ROUTING_RULES_FILE (loaded on first use)"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RuleEngine()
+    return _engine
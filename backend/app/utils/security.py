@@ -1,7 +1,11 @@
 import os
+import re
+import zipfile
 from fastapi import HTTPException, UploadFile
+from app.utils.bulk_ingest import check_zip_limits
 
 MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", 10))  # default 10 MB
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
 
 def validate_pdf_upload(file: UploadFile):
     """
@@ -27,3 +31,58 @@ def validate_pdf_upload(file: UploadFile):
         raise HTTPException(status_code=400, detail="Invalid filename.")
 
     return True
+
+def validate_session_id(session_id):
+    """
+    Validate a client-supplied session id (used as a directory name).
+    
+    Returns the default session for empty ids; raises HTTPException if invalid.
+    """
+    if not session_id:
+        return "default"
+    if not SESSION_ID_RE.match(session_id):
+        raise HTTPException(status_code=400, detail="Invalid session_id. Use 1-64 letters, digits, '-' or '_'.")
+    return session_id
+
+MAX_BULK_UPLOAD_MB = int(os.getenv("MAX_BULK_UPLOAD_MB", 200))
+BULK_INGEST_ROOT = os.getenv("BULK_INGEST_ROOT", os.path.join("data", "corpus"))
+
+def validate_zip_upload(file: UploadFile):
+    """
+    Validate an uploaded ZIP archive of PDFs (bulk ingestion).
+    
+    Raises HTTPException if validation fails.
+    """
+    if not (file.filename or "").lower().endswith(".zip"):
+        raise HTTPException(status_code=400, detail="Invalid file type. Only .zip archives are allowed.")
+
+    file.file.seek(0, os.SEEK_END)
+    size_mb = file.file.tell() / (1024 * 1024)
+    file.file.seek(0)
+    if size_mb > MAX_BULK_UPLOAD_MB:
+        raise HTTPException(status_code=400, detail=f"Archive too large. Max size is {MAX_BULK_UPLOAD_MB} MB.")
+
+    # Declared sizes and member count, before anything is extracted
+    try:
+        with zipfile.ZipFile(file.file) as archive:
+            check_zip_limits(archive)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid ZIP archive.")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{str(e)}.")
+    finally:
+        file.file.seek(0)
+
+    return True
+
+def validate_bulk_source(source):
+    """
+    Resolve a server-side directory or glob for bulk ingestion.
+    
+    Only paths inside BULK_INGEST_ROOT are allowed; raises HTTPException otherwise.
+    """
+    root = os.path.realpath(BULK_INGEST_ROOT)
+    path = os.path.realpath(os.path.join(root, source))
+    if path != root and not path.startswith(root + os.sep):
+        raise HTTPException(status_code=400, detail=f"source must be inside {BULK_INGEST_ROOT}.")
+    return path
@@ -0,0 +1,74 @@
+import os
+import json
+import logging
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, see requirements.txt
+    orjson = None
+
+# Default trace detail in /ask and /logs responses: none | summary | full
+TRACE_VERBOSITY = os.getenv("TRACE_VERBOSITY", "full").lower()
+TRACE_LEVELS = ("none", "summary", "full")
+
+# Summary mode: per-list item cap, string cap, and the fields kept for list items
+SUMMARY_MAX_ITEMS = 10
+SUMMARY_MAX_CHARS = 160
+SUMMARY_ITEM_KEYS = (
+    "title", "arxiv_id", "url", "link", "published", "position",
+    "doc_id", "chunk_id", "score", "action", "reason", "name",
+)
+
+
+def dumps(obj):
+    """Serialize to UTF-8 JSON bytes (orjson when installed, stdlib otherwise)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps() (compact, orjson if available)"""
+
+    def render(self, content):
+        return dumps(content)
+
+
+def validate_trace_level(level):
+    """Normalize a requested trace verbosity (None = TRACE_VERBOSITY); raises ValueError"""
+    level = (level or TRACE_VERBOSITY).strip().lower()
+    if level not in TRACE_LEVELS:
+        raise ValueError(f"Unknown trace verbosity '{level}', expected one of: {', '.join(TRACE_LEVELS)}")
+    return level
+
+
+def _summarize(value, depth=0):
+    if isinstance(value, str):
+        return value if len(value) <= SUMMARY_MAX_CHARS else value[:SUMMARY_MAX_CHARS] + "..."
+    if isinstance(value, dict):
+        if depth >= 3:
+            return {"keys": len(value)}
+        return {k: _summarize(v, depth + 1) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = value[:SUMMARY_MAX_ITEMS]
+        if items and all(isinstance(i, dict) for i in items):
+            # Lists of papers/sources/chunks: keep identifying fields only
+            items = [{k: _summarize(i[k], depth + 1) for k in SUMMARY_ITEM_KEYS if k in i} for i in items]
+        else:
+            items = [_summarize(i, depth + 1) for i in items]
+        if len(value) > SUMMARY_MAX_ITEMS:
+            return {"count": len(value), "items": items}
+        return items
+    return value
+
+
+def shape_trace(trace, level):
+    """Trim a trace for a response: none drops it, summary keeps the skeleton, full is unchanged"""
+    if level == "none" or trace is None:
+        return None
+    if level == "summary":
+        return _summarize(trace)
+    return trace
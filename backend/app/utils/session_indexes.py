@@ -0,0 +1,133 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from app.utils.pdf_index import PdfIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION = "default"
+# Each session's index is saved under SESSIONS_DIR/<session_id>
+SESSIONS_DIR = os.path.join(os.getenv("CHROMA_DB_DIR", os.path.join("data", "vectorstore")), "sessions")
+
+
+def session_has_index(session_id, root_dir=SESSIONS_DIR):
+    """True if the session has an index saved on disk (nothing is loaded)"""
+    return PdfIndex.exists(os.path.join(root_dir, session_id))
+
+
+class SessionIndexManager:
+    """
+    One PdfIndex per session, kept resident under a memory budget.
+
+    Least recently used sessions are dropped from memory once the budget is
+    exceeded and reloaded from disk on their next use. Every write is saved
+    by the caller, so eviction never has to flush anything. Indexes that are
+    in use (pinned) are never evicted.
+    """
+
+    def __init__(self, root_dir, memory_budget_bytes):
+        self.root_dir = root_dir
+        self.memory_budget_bytes = memory_budget_bytes
+        self._resident = OrderedDict()  # session_id -> PdfIndex, oldest first
+        self._sizes = {}                # session_id -> bytes at last measurement
+        self._pins = {}                 # session_id -> active users
+        self._loading = {}              # session_id -> Event set when its load finishes
+        self._lock = threading.RLock()
+        self.loads = 0
+        self.evictions = 0
+
+    def _dir(self, session_id):
+        return os.path.join(self.root_dir, session_id)
+
+    def has_documents(self, session_id):
+        """Cheap check used for routing; never loads an index"""
+        with self._lock:
+            index = self._resident.get(session_id)
+        if index is not None:
+            return index.ntotal > 0
+        return PdfIndex.exists(self._dir(session_id))
+
+    @contextmanager
+    def use(self, session_id, create=False):
+        """
+        Pin a session's index for the duration of a read or write.
+        Yields None when the session has no index and create is False.
+        Loading from disk happens outside the manager lock: other sessions
+        carry on, and concurrent users of the same session wait for one load.
+        """
+        index = self._acquire(session_id, create)
+        try:
+            yield index
+        finally:
+            if index is not None:
+                with self._lock:
+                    self._pins[session_id] -= 1
+                    if not self._pins[session_id]:
+                        del self._pins[session_id]
+                    if session_id in self._resident:
+                        self._sizes[session_id] = index.memory_bytes()
+                    self._evict()
+
+    def _acquire(self, session_id, create):
+        """Resident (or freshly loaded) index, pinned; None if there is none"""
+        while True:
+            with self._lock:
+                index = self._resident.get(session_id)
+                if index is not None:
+                    self._pin(session_id)
+                    return index
+                loading = self._loading.get(session_id)
+                if loading is None:
+                    loading = self._loading[session_id] = threading.Event()
+                    break
+            # Another thread is loading this session: use its result
+            loading.wait()
+
+        index, loaded = None, False
+        try:
+            directory = self._dir(session_id)
+            if PdfIndex.exists(directory):
+                index, loaded = PdfIndex.load(directory), True
+                logger.info(f"📂 Loaded session index {session_id} ({index.ntotal} chunks)")
+            elif create:
+                index = PdfIndex(directory)
+        finally:
+            with self._lock:
+                if index is not None:
+                    self.loads += loaded
+                    self._resident[session_id] = index
+                    self._sizes[session_id] = index.memory_bytes()
+                    self._pin(session_id)
+                del self._loading[session_id]
+            loading.set()
+        return index
+
+    def _pin(self, session_id):
+        self._resident.move_to_end(session_id)
+        self._pins[session_id] = self._pins.get(session_id, 0) + 1
+
+    def _evict(self):
+        """Drop cold, unpinned sessions until resident size fits the budget"""
+        total = sum(self._sizes.values())
+        for session_id in list(self._resident):
+            if total <= self.memory_budget_bytes:
+                break
+            if session_id in self._pins:
+                continue
+            # Unpinned, so nobody is reading it: release its files and maps
+            self._resident.pop(session_id).close()
+            total -= self._sizes.pop(session_id, 0)
+            self.evictions += 1
+            logger.info(f"💤 Evicted session index {session_id} to disk")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "resident_sessions": len(self._resident),
+                "resident_mb": round(sum(self._sizes.values()) / (1024 * 1024), 2),
+                "budget_mb": round(self.memory_budget_bytes / (1024 * 1024), 2),
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,66 @@
+import asyncio
+import re
+
+
+def normalize_text(text):
+    """Case/whitespace-insensitive form of a query, used for coalescing keys"""
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls: the first caller for a key runs the
+    work, callers arriving while it is in flight await the same result.
+    The work runs as its own task so one caller going away doesn't cancel it
+    for the others.
+    Each execution can carry a context (e.g. the deadline it runs on); a
+    caller whose joinable(context) is false starts a fresh execution instead,
+    which becomes the one later callers see.
+    """
+
+    def __init__(self):
+        self._inflight = {}  # key -> asyncio.Task (latest execution)
+        self._context = {}   # task -> context it runs with
+        self._waiters = {}   # task -> callers currently awaiting it
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def _finished(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        self._context.pop(task, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved: every caller may have stopped waiting
+
+    def waiters(self, key):
+        """Callers currently awaiting key's latest execution"""
+        task = self._inflight.get(key)
+        return self._waiters.get(task, 0) if task is not None else 0
+
+    def waiters_on(self, context):
+        """Callers currently awaiting the execution that runs with context"""
+        return sum(n for task, n in self._waiters.items() if self._context.get(task) is context)
+
+    async def do(self, key, fn, timeout=None, context=None, joinable=None):
+        """
+        Run fn() (a coroutine function) once per key; returns (result, shared).
+        timeout bounds this caller's wait only (asyncio.TimeoutError); the
+        execution keeps going for the others.
+        """
+        task = self._inflight.get(key)
+        if task is not None and joinable is not None and not joinable(self._context.get(task)):
+            task = None
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._context[task] = context
+            task.add_done_callback(lambda t: self._finished(key, t))
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout), shared
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
@@ -0,0 +1,116 @@
+"""
+Deep arXiv mode against a local stand-in for arxiv.org.
+
+Serves the PDFs in ../sample_pdf at /pdf/<id> from a local HTTP server
+(with optional per-request latency), points ARXIV_PDF_BASE_URL at it, and
+runs the prefetch path for fake papers: pooled + rate-limited download
+into a fresh cache, then a second pass that must be served from the cache.
+With --ingest, the downloaded PDFs also go through extract/chunk/embed
+into a throwaway session index and a follow-up retrieval is checked.
+
+Usage (from backend/):
+    python benchmarks/bench_arxiv_prefetch.py [--papers 6] [--latency-ms 200] [--ingest]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SAMPLE_DIR = os.path.join(BACKEND_ROOT, "..", "sample_pdf")
+sys.path.insert(0, BACKEND_ROOT)
+
+
+def start_stand_in(pdfs, latency_ms):
+    """Local arxiv.org stand-in: GET /pdf/<id> returns one of the sample PDFs"""
+    hits = {"count": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits["count"] += 1
+            paper_id = self.path.rsplit("/", 1)[-1]
+            if not self.path.startswith("/pdf/") or paper_id not in pdfs:
+                self.send_error(404)
+                return
+            time.sleep(latency_ms / 1000)
+            with open(pdfs[paper_id], "rb") as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, hits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--papers", type=int, default=6)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--ingest", action="store_true")
+    args = parser.parse_args()
+
+    samples = sorted(glob.glob(os.path.join(SAMPLE_DIR, "*.pdf")))
+    if not samples:
+        sys.exit(f"No sample PDFs in {SAMPLE_DIR}")
+    papers = [
+        {"arxiv_id": f"2510.{i:05d}v1", "title": os.path.basename(samples[i % len(samples)]),
+         "pdf_url": f"http://arxiv.org/pdf/2510.{i:05d}v1"}
+        for i in range(args.papers)
+    ]
+    pdfs = {p["arxiv_id"]: samples[i % len(samples)] for i, p in enumerate(papers)}
+    server, hits = start_stand_in(pdfs, args.latency_ms)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Configure before the app modules read their environment
+        os.environ["ARXIV_PDF_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+        os.environ["ARXIV_PDF_CACHE_DIR"] = os.path.join(tmp, "cache")
+        os.environ["CHROMA_DB_DIR"] = os.path.join(tmp, "vectorstore")
+        os.environ.setdefault("ARXIV_PDF_RPM", "600")
+        from app.utils.pdf_fetcher import PdfFetcher
+
+        fetcher = PdfFetcher()
+        for label in ("download", "cached"):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                results = list(pool.map(lambda p: fetcher.fetch(p["arxiv_id"], p["pdf_url"]), papers))
+            print(json.dumps({
+                "pass": label,
+                "papers": len(papers),
+                "seconds": round(time.perf_counter() - start, 3),
+                "from_cache": sum(cached for _, cached in results),
+                "upstream_requests": hits["count"],
+            }))
+
+        if args.ingest:
+            from app.agents import arxiv_agent, pdf_rag
+            start = time.perf_counter()
+            for paper in papers:
+                arxiv_agent._prefetch_one(paper, "bench")
+            print(json.dumps({
+                "pass": "ingest",
+                "seconds": round(time.perf_counter() - start, 2),
+                "indexed": sum(pdf_rag.has_document(arxiv_agent.paper_doc_id(p["arxiv_id"]), "bench") for p in papers),
+                "upstream_requests": hits["count"],
+            }))
+            with pdf_rag._sessions.use("bench") as index:
+                context, trace = pdf_rag.retrieve_context(index, "artificial intelligence")
+            print(json.dumps({"follow_up_chunks": trace.get("chunks_retrieved"), "local": context is not None}))
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+RAM benchmark: LangChain InMemoryDocstore of Documents vs the columnar ChunkStore.
+
+Each store is filled in its own process with the same synthetic chunks
+(500 chars, metadata like pdf_rag produces) and the RSS growth is reported
+per 100k chunks. Vectors are excluded: both layouts hold the same FAISS index.
+
+Usage (from backend/):
+    python benchmarks/bench_chunk_store.py [--chunks 100000]
+"""
+import argparse
+import json
+import os
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_ROOT)
+
+CHUNKS_PER_DOC = 200
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def make_chunks(n):
+    rng = random.Random(0)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(5000)]
+    for i in range(n):
+        text = " ".join(rng.choices(words, k=80))[:500]
+        yield f"upload_{1700000000 + i // CHUNKS_PER_DOC}", i % CHUNKS_PER_DOC, text
+
+
+def fill_docstore(n):
+    from langchain.schema import Document
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+
+    store = InMemoryDocstore({})
+    index_to_id = {}
+    for i, (doc_id, chunk_id, text) in enumerate(make_chunks(n)):
+        key = f"{doc_id}:{chunk_id}"
+        store.add({key: Document(page_content=text, metadata={
+            "doc_id": doc_id, "chunk_id": chunk_id, "source": "pdf_upload"})})
+        index_to_id[i] = key
+    return store, lambda row: store.search(index_to_id[row])
+
+
+def fill_chunk_store(n, directory):
+    from app.utils.chunk_store import ChunkStore
+
+    store = ChunkStore(directory)
+    batch_doc, batch = None, []
+    for doc_id, chunk_id, text in make_chunks(n):
+        if doc_id != batch_doc and batch:
+            store.append(batch_doc, batch)
+            batch = []
+        batch_doc = doc_id
+        batch.append(text)
+    if batch:
+        store.append(batch_doc, batch)
+    return store, lambda row: (store.text(row), store.metadata(row))
+
+
+def run_child(kind, n):
+    import gc
+
+    gc.collect()
+    before = current_rss_mb()
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        if kind == "docstore":
+            store, lookup = fill_docstore(n)
+        else:
+            store, lookup = fill_chunk_store(n, tmp)
+        build_sec = time.perf_counter() - start
+        gc.collect()
+        after = current_rss_mb()
+
+        rows = random.Random(1).sample(range(n), 1000)
+        start = time.perf_counter()
+        for row in rows:
+            lookup(row)
+        lookup_us = (time.perf_counter() - start) / len(rows) * 1e6
+
+    return {
+        "store": kind,
+        "chunks": n,
+        "rss_growth_mb": round(after - before, 1),
+        "rss_mb_per_100k": round((after - before) * 100000 / n, 1),
+        "build_sec": round(build_sec, 2),
+        "lookup_us": round(lookup_us, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--child", choices=["docstore", "chunk_store"])
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.chunks)))
+        return
+
+    for kind in ("docstore", "chunk_store"):
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", kind, "--chunks", str(args.chunks)],
+            cwd=BACKEND_ROOT, capture_output=True, text=True, check=True,
+        )
+        print(proc.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
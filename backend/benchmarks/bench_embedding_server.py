@@ -0,0 +1,114 @@
+"""
+Shared embedding server vs in-process model under concurrent queries.
+
+Starts `python -m app.utils.embedding_server` as a child process, then fires
+single-query embeddings from N threads (like concurrent /ask requests) at
+the in-process model and at the server, and reports queries/s plus the
+server's batching stats. Run it with several --workers to see model memory
+paid once: each worker is a separate client process.
+
+Usage (from backend/):
+    python benchmarks/bench_embedding_server.py [--threads 16] [--queries 512] [--workers 2]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_ROOT)
+
+from bench_embeddings import build_texts  # noqa: E402
+
+
+def fire(embeddings, texts, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(embeddings.embed_query, texts))
+    return len(texts) / (time.perf_counter() - start)
+
+
+def run_client(mode, socket_path, threads, n_queries):
+    """Child process: embed concurrently via the local model or the server"""
+    texts = build_texts(n_queries)
+    if mode == "local":
+        from app.utils.embedding_server import load_local_embeddings, EMBEDDING_SERVER_BACKEND
+        embeddings = load_local_embeddings(EMBEDDING_SERVER_BACKEND)
+    else:
+        from app.utils.embedding_server import EmbeddingServerClient
+        embeddings = EmbeddingServerClient(socket_path, connections=threads)
+    embeddings.embed_query("warm up")
+    qps = fire(embeddings, texts, threads)
+    return {
+        "mode": mode,
+        "queries_per_sec": round(qps, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def spawn_client(mode, socket_path, threads, n_queries):
+    return subprocess.Popen(
+        [sys.executable, __file__, "--child", mode, "--socket", socket_path,
+         "--threads", str(threads), "--queries", str(n_queries)],
+        cwd=BACKEND_ROOT, stdout=subprocess.PIPE, text=True,
+    )
+
+
+def collect(proc):
+    out, _ = proc.communicate()
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=512)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--child", choices=["local", "server"])
+    parser.add_argument("--socket")
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_client(args.child, args.socket, args.threads, args.queries)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, "embeddings.sock")
+
+        local = [spawn_client("local", socket_path, args.threads, args.queries) for _ in range(args.workers)]
+        for result in map(collect, local):
+            print(json.dumps(result))
+
+        server = subprocess.Popen(
+            [sys.executable, "-m", "app.utils.embedding_server", "--socket", socket_path],
+            cwd=BACKEND_ROOT,
+        )
+        try:
+            deadline = time.time() + 120
+            while not os.path.exists(socket_path):
+                if server.poll() is not None or time.time() > deadline:
+                    sys.exit("embedding server failed to start")
+                time.sleep(0.2)
+
+            clients = [spawn_client("server", socket_path, args.threads, args.queries) for _ in range(args.workers)]
+            for result in map(collect, clients):
+                print(json.dumps(result))
+
+            from app.utils.embedding_server import EmbeddingServerClient
+            stats = EmbeddingServerClient(socket_path, connections=1).stats()
+            server_rss = subprocess.run(
+                ["ps", "-o", "rss=", "-p", str(server.pid)], capture_output=True, text=True
+            ).stdout.strip()
+            print(json.dumps({"server": stats, "server_rss_mb": round(int(server_rss or 0) / 1024, 1)}))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Embedding backend benchmark: torch (sentence-transformers) vs int8 ONNX.
+
+Each backend runs in its own process so load time and peak RSS are not
+polluted by the other runtime. The vectors are then compared for parity.
+
+Usage (from backend/):
+    python -m app.utils.onnx_embeddings export     # once, builds the ONNX model
+    python benchmarks/bench_embeddings.py [--threads N] [--texts 512]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_ROOT)
+
+SAMPLE_SENTENCES = [
+    "Transformers use self-attention to model long-range dependencies.",
+    "Section 4.2 reports a 12% improvement in BLEU on WMT14 En-De.",
+    "The FAISS index stores dense vectors for approximate nearest neighbour search.",
+    "Reinforcement learning agents maximize expected cumulative reward.",
+    "PDF documents are split into 500 character chunks with 50 characters of overlap.",
+    "AI safety research covers alignment, robustness and interpretability.",
+    "Groq serves llama models with very low latency.",
+    "Retrieval augmented generation grounds answers in uploaded documents.",
+]
+
+
+def build_texts(n):
+    return [f"{SAMPLE_SENTENCES[i % len(SAMPLE_SENTENCES)]} (variant {i})" for i in range(n)]
+
+
+def run_backend(backend, n_texts, threads, out_path):
+    """Child process: load one backend, embed, dump vectors and stats."""
+    import numpy as np
+
+    os.environ["EMBEDDING_BACKEND"] = backend
+    if threads:
+        os.environ["ONNX_INTRA_OP_THREADS"] = str(threads)
+
+    from app.agents.pdf_rag import get_embeddings
+
+    texts = build_texts(n_texts)
+
+    start = time.perf_counter()
+    embeddings = get_embeddings()
+    embeddings.embed_query("warm up")
+    load_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    batch_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for text in texts[:64]:
+        embeddings.embed_query(text)
+    query_ms = (time.perf_counter() - start) / 64 * 1000
+
+    np.save(out_path, vectors)
+    return {
+        "backend": backend,
+        "load_sec": round(load_sec, 3),
+        "docs_per_sec": round(n_texts / batch_sec, 1),
+        "query_latency_ms": round(query_ms, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def parity(a, b):
+    import numpy as np
+
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    cos = (a * b).sum(axis=1)
+
+    # Nearest-neighbour agreement: does each query find the same top-1 doc?
+    top_a = np.argsort(-(a @ a.T), axis=1)[:, 1]
+    top_b = np.argsort(-(b @ b.T), axis=1)[:, 1]
+    return {
+        "cosine_min": round(float(cos.min()), 4),
+        "cosine_mean": round(float(cos.mean()), 4),
+        "top1_agreement": round(float((top_a == top_b).mean()), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--child", choices=["torch", "onnx"])
+    parser.add_argument("--out")
+    args = parser.parse_args()
+
+    if args.child:
+        stats = run_backend(args.child, args.texts, args.threads, args.out)
+        print(json.dumps(stats))
+        return
+
+    import numpy as np
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ("torch", "onnx"):
+            out = os.path.join(tmp, f"{backend}.npy")
+            proc = subprocess.run(
+                [sys.executable, __file__, "--child", backend, "--out", out,
+                 "--texts", str(args.texts), "--threads", str(args.threads)],
+                cwd=BACKEND_ROOT, capture_output=True, text=True, check=True,
+            )
+            results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+            results[backend]["vectors"] = np.load(out)
+
+    check = parity(results["torch"].pop("vectors"), results["onnx"].pop("vectors"))
+
+    for backend in ("torch", "onnx"):
+        print(json.dumps(results[backend]))
+    print(json.dumps({"parity": check}))
+
+    if check["cosine_min"] < 0.98:
+        print("⚠️ ONNX vectors diverge from PyTorch (cosine_min < 0.98)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Read throughput of a session index while documents are being ingested.
+
+Builds a PdfIndex from synthetic chunks (random vectors, text from a small
+vocabulary, so no embedding model is needed), then runs reader threads doing
+the retrieval path of a PDF_RAG query (vector + BM25 search, vectors and text
+of the hits) for a fixed time:
+
+  idle      - readers only
+  snapshot  - a writer adds (and saves) documents the whole time; readers
+              search published snapshots without locking
+  locked    - same load, but readers and the writer share one lock (what a
+              plain mutex around the index would give)
+
+Every read checks that its hits are live rows of the snapshot it searched
+and that their text is readable.
+
+Usage (from backend/):
+    python benchmarks/bench_index_concurrency.py [--base-chunks 20000] [--readers 4] [--seconds 5]
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_ROOT)
+
+from app.utils.pdf_index import PdfIndex  # noqa: E402
+
+VOCABULARY = [f"term{i}" for i in range(2000)]
+
+
+def synthetic_doc(rng, chunks, dim):
+    words = rng.choice(VOCABULARY, size=(chunks, 60))
+    return [" ".join(row) for row in words], rng.random((chunks, dim), dtype=np.float32)
+
+
+def reader(index, lock, stop, rng_seed, dim, latencies, errors):
+    rng = np.random.default_rng(rng_seed)
+    while not stop.is_set():
+        query_vector = rng.random(dim, dtype=np.float32)
+        query = " ".join(rng.choice(VOCABULARY, size=4))
+        start = time.perf_counter()
+        with lock:
+            snapshot = index.snapshot()
+            rows = [row for row, _ in snapshot.search_vectors(query_vector, 20)]
+            rows += [row for row, _ in snapshot.search_keywords(query, 20)]
+            hits = list(dict.fromkeys(rows))[:10]
+            snapshot.get_vectors(hits)
+            texts = [snapshot.text(row) for row in hits]
+        latencies.append(time.perf_counter() - start)
+        if not all(snapshot.is_live(row) for row in hits) or not all(texts):
+            errors.append(hits)
+
+
+def writer(index, lock, stop, rng, doc_chunks, dim, save, counts):
+    n = 0
+    while not stop.is_set():
+        texts, vectors = synthetic_doc(rng, doc_chunks, dim)
+        with lock:
+            index.add_document(f"ingest_{n}", texts, vectors)
+            if save:
+                index.save()
+        n += 1
+        counts["docs"] = n
+        counts["chunks"] = n * doc_chunks
+
+
+def run(label, index, readers, seconds, dim, lock, ingest=None):
+    stop = threading.Event()
+    latencies, errors, counts = [], [], {"docs": 0, "chunks": 0}
+    threads = [
+        threading.Thread(target=reader, args=(index, lock, stop, seed, dim, latencies, errors))
+        for seed in range(readers)
+    ]
+    if ingest:
+        threads.append(threading.Thread(target=writer, args=(index, lock, stop, *ingest, counts)))
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000
+    print(json.dumps({
+        "mode": label,
+        "readers": readers,
+        "reads_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2) if len(ms) else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 2) if len(ms) else None,
+        "inconsistent_reads": len(errors),
+        "docs_ingested": counts["docs"],
+        "chunks_per_sec_ingested": round(counts["chunks"] / elapsed, 1),
+        "segments": len(index.segments),
+        "index_chunks": index.ntotal,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-chunks", type=int, default=20000)
+    parser.add_argument("--doc-chunks", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--no-save", action="store_true", help="writer doesn't persist after each document")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    no_lock = contextlib.nullcontext()
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in ("idle", "snapshot", "locked"):
+            index = PdfIndex(os.path.join(tmp, label))
+            texts, vectors = synthetic_doc(rng, args.base_chunks, args.dim)
+            index.add_documents([("base", texts, vectors)])
+            index.save()
+            ingest = None if label == "idle" else (rng, args.doc_chunks, args.dim, not args.no_save)
+            lock = threading.Lock() if label == "locked" else no_lock
+            run(label, index, args.readers, args.seconds, args.dim, lock, ingest)
+
+
+if __name__ == "__main__":
+    main()
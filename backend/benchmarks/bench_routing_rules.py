@@ -0,0 +1,133 @@
+"""
+Cost of one keyword-routing decision as the rule set grows.
+
+Generates synthetic rule sets (keywords of one to three words from a random
+vocabulary, spread over many rules) and times matching a batch of queries:
+
+  compiled  - RuleSet from app/utils/routing_rules.py (one automaton pass)
+  naive     - per rule, any(keyword in text), in priority order
+  regex     - per rule, one compiled alternation, in priority order
+
+Every mode must pick the same rule for every query (the naive and regex
+baselines use the same word-boundary semantics as the compiled rules).
+
+Usage (from backend/):
+    python benchmarks/bench_routing_rules.py [--patterns 100 1000 10000] [--queries 2000]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_ROOT)
+
+from app.utils.routing_rules import AGENTS, RuleSet, normalize  # noqa: E402
+
+KEYWORDS_PER_RULE = 20
+
+
+def word(rng):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9)))
+
+
+def synthetic_rules(rng, patterns):
+    keywords = list(dict.fromkeys(" ".join(word(rng) for _ in range(rng.randint(1, 3))) for _ in range(patterns)))
+    rules = []
+    for n, start in enumerate(range(0, len(keywords), KEYWORDS_PER_RULE)):
+        rules.append({
+            "name": f"rule_{n}",
+            "agent": AGENTS[n % len(AGENTS)],
+            "priority": rng.randint(0, 1000),
+            "keywords": keywords[start:start + KEYWORDS_PER_RULE],
+        })
+    return {"rules": rules}, keywords
+
+
+def synthetic_queries(rng, keywords, count, hit_rate):
+    queries = []
+    for _ in range(count):
+        words = [word(rng) for _ in range(rng.randint(6, 20))]
+        if rng.random() < hit_rate:
+            words.insert(rng.randrange(len(words)), rng.choice(keywords))
+        queries.append(normalize(" ".join(words)))
+    return queries
+
+
+def naive_matcher(ruleset):
+    rules = ruleset.rules
+
+    def match(text):
+        padded = f" {text} "
+        for rule in rules:
+            if any(f" {k} " in padded for k in rule.keywords):
+                return rule
+        return None
+    return match
+
+
+def regex_matcher(ruleset):
+    compiled = [
+        (rule, re.compile(r"\b(?:" + "|".join(re.escape(k) for k in rule.keywords) + r")\b"))
+        for rule in ruleset.rules
+    ]
+
+    def match(text):
+        for rule, pattern in compiled:
+            if pattern.search(text):
+                return rule
+        return None
+    return match
+
+
+def timed(match, queries):
+    start = time.perf_counter()
+    decisions = [match(q) for q in queries]
+    elapsed = time.perf_counter() - start
+    return decisions, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patterns", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--hit-rate", type=float, default=0.5, help="share of queries containing a keyword")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for patterns in args.patterns:
+        rng = random.Random(args.seed)
+        spec, keywords = synthetic_rules(rng, patterns)
+        queries = synthetic_queries(rng, keywords, args.queries, args.hit_rate)
+
+        start = time.perf_counter()
+        ruleset = RuleSet(spec)
+        compile_ms = (time.perf_counter() - start) * 1000
+
+        modes = {
+            "compiled": lambda text: ruleset.match(text, {}),
+            "naive": naive_matcher(ruleset),
+            "regex": regex_matcher(ruleset),
+        }
+        reference = None
+        for mode, match in modes.items():
+            decisions, elapsed = timed(match, queries)
+            names = [rule.name if rule else None for rule in decisions]
+            if reference is None:
+                reference = names
+            print(json.dumps({
+                "patterns": len(keywords),
+                "rules": len(ruleset.rules),
+                "mode": mode,
+                "us_per_decision": round(elapsed / len(queries) * 1e6, 2),
+                "matched": sum(name is not None for name in names),
+                "disagreements": sum(a != b for a, b in zip(names, reference)),
+                "compile_ms": round(compile_ms, 1) if mode == "compiled" else None,
+            }))
+
+
+if __name__ == "__main__":
+    main()
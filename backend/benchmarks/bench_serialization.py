@@ -0,0 +1,141 @@
+"""
+Response payload benchmark: trace verbosity x JSON encoder x compression.
+
+Builds /ask responses shaped like the real agents' traces (arXiv with 8
+papers, web search with 5 sources, PDF RAG with packing decisions) and a
+/logs page of 100 entries, then reports payload bytes and serialization
+time per trace verbosity for the stdlib encoder and orjson (if installed),
+plus gzip/brotli sizes and times for the full payload.
+
+Usage (from backend/):
+    python benchmarks/bench_serialization.py [--repeat 200]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_ROOT)
+
+from app.utils import serialization  # noqa: E402
+from app.utils.serialization import shape_trace, TRACE_LEVELS  # noqa: E402
+
+ABSTRACT = ("We study alignment of large language models under distribution shift and "
+            "propose a robustness benchmark covering interpretability probes. ") * 6
+
+
+def arxiv_trace():
+    return {
+        "papers": [
+            {
+                "title": f"Paper {i}: Scalable Oversight for Language Models",
+                "summary": ABSTRACT[:600],
+                "authors": [f"Author {j} Lastname" for j in range(12)],
+                "url": f"http://arxiv.org/abs/2510.0{i}102v1",
+                "pdf_url": f"http://arxiv.org/pdf/2510.0{i}102v1",
+                "published": "2025-10-01",
+                "categories": ["cs.AI", "cs.LG", "cs.CL"],
+                "arxiv_id": f"2510.0{i}102v1",
+            }
+            for i in range(8)
+        ],
+        "query": "recent papers on AI safety",
+        "total_found": 8,
+        "llm_duration": 3.21,
+        "model": {"tier": "strong", "model": "llama-3.3-70b-versatile", "max_tokens": 3000, "latency_sec": 3.2},
+    }
+
+
+def web_trace():
+    return {
+        "search_engine": "SerpAPI (Google)",
+        "query": "who won the match yesterday",
+        "results_count": 5,
+        "sources": [
+            {"position": i + 1, "title": f"Result {i}", "link": f"https://example.com/{i}",
+             "snippet": ABSTRACT[:300] + "...", "displayed_link": f"example.com › {i}"}
+            for i in range(5)
+        ],
+    }
+
+
+def pdf_trace():
+    return {
+        "chunks_retrieved": 10,
+        "retrieval": "hybrid_bm25_vector_rrf",
+        "context": {
+            "token_budget": 1500,
+            "decisions": [
+                {"doc_id": "upload_1", "chunk_id": i, "action": "kept", "reason": "mmr", "score": 0.03}
+                for i in range(10)
+            ],
+        },
+        "chunks": [
+            {"doc_id": "upload_1", "chunk_id": i, "score": 0.03, "preview": ABSTRACT[:100]}
+            for i in range(10)
+        ],
+    }
+
+
+def response(trace, level):
+    return {"answer": ABSTRACT * 3, "agents_used": "ARXIV", "rationale": "Rule", "trace": shape_trace(trace, level)}
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def timed(fn, payload, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = fn(payload)
+    return out, (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    encoders = {"json": stdlib_dumps}
+    if serialization.orjson is not None:
+        encoders["orjson"] = serialization.dumps
+
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    cases = {
+        "ask_arxiv": arxiv_trace(),
+        "ask_web": web_trace(),
+        "ask_pdf": pdf_trace(),
+    }
+    logs_entries = [{"timestamp": 0, "decision": "ARXIV", "input": "q", "trace": arxiv_trace()} for _ in range(100)]
+
+    for name, trace in list(cases.items()) + [("logs_100", None)]:
+        for level in TRACE_LEVELS:
+            if trace is None:
+                payload = {"logs": [{**e, "trace": shape_trace(e["trace"], level)} for e in logs_entries]}
+            else:
+                payload = response(trace, level)
+            row = {"case": name, "trace": level}
+            for enc_name, fn in encoders.items():
+                body, us = timed(fn, payload, args.repeat)
+                row[f"{enc_name}_bytes"] = len(body)
+                row[f"{enc_name}_us"] = round(us, 1)
+
+            body = encoders.get("orjson", stdlib_dumps)(payload)
+            gz, gz_us = timed(lambda b: zlib.compress(b, 6), body, max(1, args.repeat // 10))
+            row["gzip_bytes"], row["gzip_us"] = len(gz), round(gz_us, 1)
+            if brotli is not None:
+                br, br_us = timed(lambda b: brotli.compress(b, quality=4), body, max(1, args.repeat // 10))
+                row["br_bytes"], row["br_us"] = len(br), round(br_us, 1)
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
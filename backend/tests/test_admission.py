@@ -0,0 +1,196 @@
+import threading
+import time
+import types
+
+import pytest
+
+from app.utils import admission
+from app.utils.admission import AdmissionRejected, TokenBucket, UpstreamLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission, "time", types.SimpleNamespace(monotonic=clock, time=time.time))
+    return clock
+
+
+def rejected(limiter, **kwargs):
+    with pytest.raises(AdmissionRejected) as e:
+        with limiter.admit(**kwargs):
+            pass
+    return e.value
+
+
+def assert_queue_empty(limiter):
+    assert limiter.waiting == 0
+    assert admission._waiters == 0
+
+
+def test_token_bucket_refills_continuously(clock):
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert bucket.wait_time(1, clock()) == pytest.approx(1.0)
+    clock.now += 30
+    assert bucket.wait_time(30, clock()) == 0.0
+    assert bucket.wait_time(31, clock()) == pytest.approx(1.0)
+    clock.now += 3600
+    bucket.wait_time(1, clock())
+    assert bucket.level == 60  # capped at one minute's worth
+    # A call bigger than the bucket only waits for a full bucket
+    assert bucket.wait_time(500, clock()) == 0.0
+
+
+def test_queue_full_is_503(clock):
+    limiter = UpstreamLimiter("t", max_concurrency=1, max_queue=0, queue_timeout=7.2)
+    with limiter.admit():
+        e = rejected(limiter)
+    assert (e.status_code, e.reason, e.upstream) == (503, "queue_full", "t")
+    # Waiting on a release has no known end: the queue timeout is the hint
+    assert e.retry_after == 8
+    assert limiter.rejected == {"queue_full": 1, "deadline": 0}
+    assert_queue_empty(limiter)
+
+
+def test_rate_limit_beyond_the_deadline_is_429_with_retry_after(clock):
+    limiter = UpstreamLimiter("t", max_concurrency=10, rpm=6)
+    for _ in range(6):
+        with limiter.admit():
+            pass
+    # One request per 10 s: the next is 10 s away, more than the caller can wait
+    e = rejected(limiter, timeout=5)
+    assert (e.status_code, e.reason, e.retry_after) == (429, "deadline", 10)
+    assert limiter.rejected == {"queue_full": 0, "deadline": 1}
+    assert_queue_empty(limiter)
+
+    clock.now += 10
+    with limiter.admit(timeout=5):
+        pass
+    assert limiter.admitted == 7
+
+
+def test_token_quota_retry_after(clock):
+    limiter = UpstreamLimiter("t", max_concurrency=10, tpm=600)
+    with limiter.admit(tokens=600):
+        pass
+    e = rejected(limiter, tokens=300, timeout=10)
+    assert (e.status_code, e.retry_after) == (429, 30)
+    clock.now += 30
+    with limiter.admit(tokens=300, timeout=10):
+        pass
+
+
+def test_record_tokens_refunds_and_charges(clock):
+    limiter = UpstreamLimiter("t", max_concurrency=10, tpm=1000)
+    with limiter.admit(tokens=800) as ticket:
+        assert limiter.tokens.level == 200
+        ticket.record_tokens(100)
+        assert limiter.tokens.level == 900
+        # Reporting again corrects from the last report, not the reservation
+        ticket.record_tokens(300)
+        assert limiter.tokens.level == 700
+        ticket.record_tokens(None)
+        assert limiter.tokens.level == 700
+
+    unmetered = UpstreamLimiter("u", max_concurrency=1)
+    with unmetered.admit(tokens=50) as ticket:
+        ticket.record_tokens(10)  # no TPM bucket: nothing to refund
+
+
+def test_global_waiter_cap_sheds_across_upstreams(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_MAX_WAITERS", 1)
+    first = UpstreamLimiter("first", max_concurrency=1, max_queue=8)
+    second = UpstreamLimiter("second", max_concurrency=1, max_queue=8)
+    held, queued_done = threading.Event(), threading.Event()
+    release = threading.Event()
+
+    def hold(limiter):
+        with limiter.admit():
+            held.set()
+            release.wait(5)
+
+    def queue(limiter):
+        with limiter.admit(timeout=5):
+            queued_done.set()
+
+    holders = [threading.Thread(target=hold, args=(lim,)) for lim in (first, second)]
+    for thread in holders:
+        held.clear()
+        thread.start()
+        assert held.wait(5)
+
+    waiter = threading.Thread(target=queue, args=(first,))
+    waiter.start()
+    for _ in range(500):
+        if first.waiting:
+            break
+        time.sleep(0.01)
+    assert first.waiting == 1
+    assert admission.admission_stats()["queued_total"]["waiting"] == 1
+
+    # second's own queue is empty, but the process-wide cap is reached
+    e = rejected(second)
+    assert (e.status_code, e.reason) == (503, "queue_full")
+
+    release.set()
+    waiter.join(5)
+    for thread in holders:
+        thread.join(5)
+    assert queued_done.is_set()
+    assert_queue_empty(first)
+
+
+def test_queued_caller_is_admitted_on_release():
+    limiter = UpstreamLimiter("t", max_concurrency=1, max_queue=1)
+    admitted = []
+
+    def queue():
+        with limiter.admit(timeout=5):
+            admitted.append(limiter.in_flight)
+
+    with limiter.admit():
+        thread = threading.Thread(target=queue)
+        thread.start()
+        for _ in range(500):
+            if limiter.waiting:
+                break
+            time.sleep(0.01)
+        assert limiter.stats()["queue_depth"] == 1
+        # Queue of one is full now
+        assert rejected(limiter).reason == "queue_full"
+    thread.join(5)
+    assert admitted == [1]
+    assert limiter.in_flight == 0
+    assert_queue_empty(limiter)
+
+
+def test_invoke_llm_builds_the_client_once_admitted_and_refunds(monkeypatch):
+    groq = UpstreamLimiter("groq", max_concurrency=1, tpm=10000)
+    monkeypatch.setitem(admission._limiters, "groq", groq)
+    built_while = []
+
+    class Response:
+        response_metadata = {"token_usage": {"total_tokens": 120}}
+
+    class LLM:
+        def invoke(self, prompt):
+            return Response()
+
+    def make_llm():
+        built_while.append(groq.in_flight)
+        return LLM()
+
+    response = admission.invoke_llm(make_llm, "x" * 400, max_tokens=500)
+    assert isinstance(response, Response)
+    assert built_while == [1]
+    # Reserved 100 + 500, used 120
+    assert groq.tokens.level == pytest.approx(10000 - 120, abs=1)
+    assert groq.in_flight == 0
@@ -0,0 +1,112 @@
+import os
+
+import pytest
+
+from app.utils.chunk_store import TEXT_BLOB_FILE, ChunkStore
+
+DOCS = {
+    "paper": ["Attention is all you need.", "", "Ünïcödé and emoji 🙂 survive", "x" * 5000],
+    "notes": ["second document", "with two chunks"],
+}
+
+
+def rows_of(store):
+    return [(store.text(r), store.metadata(r)) for r in range(len(store))]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    yield store
+    store.close()
+
+
+def test_append_returns_row_ranges_and_reads_back(store):
+    assert store.append("paper", DOCS["paper"]) == (0, 4)
+    assert store.append("notes", DOCS["notes"], chunk_ids=[7, 9], source="arxiv") == (4, 6)
+
+    assert len(store) == 6
+    assert [store.text(r) for r in range(6)] == DOCS["paper"] + DOCS["notes"]
+    assert store.metadata(2) == {"doc_id": "paper", "chunk_id": 2, "source": "pdf_upload"}
+    assert store.metadata(5) == {"doc_id": "notes", "chunk_id": 9, "source": "arxiv"}
+    assert store.rows_for_doc("notes") == range(4, 6)
+    # Interned: one entry per distinct value, whatever the row count
+    assert store.doc_ids == ["paper", "notes"]
+    assert store.sources == ["pdf_upload", "arxiv"]
+
+
+def test_reads_grow_the_map_as_rows_are_appended(store):
+    store.append("a", ["first"])
+    assert store.text(0) == "first"
+    store.append("b", ["second"])
+    assert store.text(1) == "second"
+
+
+def test_delete_tombstones_rows(store):
+    store.append("paper", DOCS["paper"])
+    store.append("notes", DOCS["notes"])
+    assert store.delete_doc("paper") == [0, 1, 2, 3]
+    assert store.delete_doc("paper") == []
+    assert store.deleted_count == 4
+    assert store.live_count == 2
+    assert list(store.live_rows()) == [4, 5]
+    assert not store.is_live(0) and store.is_live(5)
+    # Tombstoned rows are still readable (older snapshots may use them)
+    assert store.text(0) == DOCS["paper"][0]
+
+
+def test_save_and_reopen(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    store.append("paper", DOCS["paper"])
+    store.append("notes", DOCS["notes"], source="arxiv")
+    store.delete_doc("notes")
+    store.save()
+    expected = rows_of(store)
+    store.close()
+
+    reopened = ChunkStore.load(str(tmp_path))
+    try:
+        assert rows_of(reopened) == expected
+        assert reopened.doc_rows == {"paper": (0, 4)}
+        assert reopened.deleted_count == 2
+        # Appending after a reopen continues the columns and the blob
+        assert reopened.append("more", ["third doc"], source="arxiv") == (6, 7)
+        assert reopened.text(6) == "third doc"
+        assert reopened.sources == ["pdf_upload", "arxiv"]
+    finally:
+        reopened.close()
+
+
+def test_unsaved_appends_are_truncated_on_load(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    store.append("paper", DOCS["paper"])
+    store.save()
+    saved_size = os.path.getsize(os.path.join(str(tmp_path), TEXT_BLOB_FILE))
+    store.append("lost", ["never saved"])
+    store.close()
+
+    reopened = ChunkStore.load(str(tmp_path))
+    try:
+        assert len(reopened) == 4
+        assert os.path.getsize(reopened.blob_path) == saved_size
+        reopened.append("next", ["after the crash"])
+        assert reopened.text(4) == "after the crash"
+    finally:
+        reopened.close()
+
+
+def test_frozen_store_reads_after_files_are_replaced(tmp_path):
+    store = ChunkStore(str(tmp_path))
+    store.append("paper", DOCS["paper"])
+    store.save()
+    expected = rows_of(store)
+    store.freeze()
+
+    # Compaction replaces the blob on disk underneath a frozen store
+    replacement = os.path.join(str(tmp_path), "replacement.bin")
+    with open(replacement, "wb") as f:
+        f.write(b"something else entirely")
+    os.replace(replacement, store.blob_path)
+
+    assert rows_of(store) == expected
+    store.close()
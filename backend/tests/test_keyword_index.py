@@ -0,0 +1,113 @@
+import math
+
+import pytest
+
+from app.utils.keyword_index import KeywordIndex, bm25_search, reciprocal_rank_fusion, tokenize
+
+CORPUS = {
+    0: "BERT-base fine-tuning on GLUE reaches 84.6 average",
+    1: "GPT-4 results on MMLU and other benchmarks",
+    2: "We fine-tune BERT-base and report GLUE and SQuAD numbers; BERT-base wins",
+    3: "A survey of retrieval augmented generation",
+    4: "Retrieval with BM25 and dense vectors, fused by reciprocal rank fusion",
+}
+
+
+def build(corpus=CORPUS, doc_of=lambda key: "doc"):
+    index = KeywordIndex()
+    for key, text in corpus.items():
+        index.add(doc_of(key), [key], [text])
+    return index
+
+
+def test_tokenize_keeps_dotted_and_hyphenated_terms():
+    assert tokenize("GPT-4 scores 86.4 on the MMLU; bert_base too") == ["gpt-4", "scores", "86.4", "mmlu", "bert_base", "too"]
+
+
+def test_bm25_ranks_by_term_frequency_and_rarity():
+    index = build()
+    ranked = [key for key, _ in index.search("bert-base glue")]
+    # Both chunks match both terms; 2 repeats bert-base
+    assert ranked[:2] == [2, 0]
+    assert set(ranked) == {0, 2}
+    assert [key for key, _ in index.search("gpt-4")] == [1]
+    assert index.search("nothing matches") == []
+
+
+def test_bm25_scores_match_the_formula():
+    index = build()
+    n, avg_len = len(CORPUS), index.total_length / len(CORPUS)
+    df = 2
+    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def score(key, tf):
+        norm = index.k1 * (1 - index.b + index.b * index.doc_lengths[key] / avg_len)
+        return idf * tf * (index.k1 + 1) / (tf + norm)
+
+    scores = dict(index.search("retrieval"))
+    assert scores == pytest.approx({3: score(3, 1), 4: score(4, 1)})
+
+
+def test_rare_terms_outweigh_common_ones():
+    corpus = {i: "common word here" for i in range(10)}
+    corpus[10] = "common rare"
+    corpus[11] = "common common common"
+    ranked = [key for key, _ in build(corpus).search("common rare")]
+    assert ranked[0] == 10
+
+
+def test_doc_filter_and_removal():
+    index = build(doc_of=lambda key: "a" if key < 3 else "b")
+    assert {key for key, _ in index.search("glue retrieval", doc_id="a")} == {0, 2}
+    assert {key for key, _ in index.search("glue retrieval", doc_id="b")} == {3, 4}
+
+    assert sorted(index.remove_doc("a")) == [0, 1, 2]
+    assert {key for key, _ in index.search("glue retrieval")} == {3, 4}
+    assert "glue" not in index.postings
+    assert index.total_length == sum(len(tokenize(CORPUS[k])) for k in (3, 4))
+
+
+def test_partitioned_search_equals_one_index():
+    whole = build()
+    parts = [build({k: v for k, v in CORPUS.items() if k < 2}), build({k: v for k, v in CORPUS.items() if k >= 2})]
+    query = "bert-base glue retrieval fusion"
+    assert bm25_search(parts, query) == pytest.approx(whole.search(query))
+    assert KeywordIndex.merged(parts).search(query) == pytest.approx(whole.search(query))
+
+
+def test_tombstones_are_skipped():
+    index = build()
+    deleted = bytearray(len(CORPUS))
+    deleted[2] = 1
+    hits = bm25_search([index], "bert-base", deleted=deleted, n=4,
+                       total_length=index.total_length - index.doc_lengths[2])
+    assert [key for key, _ in hits] == [0]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = build(doc_of=lambda key: f"doc{key % 2}")
+    path = str(tmp_path / "keywords.json")
+    index.save(path)
+    loaded = KeywordIndex.load(path)
+    assert loaded.search("bert-base glue retrieval") == index.search("bert-base glue retrieval")
+    assert loaded.search("glue", doc_id="doc0") == index.search("glue", doc_id="doc0")
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    fused = reciprocal_rank_fusion(["a", "b", "c"], ["c", "a", "d"], k=60)
+    assert [key for key, _ in fused] == ["a", "c", "b", "d"]
+    assert dict(fused)["a"] == pytest.approx(1 / 61 + 1 / 62)
+    assert dict(fused)["d"] == pytest.approx(1 / 63)
+
+
+def test_rrf_ties_keep_first_seen_order():
+    # Mirror-image rankings: every key gets the same score
+    fused = reciprocal_rank_fusion(["x", "y"], ["y", "x"])
+    assert [key for key, _ in fused] == ["x", "y"]
+    assert fused[0][1] == pytest.approx(fused[1][1])
+    assert [key for key, _ in reciprocal_rank_fusion(["p"], ["q"])] == ["p", "q"]
+
+
+def test_rrf_of_nothing():
+    assert reciprocal_rank_fusion() == []
+    assert reciprocal_rank_fusion([], []) == []
@@ -0,0 +1,147 @@
+import json
+import os
+import random
+from collections import Counter
+
+import pytest
+
+from app.utils import log_rollups
+from app.utils.log_rollups import LogRollups, entry_keys, summarize
+
+DECISIONS = ["PDF_RAG", "WEB_SEARCH", "ARXIV", None]
+NOW = 1_700_000_000 // 3600 * 3600
+
+
+def make_entry(rng, ts):
+    decision = rng.choice(DECISIONS)
+    status = rng.choice([200, 200, 200, 429, 504, 500])
+    trace = {"routing": {"method": rng.choice(["rules", "llm"])}}
+    if status != 200:
+        trace = {"error": "boom"}
+    elif rng.random() < 0.1:
+        trace["error"] = "agent failed"
+    entry = {
+        "timestamp": ts,
+        "decision": decision,
+        "rationale": rng.choice(["Rule: arxiv", "LLM failed, fallback to WEB_SEARCH: timeout", None]),
+        "trace": trace,
+        "status": status,
+        "duration_ms": rng.randint(5, 30000),
+    }
+    if rng.random() < 0.2:
+        entry["batch"] = True
+    return entry
+
+
+def write_lines(path, lines, mode="a"):
+    with open(path, mode, encoding="utf-8") as f:
+        for line in lines:
+            f.write((line if isinstance(line, str) else json.dumps(line)) + "\n")
+
+
+def brute_force(entries, start, end):
+    """Stats of [start, end) by counting every entry again"""
+    counts = Counter()
+    for entry in entries:
+        if start <= entry["timestamp"] < end:
+            counts.update(entry_keys(entry))
+    return summarize(counts)
+
+
+def without_log(stats):
+    return {k: v for k, v in stats.items() if k not in ("start", "end", "resolution", "log", "series")}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Keep every synthetic minute inside the minute retention
+    monkeypatch.setattr(log_rollups.time, "time", lambda: NOW + 3600)
+    return LogRollups(db_path=str(tmp_path / "rollups.sqlite3"), log_path=str(tmp_path / "decisions.jsonl"))
+
+
+def test_ranges_match_brute_force(store):
+    rng = random.Random(0)
+    entries = [make_entry(rng, NOW - rng.randint(0, 3 * 3600)) for _ in range(2000)]
+    write_lines(store.log_path, entries[:1500])
+    assert store.refresh() == 1500
+    # Second batch includes entries for minutes already rolled up
+    write_lines(store.log_path, entries[1500:])
+    assert store.refresh() == 500
+
+    for _ in range(20):
+        start = NOW - rng.randint(0, 3 * 3600) // 60 * 60
+        end = start + rng.randint(1, 120) * 60
+        stats = store.stats(start, end)
+        assert stats["resolution"] == "minute"
+        assert without_log(stats) == without_log(brute_force(entries, start, end))
+
+    hourly = store.stats(NOW - 4 * 3600, NOW + 3600, step="hour")
+    for bucket in hourly["series"]:
+        expected = brute_force(entries, bucket["start"], bucket["start"] + 3600)
+        assert without_log(bucket) == without_log(expected)
+
+
+def test_failed_requests_count_as_errors(store):
+    write_lines(store.log_path, [
+        {"timestamp": NOW, "decision": "PDF_RAG", "trace": {}, "status": 200},
+        {"timestamp": NOW, "decision": None, "trace": {"error": "queue full"}, "status": 429},
+        {"timestamp": NOW, "decision": None, "trace": {}, "status": 504},
+    ])
+    store.refresh()
+    stats = store.stats(NOW, NOW + 60)
+    assert stats["errors"] == 2
+    assert stats["by_status"] == {"200": 1, "429": 1, "504": 1}
+    assert stats["errors_by_decision"] == {"NONE": 2}
+
+
+def test_skips_bad_and_oversized_lines(store, monkeypatch):
+    monkeypatch.setattr(log_rollups, "LOG_ROLLUP_CHUNK_BYTES", 256)
+    entry = {"timestamp": NOW, "decision": "ARXIV", "trace": {}, "status": 200}
+    write_lines(store.log_path, [entry, "not json", json.dumps({**entry, "question": "x" * 1000}), entry])
+    assert store.refresh() == 2
+    stats = store.stats(NOW, NOW + 60)
+    assert stats["requests"] == 2
+    assert stats["log"]["skipped_lines"] == 2
+    assert stats["log"]["lag_bytes"] == 0
+
+
+def test_partial_line_waits_for_the_rest(store):
+    entry = json.dumps({"timestamp": NOW, "decision": "ARXIV", "trace": {}, "status": 200})
+    with open(store.log_path, "w", encoding="utf-8") as f:
+        f.write(entry[:20])
+    assert store.refresh() == 0
+    assert store.stats(NOW, NOW + 60)["log"]["lag_bytes"] == 20
+    with open(store.log_path, "a", encoding="utf-8") as f:
+        f.write(entry[20:] + "\n")
+    assert store.refresh() == 1
+
+
+def test_rotation_reads_new_file_from_start(store):
+    entry = {"timestamp": NOW, "decision": "WEB_SEARCH", "trace": {}, "status": 200}
+    write_lines(store.log_path, [entry] * 5)
+    store.refresh()
+    os.remove(store.log_path)
+    write_lines(store.log_path, [entry] * 2)
+    store.refresh()
+    assert store.stats(NOW, NOW + 60)["requests"] == 7
+
+
+def test_prune_keeps_running_totals(store, monkeypatch):
+    rng = random.Random(1)
+    entries = [make_entry(rng, NOW - rng.randint(0, 3 * 3600)) for _ in range(500)]
+    write_lines(store.log_path, entries)
+    store.refresh()
+    before = store.stats(NOW - 3600, NOW, step="hour")
+
+    # Move "now" so that the first two hours fall out of the minute retention
+    later = NOW + log_rollups.LOG_ROLLUP_MINUTE_RETENTION_HOURS * 3600 - 3600
+    monkeypatch.setattr(log_rollups.time, "time", lambda: later)
+    conn = store._connect()
+    try:
+        store._prune(conn)
+    finally:
+        conn.close()
+
+    assert store.stats(NOW - 3600, NOW, step="hour") == before
+    start = store.minute_cutoff()
+    assert without_log(store.stats(start, NOW + 60)) == without_log(brute_force(entries, start, NOW + 60))
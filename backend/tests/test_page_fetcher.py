@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+httpcore = pytest.importorskip("httpcore")
+
+from app.utils import page_fetcher  # noqa: E402
+from app.utils.page_fetcher import BlockedURL  # noqa: E402
+
+PUBLIC = "93.184.216.34"
+
+PAGE = (
+    b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nContent-Length: 71\r\n\r\n"
+    b"<html><body><p>" + b"Enough main text to count as a block here." + b"</p></body></html>"
+)
+REDIRECT = b"HTTP/1.1 302 Found\r\nLocation: /next\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+
+class RecordingStream(httpcore.AsyncMockStream):
+    def __init__(self, buffer, sent):
+        super().__init__(buffer)
+        self.sent = sent
+
+    async def write(self, buffer, timeout=None):
+        self.sent.append(buffer)
+
+
+class RecordingBackend(httpcore.AsyncNetworkBackend):
+    """Stands in for the network: records which address was dialled and what was sent"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.dialled = []
+        self.sent = []
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self.dialled.append(host)
+        return RecordingStream([self.responses.pop(0)], self.sent)
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+def rebinding_resolver(answers):
+    """Answers each lookup with the next address, then keeps repeating the last one"""
+    lookups = []
+
+    async def resolve(host, port):
+        lookups.append(host)
+        return [answers[min(len(lookups), len(answers)) - 1]]
+    return resolve, lookups
+
+
+def fetch(url, backend):
+    async def run():
+        client = page_fetcher._make_client(network_backend=backend)
+        try:
+            return await page_fetcher._fetch_one(url, client=client)
+        finally:
+            await client.aclose()
+    return asyncio.run(run())
+
+
+def test_dials_the_vetted_address_and_keeps_the_host_header(monkeypatch):
+    resolve, lookups = rebinding_resolver([PUBLIC, "127.0.0.1"])
+    monkeypatch.setattr(page_fetcher, "_resolve", resolve)
+    backend = RecordingBackend([PAGE])
+
+    text = fetch("http://rebind.example/page", backend)
+
+    assert "Enough main text" in text
+    assert lookups == ["rebind.example"]
+    assert backend.dialled == [PUBLIC]
+    assert b"Host: rebind.example" in b"".join(backend.sent)
+
+
+def test_rebinding_to_loopback_is_refused(monkeypatch):
+    # Public for the first connection, loopback for the one after the redirect
+    resolve, lookups = rebinding_resolver([PUBLIC, "127.0.0.1"])
+    monkeypatch.setattr(page_fetcher, "_resolve", resolve)
+    backend = RecordingBackend([REDIRECT, PAGE])
+
+    with pytest.raises(BlockedURL):
+        fetch("http://rebind.example/page", backend)
+
+    assert lookups == ["rebind.example", "rebind.example"]
+    assert backend.dialled == [PUBLIC]
+
+
+@pytest.mark.parametrize("address", ["127.0.0.1", "169.254.169.254", "10.0.0.5", "::1", "fd00::1"])
+def test_non_public_addresses_are_never_dialled(monkeypatch, address):
+    resolve, _ = rebinding_resolver([address])
+    monkeypatch.setattr(page_fetcher, "_resolve", resolve)
+    backend = RecordingBackend([PAGE])
+
+    with pytest.raises(BlockedURL):
+        fetch("http://internal.example/", backend)
+    assert backend.dialled == []
+
+
+def test_any_non_public_answer_blocks_the_host(monkeypatch):
+    async def resolve(host, port):
+        return [PUBLIC, "127.0.0.1"]
+    monkeypatch.setattr(page_fetcher, "_resolve", resolve)
+    backend = RecordingBackend([PAGE])
+
+    with pytest.raises(BlockedURL):
+        fetch("http://mixed.example/", backend)
+    assert backend.dialled == []
+
+
+def test_unsupported_schemes_are_refused():
+    with pytest.raises(BlockedURL):
+        fetch("ftp://files.example/x", RecordingBackend([]))
@@ -0,0 +1,188 @@
+import numpy as np
+import pytest
+
+from app.utils import pdf_index
+from app.utils.pdf_index import PdfIndex, merge_tail
+
+DIM = 8
+
+
+def vectors(seed, n):
+    return np.random.default_rng(seed).random((n, DIM), dtype=np.float32)
+
+
+def texts(doc_id, n):
+    return [f"{doc_id} chunk {i} about topic{i % 3}" for i in range(n)]
+
+
+def add(index, doc_id, n, seed=None):
+    vecs = vectors(seed if seed is not None else sum(map(ord, doc_id)), n)
+    index.add_document(doc_id, texts(doc_id, n), vecs)
+    return vecs
+
+
+def docs_of(snapshot, hits):
+    return {snapshot.metadata(row)["doc_id"] for row, _ in hits}
+
+
+def search_all(snapshot, query_vector, k=1000):
+    """Every live hit as (doc_id, chunk_id, text), nearest first"""
+    return [
+        (snapshot.metadata(row)["doc_id"], snapshot.metadata(row)["chunk_id"], snapshot.text(row))
+        for row, _ in snapshot.search_vectors(query_vector, k)
+    ]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = PdfIndex(str(tmp_path / "index"))
+    yield index
+    index.close()
+
+
+def test_old_snapshot_is_unchanged_while_the_writer_adds_and_deletes(index, monkeypatch):
+    # Never compact here: this is about tombstones and new segments
+    monkeypatch.setattr(pdf_index, "COMPACT_DELETED_RATIO", 1.0)
+    a = add(index, "a", 5)
+    add(index, "b", 4)
+    before = index.snapshot()
+    expected = search_all(before, a[0])
+
+    add(index, "c", 6)
+    index.delete_document("a")
+    add(index, "b", 3, seed=7)   # re-adding replaces b
+
+    assert before.ntotal == 9
+    assert before.has_doc("a") and not before.has_doc("c")
+    assert search_all(before, a[0]) == expected
+    assert docs_of(before, before.search_keywords("topic0", 100)) == {"a", "b"}
+
+    after = index.snapshot()
+    assert after.version > before.version
+    assert after.ntotal == 9
+    assert not after.has_doc("a")
+    assert docs_of(after, after.search_vectors(a[0], 100)) == {"b", "c"}
+    assert docs_of(after, after.search_keywords("a chunk", 100)) <= {"b", "c"}
+
+
+def test_snapshot_never_sees_rows_past_its_own_segments(index):
+    add(index, "a", 3)
+    before = index.snapshot()
+    add(index, "b", 3)
+    # The chunk store is shared and has grown; the snapshot still ends where it was published
+    assert before.n_rows == 3
+    assert len(index.chunks) == 6
+    assert all(row < 3 for row, _ in before.search_vectors(vectors(1, 1)[0], 10))
+    assert not before.is_live(4)
+
+
+def test_deleted_docs_stay_hidden_across_merges(index, monkeypatch):
+    monkeypatch.setattr(pdf_index, "COMPACT_DELETED_RATIO", 1.0)
+    for n in range(6):
+        add(index, f"doc{n}", 2 + n)
+        if n == 2:
+            index.delete_document("doc1")
+    snapshot = index.snapshot()
+    # The merge policy folded the doc1 segment into a bigger one
+    assert len(snapshot.segments) < 6
+    assert "doc1" not in docs_of(snapshot, snapshot.search_vectors(vectors(0, 1)[0], 1000))
+    assert "doc1" not in docs_of(snapshot, snapshot.search_keywords("doc1 chunk", 1000))
+    assert snapshot.search_vectors(vectors(0, 1)[0], 10, doc_id="doc1") == []
+
+
+def test_merge_tail_keeps_segments_contiguous(index, monkeypatch):
+    monkeypatch.setattr(pdf_index, "MAX_SEGMENTS", 3)
+    for n in range(10):
+        add(index, f"doc{n}", 1 + n % 4)
+    segments = index.snapshot().segments
+    assert len(segments) <= 3
+    assert segments[0].base == 0
+    assert all(left.stop == right.base for left, right in zip(segments, segments[1:]))
+    assert merge_tail(segments) == segments
+
+
+def test_compaction_keeps_results_and_old_snapshots(index):
+    docs = {name: add(index, name, 4 + i) for i, name in enumerate("abcdef")}
+    query = docs["c"][1]
+    index.delete_document("a")
+    old = index.snapshot()
+    old_results = search_all(old, query)
+    old_keywords = [(old.metadata(r)["doc_id"], old.text(r)) for r, _ in old.search_keywords("topic1 chunk", 50)]
+
+    index.compact()
+    new = index.snapshot()
+
+    assert new.deleted_count == 0
+    assert new.n_rows == old.ntotal
+    assert search_all(new, query) == old_results
+    assert [(new.metadata(r)["doc_id"], new.text(r)) for r, _ in new.search_keywords("topic1 chunk", 50)] == old_keywords
+    # A reader still holding the pre-compaction snapshot reads the old rows
+    assert search_all(old, query) == old_results
+
+
+def test_deleting_enough_compacts_automatically(index):
+    add(index, "a", 10)
+    add(index, "b", 10)
+    index.delete_document("a")
+    snapshot = index.snapshot()
+    assert snapshot.deleted_count == 0
+    assert snapshot.n_rows == 10
+    assert docs_of(snapshot, snapshot.search_vectors(vectors(0, 1)[0], 100)) == {"b"}
+
+
+def test_save_and_load_after_restart(tmp_path):
+    directory = str(tmp_path / "index")
+    assert not PdfIndex.exists(directory)
+
+    index = PdfIndex(directory)
+    docs = {name: add(index, name, 3 + i) for i, name in enumerate("abcde")}
+    index.delete_document("b")
+    index.compact()
+    add(index, "f", 4)
+    index.delete_document("d")
+    index.save()
+    query = docs["c"][0]
+    expected_vectors = search_all(index.snapshot(), query)
+    expected_keywords = index.search_keywords("topic2", 100)
+    index.close()
+
+    assert PdfIndex.exists(directory)
+    loaded = PdfIndex.load(directory)
+    try:
+        snapshot = loaded.snapshot()
+        assert snapshot.ntotal == index.ntotal
+        assert not snapshot.has_doc("b") and not snapshot.has_doc("d")
+        assert search_all(snapshot, query) == expected_vectors
+        assert loaded.search_keywords("topic2", 100) == expected_keywords
+        rows = list(snapshot.rows_for_doc("c"))
+        np.testing.assert_array_equal(loaded.get_vectors(rows), docs["c"])
+
+        # Writable after loading, and a second restart sees the new doc
+        add(loaded, "g", 2)
+        loaded.save()
+    finally:
+        loaded.close()
+    reloaded = PdfIndex.load(directory)
+    try:
+        assert reloaded.has_doc("g")
+        assert reloaded.text(next(iter(reloaded.snapshot().rows_for_doc("g")))) == "g chunk 0 about topic0"
+    finally:
+        reloaded.close()
+
+
+def test_unsaved_rows_are_dropped_on_load(tmp_path):
+    directory = str(tmp_path / "index")
+    index = PdfIndex(directory)
+    add(index, "a", 3)
+    index.save()
+    add(index, "b", 3)   # written to the blob, never saved
+    index.close()
+
+    loaded = PdfIndex.load(directory)
+    try:
+        assert loaded.ntotal == 3
+        assert not loaded.has_doc("b")
+        add(loaded, "c", 2)
+        assert loaded.text(next(iter(loaded.snapshot().rows_for_doc("c")))) == "c chunk 0 about topic0"
+    finally:
+        loaded.close()
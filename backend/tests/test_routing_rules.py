@@ -0,0 +1,173 @@
+import json
+import os
+import random
+import re
+
+import pytest
+
+from app.utils.routing_rules import AGENTS, KeywordAutomaton, RuleEngine, RuleSet, normalize
+
+
+def ruleset(*rules):
+    return RuleSet({"rules": list(rules)})
+
+
+def name(rule):
+    return rule.name if rule else None
+
+
+@pytest.mark.parametrize("boundary, text, matches", [
+    ("word", "find papers on arxiv", True),
+    ("word", "arxiv: 2401.00001", True),
+    ("word", "arxivist papers", False),
+    ("word", "myarxiv papers", False),
+    ("prefix", "arxivist papers", True),
+    ("prefix", "myarxiv papers", False),
+    ("none", "myarxivist papers", True),
+    ("none", "arx iv", False),
+])
+def test_boundaries(boundary, text, matches):
+    rules = ruleset({"name": "arxiv", "agent": "ARXIV", "keywords": ["arXiv"], "boundary": boundary})
+    assert (rules.match(normalize(text), {}) is not None) == matches
+
+
+def test_multi_word_keywords_ignore_case_and_spacing():
+    rules = ruleset({"name": "news", "agent": "WEB_SEARCH", "keywords": ["Latest  News"]})
+    assert name(rules.match(normalize("what is the LATEST\tnews today"), {})) == "news"
+    assert rules.match(normalize("latest newsletter"), {}) is None
+
+
+def test_priority_then_file_order():
+    rules = ruleset(
+        {"name": "low", "agent": "WEB_SEARCH", "priority": 1, "keywords": ["paper"]},
+        {"name": "high", "agent": "ARXIV", "priority": 10, "keywords": ["paper"]},
+        {"name": "high_later", "agent": "PDF_RAG", "priority": 10, "keywords": ["paper"]},
+    )
+    assert [r.name for r in rules.rules] == ["high", "high_later", "low"]
+    assert name(rules.match("a paper", {})) == "high"
+
+
+def test_lower_priority_hit_wins_when_higher_does_not_match():
+    rules = ruleset(
+        {"name": "pdf", "agent": "PDF_RAG", "priority": 10, "keywords": ["my document"]},
+        {"name": "web", "agent": "WEB_SEARCH", "priority": 1, "keywords": ["weather"]},
+    )
+    assert name(rules.match("weather in paris", {})) == "web"
+    assert name(rules.match("weather in my document", {})) == "pdf"
+
+
+def test_when_conditions():
+    rules = ruleset(
+        {"name": "pdf", "agent": "PDF_RAG", "priority": 10, "keywords": ["summarize"], "when": {"has_pdf": True}},
+        {"name": "web", "agent": "WEB_SEARCH", "keywords": ["summarize"]},
+    )
+    assert name(rules.match("summarize this", {"has_pdf": True})) == "pdf"
+    assert name(rules.match("summarize this", {"has_pdf": False})) == "web"
+    assert name(rules.match("summarize this", {})) == "web"
+
+
+def test_patterns_and_catch_all():
+    rules = ruleset(
+        {"name": "arxiv_id", "agent": "ARXIV", "priority": 5, "patterns": [r"\b\d{4}\.\d{4,5}\b"]},
+        {"name": "default", "agent": "WEB_SEARCH", "priority": -1},
+    )
+    assert name(rules.match("explain 2401.12345", {})) == "arxiv_id"
+    assert name(rules.match("hello", {})) == "default"
+
+
+@pytest.mark.parametrize("spec", [
+    {},
+    {"rules": [{"name": "x", "agent": "NOPE", "keywords": ["a"]}]},
+    {"rules": [{"name": "x", "agent": "ARXIV", "keywords": ["a"], "boundary": "sentence"}]},
+    {"rules": [{"name": "x", "agent": "ARXIV", "keywords": ["a"], "typo": 1}]},
+    {"rules": [{"name": "x", "agent": "ARXIV", "patterns": ["("]}]},
+    {"rules": [{"name": "x", "agent": "ARXIV"}, {"name": "x", "agent": "PDF_RAG"}]},
+])
+def test_invalid_specs_are_rejected(spec):
+    with pytest.raises(ValueError):
+        RuleSet(spec)
+
+
+def write_rules(path, spec, mtime_ns):
+    path.write_text(spec if isinstance(spec, str) else json.dumps(spec), encoding="utf-8")
+    # Explicit mtimes: two writes within the filesystem's timestamp granularity look unchanged
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_reload_swaps_rules_and_keeps_them_when_the_file_breaks(tmp_path):
+    path = tmp_path / "rules.json"
+    write_rules(path, {"rules": [{"name": "v1", "agent": "ARXIV", "keywords": ["paper"]}]}, 1_000_000_000)
+    engine = RuleEngine(path=str(path), check_interval=0)
+    assert engine.match("a Paper").name == "v1"
+
+    write_rules(path, {"rules": [{"name": "v2", "agent": "WEB_SEARCH", "keywords": ["paper"]}]}, 2_000_000_000)
+    assert engine.match("a paper").name == "v2"
+    assert engine.reloads == 1
+
+    write_rules(path, "{not json", 3_000_000_000)
+    assert engine.match("a paper").name == "v2"
+    assert engine.last_error
+
+    write_rules(path, "[]", 3_500_000_000)
+    assert engine.match("a paper").name == "v2"
+
+    write_rules(path, {"rules": [{"name": "v3", "agent": "PDF_RAG", "keywords": ["paper"], "typo": 1}]}, 4_000_000_000)
+    assert engine.match("a paper").name == "v2"
+
+    path.unlink()
+    assert engine.match("a paper").name == "v2"
+
+    write_rules(path, {"rules": [{"name": "v4", "agent": "PDF_RAG", "keywords": ["paper"]}]}, 5_000_000_000)
+    assert engine.match("a paper").name == "v4"
+    assert engine.last_error is None
+    stats = engine.stats()
+    assert stats["hits"]["v4"]["hits"] == 1
+    assert engine.match("nothing here") is None
+    assert engine.stats()["no_rule_matched"] == 1
+
+
+def test_first_load_of_a_broken_file_raises(tmp_path):
+    path = tmp_path / "rules.json"
+    write_rules(path, "[]", 1_000_000_000)
+    with pytest.raises(ValueError):
+        RuleEngine(path=str(path))
+
+
+def regex_payloads(keywords, text):
+    """Reference: one regex per keyword with the same boundary semantics"""
+    found = set()
+    for keyword, payload, boundary in keywords:
+        pattern = re.escape(keyword)
+        if boundary != "none":
+            pattern = r"(?<!\w)" + pattern
+        if boundary == "word":
+            pattern += r"(?!\w)"
+        if re.search(pattern, text):
+            found.add(payload)
+    return found
+
+
+def test_automaton_matches_regex_brute_force():
+    rng = random.Random(0)
+    # Small alphabet: lots of overlapping keywords, shared prefixes and suffixes
+    alphabet = "ab c_"
+
+    def text(n):
+        return "".join(rng.choice(alphabet) for _ in range(n)).strip()
+
+    for _ in range(200):
+        keywords = []
+        for payload in range(rng.randint(1, 12)):
+            keyword = normalize(text(rng.randint(1, 5)))
+            if keyword:
+                keywords.append((keyword, payload, rng.choice(["word", "prefix", "none"])))
+        automaton = KeywordAutomaton(keywords)
+        for _ in range(20):
+            query = normalize(text(rng.randint(0, 30)))
+            assert automaton.payloads(query) == regex_payloads(keywords, query), (keywords, query)
+
+
+def test_shipped_rules_load():
+    rules = RuleEngine().ruleset
+    assert rules.rules
+    assert {rule.agent for rule in rules.rules} <= set(AGENTS)
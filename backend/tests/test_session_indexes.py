@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+
+from app.utils.session_indexes import SessionIndexManager, session_has_index
+
+
+def add(index, doc_id, n=3):
+    index.add_document(doc_id, [f"{doc_id} {i}" for i in range(n)], np.ones((n, 4), dtype=np.float32))
+    index.save()
+
+
+def test_saved_session_has_documents_before_anything_loads(tmp_path):
+    root = str(tmp_path)
+    assert not session_has_index("s1", root_dir=root)
+
+    writer = SessionIndexManager(root, memory_budget_bytes=1 << 30)
+    with writer.use("s1", create=True) as index:
+        add(index, "a")
+
+    # After a restart: nothing resident, but the index is on disk
+    restarted = SessionIndexManager(root, memory_budget_bytes=1 << 30)
+    assert session_has_index("s1", root_dir=root)
+    assert restarted.has_documents("s1")
+    assert not restarted.has_documents("s2")
+    assert restarted.stats()["loads"] == 0
+    assert restarted.stats()["resident_sessions"] == 0
+
+
+def test_evicted_sessions_reload_from_disk(tmp_path):
+    manager = SessionIndexManager(str(tmp_path), memory_budget_bytes=1)
+    for session in ("s1", "s2"):
+        with manager.use(session, create=True) as index:
+            add(index, f"{session}_doc")
+    # A one-byte budget keeps at most the pinned session resident
+    assert manager.stats()["resident_sessions"] == 0
+    assert manager.evictions == 2
+
+    with manager.use("s1") as index:
+        assert index.has_doc("s1_doc")
+        assert index.text(0) == "s1_doc 0"
+    assert manager.loads == 1
+    with manager.use("missing") as index:
+        assert index is None
+    assert not os.path.exists(os.path.join(str(tmp_path), "missing"))
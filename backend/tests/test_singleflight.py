@@ -0,0 +1,178 @@
+import asyncio
+import gc
+
+import pytest
+
+from app.utils.singleflight import SingleFlight, normalize_text
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Work:
+    """Coroutine function that counts runs and finishes when released"""
+
+    def __init__(self, result="done", error=None):
+        self.result = result
+        self.error = error
+        self.runs = 0
+        self.release = None
+
+    async def __call__(self):
+        self.runs += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return f"{self.result}#{self.runs}"
+
+
+async def settle():
+    """Let every ready task run up to its next await"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_normalize_text():
+    assert normalize_text("  What IS\n a   transformer? ") == "what is a transformer?"
+    assert normalize_text(None) == ""
+
+
+def test_concurrent_callers_share_one_execution():
+    async def main():
+        flight, work = SingleFlight(), Work()
+        work.release = asyncio.Event()
+        callers = [asyncio.ensure_future(flight.do("k", work)) for _ in range(4)]
+        await settle()
+        assert flight.waiters("k") == 4
+        assert len(flight) == 1
+        work.release.set()
+        results = await asyncio.gather(*callers)
+        assert work.runs == 1
+        assert results == [("done#1", False)] + [("done#1", True)] * 3
+        assert len(flight) == 0 and flight.waiters("k") == 0
+
+        # Finished executions are not reused
+        assert await flight.do("k", work) == ("done#2", False)
+    run(main())
+
+
+def test_unjoinable_execution_starts_a_fresh_one():
+    async def main():
+        flight, work = SingleFlight(), Work()
+        work.release = asyncio.Event()
+        first_ctx, second_ctx = object(), object()
+        first = asyncio.ensure_future(flight.do("k", work, context=first_ctx))
+        await settle()
+
+        second = asyncio.ensure_future(
+            flight.do("k", work, context=second_ctx, joinable=lambda ctx: ctx is not first_ctx)
+        )
+        await settle()
+        assert work.runs == 2
+        assert flight.waiters_on(first_ctx) == 1
+        assert flight.waiters_on(second_ctx) == 1
+
+        # Later callers see the newer execution
+        third = asyncio.ensure_future(flight.do("k", work, joinable=lambda ctx: True))
+        await settle()
+        assert flight.waiters_on(second_ctx) == 2
+        assert flight.waiters("k") == 2
+
+        work.release.set()
+        assert (await first)[1] is False
+        assert (await second)[1] is False
+        assert (await third)[1] is True
+        assert (await second)[0] == (await third)[0]
+        assert len(flight) == 0
+    run(main())
+
+
+def test_older_execution_finishing_keeps_the_newer_one_current():
+    async def main():
+        flight = SingleFlight()
+        slow, fast = Work("slow"), Work("fast")
+        slow.release, fast.release = asyncio.Event(), asyncio.Event()
+        old_ctx = object()
+        first = asyncio.ensure_future(flight.do("k", fast, context=old_ctx))
+        await settle()
+        second = asyncio.ensure_future(flight.do("k", slow, joinable=lambda ctx: ctx is not old_ctx))
+        await settle()
+
+        fast.release.set()
+        await first
+        # The older execution's cleanup must not drop the newer one
+        assert len(flight) == 1
+        joined = asyncio.ensure_future(flight.do("k", Work()))
+        await settle()
+        slow.release.set()
+        assert await joined == ("slow#1", True)
+        await second
+    run(main())
+
+
+def test_waiter_timeout_leaves_the_execution_running():
+    async def main():
+        flight, work = SingleFlight(), Work()
+        work.release = asyncio.Event()
+        starter = asyncio.ensure_future(flight.do("k", work))
+        await settle()
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.do("k", work, timeout=0.01)
+        assert flight.waiters("k") == 1
+        assert len(flight) == 1
+
+        work.release.set()
+        assert await starter == ("done#1", False)
+        assert work.runs == 1
+    run(main())
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def main():
+        flight, work = SingleFlight(), Work()
+        work.release = asyncio.Event()
+        starter = asyncio.ensure_future(flight.do("k", work))
+        joiner = asyncio.ensure_future(flight.do("k", work))
+        await settle()
+
+        starter.cancel()
+        await settle()
+        assert starter.cancelled()
+        assert flight.waiters("k") == 1
+
+        work.release.set()
+        assert await joiner == ("done#1", True)
+    run(main())
+
+
+def test_exception_reaches_every_waiter():
+    async def main():
+        flight, work = SingleFlight(), Work(error=RuntimeError("upstream down"))
+        work.release = asyncio.Event()
+        callers = [asyncio.ensure_future(flight.do("k", work)) for _ in range(3)]
+        await settle()
+        work.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) and str(r) == "upstream down" for r in results)
+        assert work.runs == 1
+        assert len(flight) == 0
+    run(main())
+
+
+def test_failure_with_no_one_waiting_is_not_reported_as_unretrieved():
+    async def main():
+        loop = asyncio.get_running_loop()
+        unhandled = []
+        loop.set_exception_handler(lambda loop, context: unhandled.append(context))
+
+        flight, work = SingleFlight(), Work(error=ValueError("nobody listening"))
+        work.release = asyncio.Event()
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.do("k", work, timeout=0.01)
+        work.release.set()
+        await settle()
+        assert len(flight) == 0
+        gc.collect()
+        assert unhandled == []
+    run(main())
@@ -4,14 +4,29 @@ import axios from 'axios'
 // const API_BASE_URL = 'http://localhost:8000'|| 'http://127.0.0.1:8000/'
 const API_BASE_URL = 'http://localhost:8000'|| 'http://127.0.0.1:8000/'||'https://multi-agent-backend-n3bp.onrender.com/'
 
+const REQUEST_TIMEOUT_MS = 60000
+// /ask budget sent to the backend: it answers (or gives up with a 504)
+// before axios does, instead of working on after the client has gone
+const ASK_DEADLINE_MS = REQUEST_TIMEOUT_MS - 5000
+
 const api = axios.create({
   baseURL: API_BASE_URL,
-  timeout: 60000,
+  timeout: REQUEST_TIMEOUT_MS,
   headers: {
     'Content-Type': 'application/json',
   },
 })
 
+// Per-browser session id: the backend keeps a separate PDF index per session
+const getSessionId = () => {
+  let id = localStorage.getItem('session_id')
+  if (!id) {
+    id = crypto.randomUUID()
+    localStorage.setItem('session_id', id)
+  }
+  return id
+}
+
 // Normalize errors so UI shows useful messages
 const getApiErrorMessage = (error) => {
   if (error.response?.data?.detail) {
@@ -40,22 +55,46 @@ api.interceptors.response.use(
 // Backend expects "text", not "query"
 export const submitQuery = async (query) => {
   console.log('Sending query:', query)
-  const response = await api.post('/ask', { text: query })
+  const response = await api.post('/ask', { text: query, session_id: getSessionId() }, {
+    headers: { 'X-Request-Timeout-Ms': String(ASK_DEADLINE_MS) },
+  })
   return response.data
 }
 
 export const uploadPDF = async (file) => {
   const formData = new FormData()
   formData.append('file', file)
+  formData.append('session_id', getSessionId())
   const response = await api.post('/upload', formData, {
     headers: { 'Content-Type': 'multipart/form-data' },
   })
   return response.data
 }
 
+// Push channel for ingestion progress (replaces polling /upload/status).
+// onEvent receives {doc_id, state, stage, chunks_done, chunks_total, ...};
+// returns a function that closes the stream.
+export const watchUploads = (docIds, onEvent, onDone) => {
+  const ids = Array.isArray(docIds) ? docIds.join(',') : docIds
+  const source = new EventSource(`${API_BASE_URL}/upload/events?doc_ids=${encodeURIComponent(ids)}`)
+  source.addEventListener('progress', (e) => onEvent(JSON.parse(e.data)))
+  source.addEventListener('done', () => {
+    source.close()
+    if (onDone) onDone()
+  })
+  return () => source.close()
+}
+
 export const healthCheck = async () => {
   const response = await api.get('/health')
   return response.data
 }
 
+// Agent mix, error/fallback rates and latency percentiles (server-side rollups);
+// pass step: 'minute' | 'hour' for a time series
+export const getStats = async ({ hours = 24, step } = {}) => {
+  const response = await api.get('/logs/stats', { params: { hours, step } })
+  return response.data
+}
+
 export default api